@@ -0,0 +1,57 @@
+"""
+Compares the pickle and binary wire formats on frame and prediction messages.
+
+Usage:
+    python -m benchmarks.message_wire_format --iterations 1000
+"""
+import argparse
+import timeit
+import numpy as np
+import torch
+from pipert.core.message import Message, message_encode, message_decode, WIRE_FORMATS
+from pipert.utils.structures import Instances, Boxes
+
+
+def create_frame_message(width, height):
+    frame = np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)
+    return Message(frame, "camera:0")
+
+
+def create_prediction_message(width, height, count):
+    instances = Instances((height, width))
+    boxes = torch.rand(count, 4) * min(width, height)
+    boxes[:, 2:] += boxes[:, :2]
+    instances.set("pred_boxes", Boxes(boxes))
+    instances.set("scores", torch.rand(count))
+    instances.set("class_scores", torch.rand(count, 1))
+    instances.set("pred_classes", torch.randint(0, 80, (count,)).int())
+    return Message(instances, "camera:0")
+
+
+def bench(name, create_msg, wire_format, iterations):
+    msg = create_msg()
+    # the payload is only encoded once, the rounds measure serialization
+    encoded_msg = message_encode(msg, wire_format=wire_format)
+    encode_time = timeit.timeit(lambda: WIRE_FORMATS[wire_format].dumps(msg),
+                                number=iterations) / iterations
+    decode_time = timeit.timeit(lambda: message_decode(encoded_msg, lazy=True),
+                                number=iterations) / iterations
+    print(f"{name:<12}{wire_format:<8}{len(encoded_msg):>10} B"
+          f"{encode_time * 1e6:>12.1f} us{decode_time * 1e6:>12.1f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', help='Iterations per measurement', type=int, default=1000)
+    parser.add_argument('--width', help='Frame width', type=int, default=1920)
+    parser.add_argument('--height', help='Frame height', type=int, default=1080)
+    parser.add_argument('--instances', help='Number of predicted instances', type=int, default=50)
+    opts = parser.parse_args()
+
+    print(f"{'message':<12}{'format':<8}{'size':>12}{'encode':>15}{'decode':>15}")
+    for wire_format in ("pickle", "binary"):
+        bench("frame", lambda: create_frame_message(opts.width, opts.height),
+              wire_format, opts.iterations)
+    for wire_format in ("pickle", "binary"):
+        bench("prediction", lambda: create_prediction_message(opts.width, opts.height, opts.instances),
+              wire_format, opts.iterations)
@@ -0,0 +1,40 @@
+"""
+Compares non_max_suppression with the per class, box by box implementation
+it replaced, on crowded scenes, and checks that their outputs are identical.
+
+Usage:
+    python -m benchmarks.nms --objects 200 --iterations 20
+"""
+import argparse
+import timeit
+import torch
+from pipert.contrib.detection_demo.utils import non_max_suppression
+from tests.pipert.contrib.reference_nms import NMS_STYLES, create_prediction, outputs_equal, \
+    reference_non_max_suppression
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', help='Iterations per measurement', type=int, default=20)
+    parser.add_argument('--batch-size', help='Images per prediction', type=int, default=1)
+    parser.add_argument('--objects', help='Objects per image', type=int, default=200)
+    parser.add_argument('--boxes-per-object', help='Detections of every object', type=int, default=10)
+    parser.add_argument('--classes', help='Number of classes', type=int, default=80)
+    parser.add_argument('--conf-thres', type=float, default=0.3, help='object confidence threshold')
+    parser.add_argument('--nms-thres', type=float, default=0.5, help='iou threshold for non-maximum suppression')
+    opts = parser.parse_args()
+
+    prediction = create_prediction(opts.batch_size, opts.objects, opts.boxes_per_object, opts.classes)
+    print(f"{'style':<8}{'reference':>15}{'vectorized':>15}{'speedup':>10}{'identical':>12}")
+    for nms_style in NMS_STYLES:
+        # both functions modify the prediction in place
+        reference = reference_non_max_suppression(prediction.clone(), opts.conf_thres, opts.nms_thres, nms_style)
+        output = non_max_suppression(prediction.clone(), opts.conf_thres, opts.nms_thres, nms_style)
+        reference_time = timeit.timeit(
+            lambda: reference_non_max_suppression(prediction.clone(), opts.conf_thres, opts.nms_thres, nms_style),
+            number=opts.iterations) / opts.iterations
+        vectorized_time = timeit.timeit(
+            lambda: non_max_suppression(prediction.clone(), opts.conf_thres, opts.nms_thres, nms_style),
+            number=opts.iterations) / opts.iterations
+        print(f"{nms_style:<8}{reference_time * 1e3:>12.2f} ms{vectorized_time * 1e3:>12.2f} ms"
+              f"{reference_time / vectorized_time:>9.1f}x{str(outputs_equal(output, reference)):>12}")
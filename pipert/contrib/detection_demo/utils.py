@@ -12,6 +12,8 @@ import torch
 import torch.nn as nn
 from tqdm import tqdm
 
+from pipert.utils.structures.boxes import Boxes, matched_boxlist_iou
+
 # from . import torch_utils  # , google_utils
 
 matplotlib.rc('font', **{'size': 11})
@@ -435,10 +437,15 @@ def build_targets(model, targets):
     return tcls, tbox, indices, av
 
 
-def non_max_suppression(prediction, conf_thres=0.5, nms_thres=0.5):
+def non_max_suppression(prediction, conf_thres=0.5, nms_thres=0.5, nms_style='MERGE', max_per_class=100):
     """
     Removes detections with lower object confidence score than 'conf_thres'
     Non-Maximum Suppression to further filter detections.
+    nms_style is 'OR', 'AND', 'MERGE' (weighted mixture boxes) or 'SOFT'
+    (soft-NMS), and only the max_per_class most confident detections of
+    every class go through NMS (None keeps all of them).
+    The IoUs of the detections of an image are computed at once, so
+    only the greedy selection of the boxes loops.
     Returns detections with shape:
         (x1, y1, x2, y2, object_conf, class_conf, class)
     """
@@ -447,19 +454,6 @@ def non_max_suppression(prediction, conf_thres=0.5, nms_thres=0.5):
 
     output = [None] * len(prediction)
     for image_i, pred in enumerate(prediction):
-        # Experiment: Prior class size rejection
-        # x, y, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
-        # a = w * h  # area
-        # ar = w / (h + 1e-16)  # aspect ratio
-        # n = len(w)
-        # log_w, log_h, log_a, log_ar = torch.log(w), torch.log(h), torch.log(a), torch.log(ar)
-        # shape_likelihood = np.zeros((n, 60), dtype=np.float32)
-        # x = np.concatenate((log_w.reshape(-1, 1), log_h.reshape(-1, 1)), 1)
-        # from scipy.stats import multivariate_normal
-        # for c in range(60):
-        # shape_likelihood[:, c] =
-        #   multivariate_normal.pdf(x, mean=mat['class_mu'][c, :2], cov=mat['class_cov'][c, :2, :2])
-
         # Multiply conf by class conf to get combined confidence
         class_conf, class_pred = pred[:, 5:].max(1)
         pred[:, 4] *= class_conf
@@ -477,80 +471,94 @@ def non_max_suppression(prediction, conf_thres=0.5, nms_thres=0.5):
 
         # Box (center x, center y, width, height) to (x1, y1, x2, y2)
         pred[:, :4] = xywh2xyxy(pred[:, :4])
-        # pred[:, 4] *= class_conf  # improves mAP from 0.549 to 0.551
 
         # Detections ordered as (x1y1x2y2, obj_conf, class_conf, class_pred)
         pred = torch.cat((pred, class_pred), 1)
 
         # Get detections sorted by decreasing confidence scores
         pred = pred[(-pred[:, 4]).argsort()]
-
-        det_max = []
-        nms_style = 'MERGE'  # 'OR' (default), 'AND', 'MERGE' (experimental)
-        for c in pred[:, -1].unique():
-            dc = pred[pred[:, -1] == c]  # select class c
-            n = len(dc)
-            if n == 1:
-                det_max.append(dc)  # No NMS required if only 1 prediction
-                continue
-            elif n > 100:
-                dc = dc[:100]  # limit to first 100 boxes: https://github.com/ultralytics/yolov3/issues/117
-
-            # Non-maximum suppression
-            if nms_style == 'OR':  # default
-                # METHOD1
-                # ind = list(range(len(dc)))
-                # while len(ind):
-                # j = ind[0]
-                # det_max.append(dc[j:j + 1])  # save highest conf detection
-                # reject = (bbox_iou(dc[j], dc[ind]) > nms_thres).nonzero()
-                # [ind.pop(i) for i in reversed(reject)]
-
-                # METHOD2
-                while dc.shape[0]:
-                    det_max.append(dc[:1])  # save highest conf detection
-                    if len(dc) == 1:  # Stop if we're at the last detection
-                        break
-                    iou = bbox_iou(dc[0], dc[1:])  # iou with other boxes
-                    dc = dc[1:][iou < nms_thres]  # remove ious > threshold
-
-            elif nms_style == 'AND':  # requires overlap, single boxes erased
-                while len(dc) > 1:
-                    iou = bbox_iou(dc[0], dc[1:])  # iou with other boxes
-                    if iou.max() > 0.5:
-                        det_max.append(dc[:1])
-                    dc = dc[1:][iou < nms_thres]  # remove ious > threshold
-
-            elif nms_style == 'MERGE':  # weighted mixture box
-                while len(dc):
-                    if len(dc) == 1:
-                        det_max.append(dc)
-                        break
-                    i = bbox_iou(dc[0], dc) > nms_thres  # iou with other boxes
-                    weights = dc[i, 4:5]
-                    dc[0, :4] = (weights * dc[i, :4]).sum(0) / weights.sum()
-                    det_max.append(dc[:1])
-                    dc = dc[i == 0]
-
-            elif nms_style == 'SOFT':  # soft-NMS https://arxiv.org/abs/1704.04503
-                sigma = 0.5  # soft-nms sigma parameter
-                while len(dc):
-                    if len(dc) == 1:
-                        det_max.append(dc)
-                        break
-                    det_max.append(dc[:1])
-                    iou = bbox_iou(dc[0], dc[1:])  # iou with other boxes
-                    dc = dc[1:]
-                    dc[:, 4] *= torch.exp(-iou ** 2 / sigma)  # decay confidences
-                    # dc = dc[dc[:, 4] > nms_thres]  # new line per https://github.com/ultralytics/yolov3/issues/362
-
-        if len(det_max):
-            det_max = torch.cat(det_max)  # concatenate
+        if max_per_class is not None:
+            # https://github.com/ultralytics/yolov3/issues/117
+            pred = pred[_rank_in_class(pred[:, -1]) < max_per_class]
+
+        keep = _greedy_nms(pred, nms_thres, nms_style)
+        if len(keep):
+            # grouped by class like the detections of the per class NMS, so
+            # detections with the same confidence are sorted the same way
+            keep = keep[torch.sort(pred[keep, -1], stable=True)[1]]
+            det_max = pred[keep]
             output[image_i] = det_max[(-det_max[:, 4]).argsort()]  # sort
 
     return output
 
 
+def _rank_in_class(classes):
+    # the position of every detection among the detections of its class
+    sorted_classes, order = torch.sort(classes, stable=True)
+    _, counts = torch.unique_consecutive(sorted_classes, return_counts=True)
+    starts = torch.cumsum(counts, 0) - counts
+    ranks = torch.empty_like(order)
+    ranks[order] = torch.arange(len(classes), device=classes.device) - starts.repeat_interleave(counts)
+    return ranks
+
+
+def _greedy_nms(pred, nms_thres, nms_style):
+    """
+    Selects the detections to keep out of detections that are sorted by
+    decreasing confidence, updating the boxes (MERGE) or the confidences
+    (SOFT) of pred in place. Detections of different classes never
+    suppress each other.
+    Returns the indices of the kept detections.
+    """
+    # the IoUs of the pairs of detections of the same class, the other
+    # pairs are left 0 instead of computing all N x N IoUs
+    same_class = pred[:, -1:] == pred[:, -1]
+    rows, cols = same_class.nonzero(as_tuple=True)
+    iou = torch.zeros(same_class.shape, dtype=pred.dtype, device=pred.device)
+    iou[rows, cols] = matched_boxlist_iou(Boxes(pred[rows, :4]), Boxes(pred[cols, :4]))
+    same_class = same_class.cpu().numpy()
+    keep = []
+
+    if nms_style == 'SOFT':  # soft-NMS https://arxiv.org/abs/1704.04503
+        sigma = 0.5  # soft-nms sigma parameter
+        for j in range(len(pred) - 1):
+            later = torch.from_numpy(np.flatnonzero(same_class[j, j + 1:]) + j + 1).to(pred.device)
+            pred[later, 4] *= torch.exp(-iou[j, later] ** 2 / sigma)  # decay confidences
+        return torch.arange(len(pred), device=pred.device)
+
+    iou = iou.cpu().numpy()
+    if nms_style == 'MERGE':  # weighted mixture box
+        overlaps = same_class & (iou > nms_thres)
+    else:
+        overlaps = same_class & ~(iou < nms_thres)
+    # the detections that were kept or suppressed by a kept detection
+    done = np.zeros(len(pred), dtype=bool)
+    for j in range(len(pred)):
+        if done[j]:
+            continue
+        done[j] = True
+        if nms_style == 'OR':  # default
+            keep.append(j)
+        elif nms_style == 'AND':  # requires overlap, single boxes erased
+            class_others = same_class[j] & ~done
+            if same_class[j].sum() == 1:
+                keep.append(j)  # No NMS required if only 1 prediction of the class
+            elif class_others.any() and iou[j, class_others].max() > 0.5:
+                keep.append(j)
+        elif nms_style == 'MERGE':
+            merged = overlaps[j] & ~done
+            if (same_class[j] & ~done).any():
+                merged[j] = True  # the detection itself was marked as done
+                i = torch.from_numpy(np.flatnonzero(merged)).to(pred.device)
+                weights = pred[i, 4:5]
+                pred[j, :4] = (weights * pred[i, :4]).sum(0) / weights.sum()
+            keep.append(j)
+        else:
+            raise ValueError(f"Unrecognized NMS style {nms_style}")
+        done |= overlaps[j]
+    return torch.tensor(keep, dtype=torch.long, device=pred.device)
+
+
 def get_yolo_layers(model):
     bool_vec = [x['type'] == 'yolo' for x in model.module_defs]
     return [i for i, x in enumerate(bool_vec) if x]  # [82, 94, 106] for yolov3
@@ -0,0 +1,227 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import cv2
+from imutils import resize
+from pipert import BaseComponent, Routine
+from pipert.core.message import Message, get_frame_codec
+from pipert.core.metrics_collector import NullCollector
+from pipert.core.mini_logics import MultiKeyMessage2Redis
+from pipert.core.routine import RoutineTypes
+from pipert.core.utlis import RingQueue, put_dropping_oldest
+from pipert.utils.frame_grabber import FrameGrabber
+
+
+class CaptureSource:
+    """
+    A video source of MultiListen2Stream and the stream its frames are sent
+    to.
+    """
+
+    def __init__(self, stream_address, out_key, fps):
+        self.stream_address = stream_address
+        self.out_key = out_key
+        self.fps = fps
+        self.grabber = FrameGrabber(stream_address, pace=str(stream_address).endswith("mp4"), fps=fps)
+        self.started = None
+        self.next_frame_time = 0
+        self.busy = False
+
+
+class MultiListen2Stream(Routine):
+    """
+    Captures many video sources in a single routine. Every source has a
+    FrameGrabber, and its frames are resized and put in the output queue by
+    a pool of worker threads that is shared by all the sources, together
+    with the stream key of their source. Every source is paced to its own
+    fps.
+
+    Sources can be added, replaced and removed while the routine runs, the
+    changes are applied by the routine's thread.
+    """
+    routine_type = RoutineTypes.INPUT
+    # how long to sleep when no source had a frame
+    IDLE_INTERVAL = 0.005
+
+    def __init__(self, queue, fps=30., workers=4, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.q = queue
+        self.fps = fps
+        self.workers = workers
+        self.sources = {}
+        self.updated_configs = deque()
+        self.executor = None
+
+    def add_source(self, stream_address, out_key, fps=None):
+        """
+        Adds a source whose frames are sent to out_key, replacing the
+        source that was sent there before.
+        """
+        self.updated_configs.append((out_key, stream_address, fps or self.fps))
+
+    def remove_source(self, out_key):
+        self.updated_configs.append((out_key, None, None))
+
+    def change_sources(self):
+        while self.updated_configs:
+            out_key, stream_address, fps = self.updated_configs.popleft()
+            source = self.sources.pop(out_key, None)
+            if source is not None:
+                self.logger.info("Stopping video capture on %s", source.stream_address)
+                self.executor.submit(source.grabber.stop)
+            if stream_address is not None:
+                source = CaptureSource(stream_address, out_key, fps)
+                self.sources[out_key] = source
+                self._start_source(source)
+
+    def _start_source(self, source):
+        self.logger.info("Starting video capture on %s", source.stream_address)
+        # opening a stream can take a while, so it doesn't hold the others
+        source.started = self.executor.submit(source.grabber.start)
+
+    def main_logic(self, *args, **kwargs):
+        if self.updated_configs:
+            self.change_sources()
+
+        now = time.monotonic()
+        handed_off = False
+        for source in list(self.sources.values()):
+            if source.busy or not source.started.done() or now < source.next_frame_time:
+                continue
+            if source.started.exception() is not None:
+                self.logger.error("Failed to start video capture on %s", source.stream_address,
+                                  exc_info=source.started.exception())
+                self.remove_source(source.out_key)
+                continue
+            grabbed = source.grabber.read(timeout=0)
+            if grabbed is None:
+                # an ended grabber may still hold its last frames
+                if source.grabber.ended:
+                    self.logger.error("Video capture on %s stopped", source.stream_address)
+                    self.remove_source(source.out_key)
+                continue
+            source.busy = True
+            source.next_frame_time = max(source.next_frame_time + 1 / source.fps, now)
+            self.executor.submit(self._hand_off, source, grabbed[0])
+            handed_off = True
+
+        if not handed_off:
+            time.sleep(self.IDLE_INTERVAL)
+        return handed_off
+
+    def _hand_off(self, source, frame):
+        try:
+            msg = Message(frame, source.stream_address)
+            msg.record_entry(self.component_name, self.logger)
+            resized = resize(frame, 640, 480)
+            # the grabber reuses the frame's buffer once it's released
+            source.grabber.release(frame)
+            # if the stream is from a webcam, flip the frame
+            if source.stream_address == 0:
+                resized = cv2.flip(resized, 1)
+            msg.update_payload(resized)
+            put_dropping_oldest(self.q, (source.out_key, msg))
+        except Exception:
+            self.logger.exception("Failed to hand off a frame of %s", source.stream_address)
+        finally:
+            source.busy = False
+
+    def setup(self, *args, **kwargs):
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix=self.name)
+        for source in self.sources.values():
+            self._start_source(source)
+
+    def cleanup(self, *args, **kwargs):
+        for source in self.sources.values():
+            self.executor.submit(source.grabber.stop)
+        self.executor.shutdown(wait=True)
+        self.executor = None
+
+    @staticmethod
+    def get_constructor_parameters():
+        dicts = Routine.get_constructor_parameters()
+        dicts.update({
+            "queue": "QueueOut",
+            "fps": "Integer",
+            "workers": "Integer"
+        })
+        return dicts
+
+    def does_routine_use_queue(self, queue):
+        return self.q == queue
+
+
+class MultiVideoCapture(BaseComponent):
+
+    def __init__(self, sources, redis_url, metrics_collector=NullCollector(), fps=30.0, workers=4, maxlen=10,
+                 batch_size=16, name="MultiVideoCapture", use_memory=False, codec=None):
+        """
+        Args:
+            sources: a dict of the output stream keys to the addresses of
+            their video sources.
+            fps: the default frame rate of the sources.
+            workers: the number of threads that hand off the frames of all
+            the sources.
+            batch_size: the maximal number of frames sent to Redis in a
+            single round trip.
+        """
+        super().__init__(name, metrics_collector, use_memory=use_memory, codec=codec)
+        self.queue = RingQueue(maxsize=2 * batch_size)
+
+        t_stream = MultiListen2Stream(self.queue, fps, workers, name="capture_frames", component_name=self.name,
+                                      metrics_collector=self.metrics_collector).as_thread()
+        for out_key, stream_address in sources.items():
+            t_stream.add_source(stream_address, out_key)
+        self.register_routine(t_stream)
+
+        t_upload = MultiKeyMessage2Redis(redis_url, self.queue, maxlen, batch_size=batch_size, name="upload_redis",
+                                         component_name=self.name,
+                                         metrics_collector=self.metrics_collector).as_thread()
+        self.register_routine(t_upload)
+
+    def add_source(self, stream_address, out_key, fps=None):
+        self._routines["capture_frames"].add_source(stream_address, out_key, fps)
+
+    def remove_source(self, out_key):
+        self._routines["capture_frames"].remove_source(out_key)
+
+    def change_stream(self, out_key, stream_address, fps=30.0):
+        self.add_source(stream_address, out_key, fps)
+
+
+def parse_source(source):
+    out_key, stream_address = source.split("=", 1)
+    try:
+        stream_address = int(stream_address)
+    except ValueError:
+        pass
+    return out_key, stream_address
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--sources', help='Sources as output stream key=address (a webcam number, a file or '
+                                                'a stream URL)', nargs='+', type=parse_source, required=True)
+    parser.add_argument('-u', '--url', help='Redis URL', type=str, default='redis://127.0.0.1:6379')
+    parser.add_argument('--fps', help='Frames per second of every source', type=float, default=15.0)
+    parser.add_argument('--workers', help='Number of threads handing off frames', type=int, default=4)
+    parser.add_argument('--batch-size', help='Maximal number of frames sent to Redis at once', type=int, default=16)
+    parser.add_argument('--fmt', help='Frame storage format, a frame codec optionally with its parameter '
+                                      '(raw, jpeg:80, png, webp:90, turbojpeg)', type=str, default='jpeg')
+    parser.add_argument('--maxlen', help='Maximum length of the output streams', type=int, default=100)
+    opts = parser.parse_args()
+
+    get_frame_codec(opts.fmt)
+
+    url = os.environ.get('REDIS_URL')
+    url = urlparse(url) if url is not None else urlparse(opts.url)
+
+    zpc = MultiVideoCapture(dict(opts.sources), url, fps=opts.fps, workers=opts.workers, maxlen=opts.maxlen,
+                            batch_size=opts.batch_size, codec=opts.fmt)
+    print(f"run {zpc.name}")
+    zpc.run()
+    print(f"Killed {zpc.name}")
@@ -7,6 +7,7 @@ from urllib.parse import urlparse
 import time
 from pipert.core.routine import Routine
 from pipert.core.mini_logics import Message2Redis, MessageFromRedis
+from pipert.utils.preprocessing import FramePreprocessor
 
 # import some common libraries
 from detectron2.config import get_cfg
@@ -42,6 +43,8 @@ class DefaultPredictor:
 
         self.input_format = cfg.INPUT.FORMAT
         assert self.input_format in ["RGB", "BGR"], self.input_format
+        # whether the model expects BGR inputs or RGB
+        self.preprocessor = FramePreprocessor(None, swap_rb=self.input_format == "RGB", pixel_scale=None)
 
     @torch.no_grad()
     def __call__(self, original_image):
@@ -53,12 +56,9 @@ class DefaultPredictor:
             predictions (dict): the output of the model
         """
         # Apply pre-processing to image.
-        if self.input_format == "RGB":
-            # whether the model expects BGR inputs or RGB
-            original_image = original_image[:, :, ::-1]
         height, width = original_image.shape[:2]
 #         image = self.transform_gen.get_transform(original_image).apply_image(original_image)
-        image = torch.as_tensor(original_image.astype("float32").transpose(2, 0, 1))
+        image = torch.as_tensor(self.preprocessor(original_image))
 
         inputs = {"image": image, "height": height, "width": width}
         predictions = self.model([inputs])[0]
@@ -77,6 +77,8 @@ class PoseEstLogic(Routine):
     def main_logic(self, *args, **kwargs):
         try:
             frame = self.in_queue.get(block=False)
+            if not self.accepts(frame):
+                return False
             outputs = self.predictor(frame)["instances"].to("cpu")
 
             try:
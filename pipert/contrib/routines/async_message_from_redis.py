@@ -0,0 +1,28 @@
+from pipert.core.message_handlers import AsyncRedisHandler
+from pipert.core.message import message_decode
+from pipert.core.utlis import put_dropping_oldest
+from pipert.contrib.routines.message_from_redis import MessageFromRedis
+
+
+class AsyncMessageFromRedis(MessageFromRedis):
+    """
+    MessageFromRedis that runs as a coroutine, a component can read many
+    streams with it on a single event loop.
+    """
+
+    async def main_logic(self, *args, **kwargs):
+        encoded_msg = await self.msg_handler.read_most_recent_msg(self.redis_read_key, self.block_ms)
+        if encoded_msg:
+            msg = message_decode(encoded_msg, lazy=True)
+            msg.record_entry(self.component_name, self.logger)
+            put_dropping_oldest(self.message_queue, msg)
+            return True
+        else:
+            return False
+
+    async def setup(self, *args, **kwargs):
+        self.msg_handler = AsyncRedisHandler(self.url)
+        await self.msg_handler.connect()
+
+    async def cleanup(self, *args, **kwargs):
+        await self.msg_handler.close()
@@ -0,0 +1,29 @@
+from queue import Empty
+
+from pipert.core.message_handlers import AsyncRedisHandler
+from pipert.core.message import message_encode
+from pipert.contrib.routines.message_to_redis import MessageToRedis
+
+
+class AsyncMessageToRedis(MessageToRedis):
+    """
+    MessageToRedis that runs as a coroutine, a component can send many
+    streams with it on a single event loop.
+    """
+
+    async def main_logic(self, *args, **kwargs):
+        try:
+            msg = self.message_queue.get(block=False)
+        except Empty:
+            return False
+        msg.record_exit(self.component_name, self.logger)
+        encoded_msg = message_encode(msg, wire_format=self.wire_format, codec=self.codec)
+        await self.msg_handler.send(self.redis_send_key, encoded_msg)
+        return True
+
+    async def setup(self, *args, **kwargs):
+        self.msg_handler = AsyncRedisHandler(self.url, self.max_stream_length)
+        await self.msg_handler.connect()
+
+    async def cleanup(self, *args, **kwargs):
+        await self.msg_handler.close()
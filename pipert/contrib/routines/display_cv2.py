@@ -10,6 +10,7 @@ class DisplayCv2(Routine):
     def __init__(self, frame_queue, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.frame_queue = frame_queue
+        self.input_queues = [frame_queue]
         self.negative = False
 
     def main_logic(self, *args, **kwargs):
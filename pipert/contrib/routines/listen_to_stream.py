@@ -1,11 +1,10 @@
-import time
-from queue import Empty
-
 import cv2
 
 from imutils import resize
 from pipert.core.message import Message
 from pipert.core.routine import Routine, RoutineTypes
+from pipert.core.utlis import put_dropping_oldest
+from pipert.utils.frame_grabber import FrameGrabber
 
 
 class ListenToStream(Routine):
@@ -18,18 +17,16 @@ class ListenToStream(Routine):
         except ValueError:
             self.stream_address = stream_address
         self.isFile = str(stream_address).endswith("mp4")
-        self.stream = None
-        # self.stream = cv2.VideoCapture(self.stream_address)
+        self.grabber = None
         self.out_queue = out_queue
         self.fps = fps
         self.updated_config = {}
 
     def begin_capture(self):
-        self.stream = cv2.VideoCapture(self.stream_address)
-        if self.isFile:
-            self.fps = self.stream.get(cv2.CAP_PROP_FPS)
-            self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        if self.grabber is not None:
+            self.grabber.stop()
+        self.grabber = FrameGrabber(self.stream_address, pace=self.isFile, fps=self.fps).start()
+        self.fps = self.grabber.fps
         self.logger.info("Starting video capture on %s", self.stream_address)
 
     def change_stream(self):
@@ -43,10 +40,13 @@ class ListenToStream(Routine):
         self.begin_capture()
 
     def grab_frame(self):
-        grabbed, frame = self.stream.read()
+        grabbed = self.grabber.read(timeout=self.STOP_CHECK_INTERVAL)
+        if grabbed is None:
+            return False, None
+        frame, _ = grabbed
         msg = Message(frame, self.stream_address)
         msg.record_entry(self.component_name, self.logger)
-        return grabbed, msg
+        return True, msg
 
     def main_logic(self, *args, **kwargs):
         if self.updated_config:
@@ -56,31 +56,23 @@ class ListenToStream(Routine):
         grabbed, msg = self.grab_frame()
         if grabbed:
             frame = msg.get_payload()
-            frame = resize(frame, 640, 480)
+            resized = resize(frame, 640, 480)
+            # the grabber reuses the frame's buffer once it's released
+            self.grabber.release(frame)
             # if the stream is from a webcam, flip the frame
             if self.stream_address == 0:
-                frame = cv2.flip(frame, 1)
-            try:
-                self.out_queue.get(block=False)
-            except Empty:
-                pass
-            finally:
-                msg.update_payload(frame)
-                self.out_queue.put(msg)
-                if self.isFile:
-                    self.time = time.time()
-                    wait = time.time() - self.time
-                    time.sleep(max(1 / self.fps - wait, 0))
-                # self.queue.put(frame, block=False)
-                time.sleep(0)
-                return True
+                resized = cv2.flip(resized, 1)
+            msg.update_payload(resized)
+            put_dropping_oldest(self.out_queue, msg)
+            return True
+        return False
 
     def setup(self, *args, **kwargs):
         self.begin_capture()
 
     def cleanup(self, *args, **kwargs):
-        self.stream.release()
-        del self.stream
+        self.grabber.stop()
+        self.grabber = None
 
     @staticmethod
     def get_constructor_parameters():
@@ -1,43 +1,38 @@
 import os
 import time
-from queue import Empty, Full
 from urllib.parse import urlparse
 
 from pipert.core.message_handlers import RedisHandler
 from pipert.core.message import message_decode
 from pipert.core.routine import Routine, RoutineTypes
+from pipert.core.utlis import put_dropping_oldest
 
 
 class MessageFromRedis(Routine):
     routine_type = RoutineTypes.INPUT
 
-    def __init__(self, redis_read_key, message_queue, *args, **kwargs):
+    def __init__(self, redis_read_key, message_queue, block_ms=100, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.redis_read_key = redis_read_key
         self.url = urlparse(os.environ.get('REDIS_URL', "redis://127.0.0.1:6379"))
         self.message_queue = message_queue
+        # how long to wait for new messages before checking the stop event,
+        # None to poll without waiting
+        self.block_ms = block_ms
         self.msg_handler = None
         self.flip = False
         self.negative = False
 
     def main_logic(self, *args, **kwargs):
-        encoded_msg = self.msg_handler.read_most_recent_msg(self.redis_read_key)
+        encoded_msg = self.msg_handler.read_most_recent_msg(self.redis_read_key, self.block_ms)
         if encoded_msg:
-            msg = message_decode(encoded_msg)
+            msg = message_decode(encoded_msg, lazy=True)
             msg.record_entry(self.component_name, self.logger)
-            try:
-                self.message_queue.put(msg, block=False)
-                return True
-            except Full:
-                try:
-                    self.message_queue.get(block=False)
-                except Empty:
-                    pass
-                finally:
-                    self.message_queue.put(msg, block=False)
-                    return True
+            put_dropping_oldest(self.message_queue, msg)
+            return True
         else:
-            time.sleep(0)
+            if not self.block_ms:
+                time.sleep(0)
             return False
 
     def setup(self, *args, **kwargs):
@@ -51,7 +46,8 @@ class MessageFromRedis(Routine):
         dicts = Routine.get_constructor_parameters()
         dicts.update({
             "redis_read_key": "String",
-            "message_queue": "QueueOut"
+            "message_queue": "QueueOut",
+            "block_ms": "Integer"
         })
         return dicts
 
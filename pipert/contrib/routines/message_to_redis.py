@@ -13,19 +13,23 @@ import os
 class MessageToRedis(Routine):
     routine_type = RoutineTypes.OUTPUT
 
-    def __init__(self, redis_send_key, message_queue, max_stream_length, *args, **kwargs):
+    def __init__(self, redis_send_key, message_queue, max_stream_length, wire_format="pickle", codec=None,
+                 *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.redis_send_key = redis_send_key
         self.url = urlparse(os.environ.get('REDIS_URL', "redis://127.0.0.1:6379"))
         self.message_queue = message_queue
+        self.input_queues = [message_queue]
         self.max_stream_length = max_stream_length
+        self.wire_format = wire_format
+        self.codec = codec
         self.msg_handler = None
 
     def main_logic(self, *args, **kwargs):
         try:
             msg = self.message_queue.get(block=False)
             msg.record_exit(self.component_name, self.logger)
-            encoded_msg = message_encode(msg)
+            encoded_msg = message_encode(msg, wire_format=self.wire_format, codec=self.codec)
             self.msg_handler.send(self.redis_send_key, encoded_msg)
             time.sleep(0)
             return True
@@ -46,7 +50,9 @@ class MessageToRedis(Routine):
         dicts.update({
             "redis_send_key": "String",
             "message_queue": "QueueIn",
-            "max_stream_length": "Integer"
+            "max_stream_length": "Integer",
+            "wire_format": "String",
+            "codec": "String"
         })
         return dicts
 
@@ -2,56 +2,62 @@ import os
 from urllib.parse import urlparse
 
 from pipert.core.routine import Routine, RoutineTypes
-from queue import Empty
 import cv2
 from pipert.core.message import message_decode
 from pipert.core.message_handlers import RedisHandler
+from pipert.core.utlis import put_dropping_oldest
 import time
 
 
 class MetaAndFrameFromRedis(Routine):
     routine_type = RoutineTypes.INPUT
 
-    def __init__(self, redis_read_meta_key, redis_read_image_key, image_meta_queue, *args, **kwargs):
+    def __init__(self, redis_read_meta_key, redis_read_image_key, image_meta_queue, block_ms=100, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.redis_read_meta_key = redis_read_meta_key
         self.redis_read_image_key = redis_read_image_key
         self.url = urlparse(os.environ.get('REDIS_URL', "redis://127.0.0.1:6379"))
         self.image_meta_queue = image_meta_queue
+        # how long to wait for new frames before checking the stop event,
+        # None to poll without waiting
+        self.block_ms = block_ms
         self.msg_handler = None
         self.flip = False
         self.negative = False
 
-    def receive_msg(self, in_key):
-        encoded_msg = self.msg_handler.read_most_recent_msg(in_key)
+    def receive_msg(self, in_key, block_ms=None):
+        encoded_msg = self.msg_handler.read_most_recent_msg(in_key, block_ms)
         if not encoded_msg:
             return None
-        msg = message_decode(encoded_msg)
+        msg = message_decode(encoded_msg, lazy=True)
         msg.record_entry(self.component_name, self.logger)
         return msg
 
     def main_logic(self, *args, **kwargs):
-        pred_msg = self.receive_msg(self.redis_read_meta_key)
-        frame_msg = self.receive_msg(self.redis_read_image_key)
+        # only the frames are waited for, the prediction is read once a frame
+        # arrives so it's at least as recent as the frame
+        frame_msg = self.receive_msg(self.redis_read_image_key, self.block_ms)
         if frame_msg:
-            arr = frame_msg.get_payload()
+            pred_msg = self.receive_msg(self.redis_read_meta_key)
+            # the frame is left untouched, and so isn't decoded, unless
+            # it has to be flipped or negated
+            if self.flip or self.negative:
+                arr = frame_msg.get_payload()
 
-            if self.flip:
-                arr = cv2.flip(arr, 1)
+                if self.flip:
+                    arr = cv2.flip(arr, 1)
 
-            if self.negative:
-                arr = 255 - arr
+                if self.negative:
+                    arr = 255 - arr
 
-            try:
-                self.image_meta_queue.get(block=False)
-            except Empty:
-                pass
-            frame_msg.update_payload(arr)
-            self.image_meta_queue.put((frame_msg, pred_msg))
+                frame_msg.update_payload(arr)
+
+            put_dropping_oldest(self.image_meta_queue, (frame_msg, pred_msg))
             return True
 
         else:
-            time.sleep(0)
+            if not self.block_ms:
+                time.sleep(0)
             return False
 
     def setup(self, *args, **kwargs):
@@ -67,6 +73,7 @@ class MetaAndFrameFromRedis(Routine):
             "redis_read_meta_key": "String",
             "redis_read_image_key": "String",
             "image_meta_queue": "QueueOut",
+            "block_ms": "Integer"
         })
         return dicts
 
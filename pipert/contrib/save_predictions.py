@@ -94,7 +94,7 @@ class PredsToDatabase(Routine):
 
 		# Only do something if msg isn't empty and saving is toggled on
 		if self.is_on and msg:
-			msg_id = msg.id.split("_")[-1]
+			msg_id = msg.id
 			timestamp = dt.fromtimestamp(msg.history["VideoCapture"]["entry"])
 			for prediction in msg.get_payload():
 				# get the needed fields and convert to a format that is good to be inserted into the db
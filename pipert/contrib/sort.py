@@ -16,8 +16,10 @@ class InstancesSort(Sort):
     def __init__(self, max_age: int = 1, min_hits: int = None, window_size: int = None, percent_seen: float = None,
                  verbose: bool = False):
         super().__init__(max_age, min_hits, window_size, percent_seen, verbose)
+        # frames the trackers weren't predicted through yet
+        self.pending_frames = 0
 
-    def update_instances(self, instances: Instances):
+    def update_instances(self, instances: Instances, skipped_frames: int = 0):
         im_size = instances.image_size
         tracks = None
         if len(instances):
@@ -25,7 +27,12 @@ class InstancesSort(Sort):
             scores = instances.get("scores").cpu().unsqueeze(1).numpy()
             pred_classes = instances.get("pred_classes").cpu().unsqueeze(1).numpy()
             dets = np.concatenate((boxes, scores, pred_classes), axis=1)
-            tracks = self.update(dets)
+            tracks = self.update(dets, self.pending_frames + skipped_frames)
+            self.pending_frames = 0
+        else:
+            # the trackers aren't updated without detections, their
+            # predictions catch up on the next detections
+            self.pending_frames += skipped_frames + 1
 
         ret_tracks = Instances(im_size)
         if tracks is not None:
@@ -44,6 +51,7 @@ class SORTLogic(Routine):
     def __init__(self, in_queue, out_queue, component_name, *args, **kwargs):
         super().__init__(component_name=component_name)
         self.in_queue = QueueHandler(in_queue)
+        self.input_queues = [in_queue]
         self.out_queue = QueueHandler(out_queue)
         self.sort = InstancesSort(*args, **kwargs)
 
@@ -51,7 +59,9 @@ class SORTLogic(Routine):
         pred_msg = self.in_queue.non_blocking_get()
         if pred_msg:
             instances = pred_msg.get_payload()
-            new_instances = self.sort.update_instances(instances)
+            # frames skipped by a sampling policy upstream are predicted
+            # through
+            new_instances = self.sort.update_instances(instances, pred_msg.skipped_frames)
             pred_msg.update_payload(new_instances)
             success = self.out_queue.deque_non_blocking_put(pred_msg)
             return success
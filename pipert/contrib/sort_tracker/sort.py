@@ -14,137 +14,178 @@
 """
 
 from __future__ import print_function
-from numba import jit
-from typing import List
 import numpy as np
-from sklearn.utils.linear_assignment_ import linear_assignment
-from filterpy.kalman import KalmanFilter
+from scipy.optimize import linear_sum_assignment
 import logging
 
 
-@jit
 def iou(bb_test, bb_gt):
     """
-    Computes IUO between two bboxes in the form [x1,y1,x2,y2]
+    Computes IUO between every bbox of bb_test and every bbox of bb_gt, both
+    in the form [[x1,y1,x2,y2],...], and returns an N x M matrix
     """
-    xx1 = np.maximum(bb_test[0], bb_gt[0])
-    yy1 = np.maximum(bb_test[1], bb_gt[1])
-    xx2 = np.minimum(bb_test[2], bb_gt[2])
-    yy2 = np.minimum(bb_test[3], bb_gt[3])
+    bb_test = np.expand_dims(bb_test, 1)
+    bb_gt = np.expand_dims(bb_gt, 0)
+    xx1 = np.maximum(bb_test[..., 0], bb_gt[..., 0])
+    yy1 = np.maximum(bb_test[..., 1], bb_gt[..., 1])
+    xx2 = np.minimum(bb_test[..., 2], bb_gt[..., 2])
+    yy2 = np.minimum(bb_test[..., 3], bb_gt[..., 3])
     w = np.maximum(0., xx2 - xx1)
     h = np.maximum(0., yy2 - yy1)
     wh = w * h
-    o = wh / ((bb_test[2] - bb_test[0]) * (bb_test[3] - bb_test[1])
-              + (bb_gt[2] - bb_gt[0]) * (bb_gt[3] - bb_gt[1]) - wh)
+    o = wh / ((bb_test[..., 2] - bb_test[..., 0]) * (bb_test[..., 3] - bb_test[..., 1])
+              + (bb_gt[..., 2] - bb_gt[..., 0]) * (bb_gt[..., 3] - bb_gt[..., 1]) - wh)
     return o
 
 
-# @jit(nopython=True)
-@jit
 def convert_bbox_to_z(bbox):
     """
-    Takes a bounding box in the form [x1,y1,x2,y2] and returns z in the form
-      [x,y,s,r] where x,y is the centre of the box and s is the scale/area and r is
+    Takes bounding boxes in the form [[x1,y1,x2,y2],...] and returns z in the form
+      [[x,y,s,r],...] where x,y is the centre of the box and s is the scale/area and r is
       the aspect ratio
     """
-    w = bbox[2] - bbox[0]
-    h = bbox[3] - bbox[1]
-    x = bbox[0] + w / 2.
-    y = bbox[1] + h / 2.
+    w = bbox[:, 2] - bbox[:, 0]
+    h = bbox[:, 3] - bbox[:, 1]
+    x = bbox[:, 0] + w / 2.
+    y = bbox[:, 1] + h / 2.
     s = w * h  # scale is just area
-    r = w / float(h)
-    return np.array([x, y, s, r]).reshape((4, 1))
+    r = w / h
+    return np.stack((x, y, s, r), axis=1)
 
 
-# @jit(nopython=True)
-@jit
-def convert_x_to_bbox(x, score=None):
+def convert_x_to_bbox(x):
     """
-    Takes a bounding box in the centre form [x,y,s,r] and returns it in the form
-      [x1,y1,x2,y2] where x1,y1 is the top left and x2,y2 is the bottom right
+    Takes bounding boxes in the centre form [[x,y,s,r],...] and returns them in the form
+      [[x1,y1,x2,y2],...] where x1,y1 is the top left and x2,y2 is the bottom right
     """
-    w = np.sqrt(x[2] * x[3])
-    h = x[2] / w
-    if score is None:
-        return np.array([x[0] - w / 2., x[1] - h / 2., x[0] + w / 2., x[1] + h / 2.]).reshape((1, 4))
-    else:
-        return np.array([x[0] - w / 2., x[1] - h / 2., x[0] + w / 2., x[1] + h / 2., score]).reshape((1, 5))
+    w = np.sqrt(x[:, 2] * x[:, 3])
+    h = x[:, 2] / w
+    return np.stack((x[:, 0] - w / 2., x[:, 1] - h / 2., x[:, 0] + w / 2., x[:, 1] + h / 2.), axis=1)
 
 
-class KalmanBoxTracker(object):
+class KalmanBoxTrackers(object):
     """
-    This class represents the internel state of individual tracked objects observed as bbox.
+    This class represents the internel states of all the tracked objects observed as bboxes.
+    The states of the objects are stacked, so the Kalman filters of all of them are
+    predicted and updated together, using the same constant velocity model for every object.
     """
     count = 0
 
-    def __init__(self, bbox, window_size=None):
+    # define constant velocity model
+    F = np.array(
+        [[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
+         [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]], dtype=float)
+    H = np.array(
+        [[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0], [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]], dtype=float)
+    R = np.diag([1., 1., 10., 10.])
+    # give high uncertainty to the unobservable initial velocities
+    P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+    Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+
+    def __init__(self, window_size=None):
+        self.window_size = window_size
+        self.x = np.empty((0, 7))
+        self.P = np.empty((0, 7, 7))
+        self.ids = np.empty(0, dtype=int)
+        self.time_since_update = np.empty(0, dtype=int)
+        self.hits = np.empty(0, dtype=int)
+        self.hit_streak = np.empty(0, dtype=int)
+        self.age = np.empty(0, dtype=int)
+        self.seen_in_window = np.empty((0, window_size or 0), dtype=int)
+        self.extra_info = np.empty((0, 0))
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, bboxes):
         """
-        Initialises a tracker using initial bounding box.
+        Initialises a tracker for every initial bounding box.
         """
-        # define constant velocity model
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.F = np.array(
-            [[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
-             [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]])
-        self.kf.H = np.array(
-            [[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0], [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]])
-
-        self.kf.R[2:, 2:] *= 10.
-        self.kf.P[4:, 4:] *= 1000.  # give high uncertainty to the unobservable initial velocities
-        self.kf.P *= 10.
-        self.kf.Q[-1, -1] *= 0.01
-        self.kf.Q[4:, 4:] *= 0.01
-
-        self.kf.x[:4] = convert_bbox_to_z(bbox)
-        self.time_since_update = 0
-        self.id = KalmanBoxTracker.count
-        KalmanBoxTracker.count += 1
-        self.history = []
-        self.hits = 0
-        self.hit_streak = 0
-        self.seen_in_window = []
-        self.window_size = window_size
+        count = len(bboxes)
+        x = np.zeros((count, 7))
+        x[:, :4] = convert_bbox_to_z(bboxes)
+        seen_in_window = np.zeros((count, self.window_size or 0), dtype=int)
         if self.window_size:
-            self.seen_in_window = [0] * self.window_size
-            self.seen_in_window[-1] = 1
-        self.age = 0
-        self.extra_info = bbox[4:]
+            seen_in_window[:, -1] = 1
+        ids = np.arange(KalmanBoxTrackers.count, KalmanBoxTrackers.count + count)
+        KalmanBoxTrackers.count += count
+
+        zeros = np.zeros(count, dtype=int)
+        self.x = np.concatenate((self.x, x))
+        self.P = np.concatenate((self.P, np.broadcast_to(self.P0, (count, 7, 7))))
+        self.ids = np.concatenate((self.ids, ids))
+        self.time_since_update = np.concatenate((self.time_since_update, zeros))
+        self.hits = np.concatenate((self.hits, zeros))
+        self.hit_streak = np.concatenate((self.hit_streak, zeros))
+        self.age = np.concatenate((self.age, zeros))
+        self.seen_in_window = np.concatenate((self.seen_in_window, seen_in_window))
+        if not len(self.extra_info):
+            self.extra_info = bboxes[:, 4:].copy()
+        else:
+            self.extra_info = np.concatenate((self.extra_info, bboxes[:, 4:]))
 
-    def update(self, bbox):
+    def keep(self, mask):
+        """
+        Removes the trackers that are False in mask.
+        """
+        self.x = self.x[mask]
+        self.P = self.P[mask]
+        self.ids = self.ids[mask]
+        self.time_since_update = self.time_since_update[mask]
+        self.hits = self.hits[mask]
+        self.hit_streak = self.hit_streak[mask]
+        self.age = self.age[mask]
+        self.seen_in_window = self.seen_in_window[mask]
+        self.extra_info = self.extra_info[mask]
+
+    def update(self, indices, bboxes):
         """
-        Updates the state vector with observed bbox.
+        Updates the state vectors of the trackers in indices with their observed bboxes.
         """
-        self.time_since_update = 0
-        self.history = []
-        self.hits += 1
-        self.hit_streak += 1
+        if not len(indices):
+            return
+        self.time_since_update[indices] = 0
+        self.hits[indices] += 1
+        self.hit_streak[indices] += 1
         if self.window_size:
-            self.seen_in_window[-1] = 1
-        self.kf.update(convert_bbox_to_z(bbox))
-        self.extra_info = bbox[4:]
-
-    def predict(self):
+            self.seen_in_window[indices, -1] = 1
+
+        x, P = self.x[indices], self.P[indices]
+        y = convert_bbox_to_z(bboxes) - x @ self.H.T
+        PHT = P @ self.H.T
+        S = self.H @ PHT + self.R
+        K = PHT @ np.linalg.inv(S)
+        x = x + (K @ y[..., None])[..., 0]
+        I_KH = np.eye(7) - K @ self.H
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+        self.x[indices], self.P[indices] = x, P
+        self.extra_info[indices] = bboxes[:, 4:]
+
+    def predict(self, steps=1):
         """
-        Advances the state vector and returns the predicted bounding box estimate.
+        Advances the state vectors by steps frames and returns the predicted bounding box estimates.
+        Frames that were skipped before the next detections are predicted through and count in the
+        ages and the times since update, so trackers expire after the same number of frames whether
+        they were detected or not. The hit streaks and the windows count the detected frames, so
+        sampling the frames doesn't keep the trackers from being confirmed.
         """
-        if (self.kf.x[6] + self.kf.x[2]) <= 0:
-            self.kf.x[6] *= 0.0
-        self.kf.predict()
-        self.age += 1
+        for _ in range(steps):
+            self.x[self.x[:, 6] + self.x[:, 2] <= 0, 6] *= 0.0
+            self.x = self.x @ self.F.T
+            self.P = self.F @ self.P @ self.F.T + self.Q
+        self.age += steps
         if self.window_size:
-            self.seen_in_window.append(0)
-            self.seen_in_window.pop(0)
-        if self.time_since_update > 0:
-            self.hit_streak = 0
-        self.time_since_update += 1
-        self.history.append(convert_x_to_bbox(self.kf.x))
-        return self.history[-1]
+            self.seen_in_window[:, :-1] = self.seen_in_window[:, 1:]
+            self.seen_in_window[:, -1] = 0
+        self.hit_streak[self.time_since_update > 0] = 0
+        self.time_since_update += steps
+        return self.get_state()
 
     def get_state(self):
         """
-        Returns the current bounding box estimate.
+        Returns the current bounding box estimates.
         """
-        return convert_x_to_bbox(self.kf.x)
+        return convert_x_to_bbox(self.x)
 
 
 def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
@@ -154,36 +195,19 @@ def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
     """
     if len(trackers) == 0:
         return np.empty((0, 2), dtype=int), np.arange(len(detections)), np.empty((0, 5), dtype=int)
-    iou_matrix = np.zeros((len(detections), len(trackers)), dtype=np.float32)
-
-    for d, det in enumerate(detections):
-        for t, trk in enumerate(trackers):
-            iou_matrix[d, t] = iou(det, trk)
-    matched_indices = linear_assignment(-iou_matrix)
-
-    unmatched_detections = []
-    for d, det in enumerate(detections):
-        if d not in matched_indices[:, 0]:
-            unmatched_detections.append(d)
-    unmatched_trackers = []
-    for t, trk in enumerate(trackers):
-        if t not in matched_indices[:, 1]:
-            unmatched_trackers.append(t)
+    iou_matrix = iou(detections[:, :4], trackers[:, :4]).astype(np.float32)
+    matched_indices = np.stack(linear_sum_assignment(-iou_matrix), axis=1)
+
+    unmatched_detections = np.setdiff1d(np.arange(len(detections)), matched_indices[:, 0])
+    unmatched_trackers = np.setdiff1d(np.arange(len(trackers)), matched_indices[:, 1])
 
     # filter out matched with low IOU
-    matches = []
-    for m in matched_indices:
-        if iou_matrix[m[0], m[1]] < iou_threshold:
-            unmatched_detections.append(m[0])
-            unmatched_trackers.append(m[1])
-        else:
-            matches.append(m.reshape(1, 2))
-    if len(matches) == 0:
-        matches = np.empty((0, 2), dtype=int)
-    else:
-        matches = np.concatenate(matches, axis=0)
+    low_iou = iou_matrix[matched_indices[:, 0], matched_indices[:, 1]] < iou_threshold
+    unmatched_detections = np.concatenate((unmatched_detections, matched_indices[low_iou, 0]))
+    unmatched_trackers = np.concatenate((unmatched_trackers, matched_indices[low_iou, 1]))
+    matches = matched_indices[~low_iou]
 
-    return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+    return matches, unmatched_detections, unmatched_trackers
 
 
 class Sort:
@@ -203,7 +227,7 @@ class Sort:
         self.min_hits = min_hits
         self.window_size = window_size
         self.percent_seen = percent_seen
-        self.trackers: List[KalmanBoxTracker] = []
+        self.trackers = KalmanBoxTrackers(window_size)
         self.frame_count = 0
         self.logger = logging.getLogger(__name__)
         if verbose:
@@ -223,64 +247,50 @@ class Sort:
         """
         reset the tracker, the same functionality as initializing a new Sort object
         """
-        self.trackers = []
+        self.trackers = KalmanBoxTrackers(self.window_size)
         self.frame_count = 0
         self.logger.debug("SORT tracker reset")
 
-    def update(self, dets: np.array):
+    def update(self, dets: np.array, skipped_frames: int = 0):
         """
         Params:
           dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
-        Requires: this method must be called once for each frame even with empty detections.
+          skipped_frames - the number of frames that weren't detected since the previous update
+        Requires: this method must be called once for each detected frame even with empty detections.
         Returns the a similar array, where the last column is the object ID.
         NOTE: The number of objects returned may differ from the number of detections provided.
         """
         self.frame_count += 1
         # get predicted locations from existing trackers.
-        trks = np.zeros((len(self.trackers), 5))
-        to_del = []
-        ret = []
-        for t, trk in enumerate(trks):
-            pos = self.trackers[t].predict()[0]
-            trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
-            if np.any(np.isnan(pos)):
-                to_del.append(t)
-        trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
-        for t in reversed(to_del):
-            self.trackers.pop(t)
+        trks = self.trackers.predict(1 + skipped_frames)
+        valid = np.all(np.isfinite(trks), axis=1)
+        to_del = np.flatnonzero(~valid)
+        self.trackers.keep(valid)
+        trks = trks[valid]
         matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks)
 
         # update matched trackers with assigned detections
-        for t, trk in enumerate(self.trackers):
-            if t not in unmatched_trks:
-                d = matched[np.where(matched[:, 1] == t)[0], 0]
-                trk.update(dets[d, :][0])
+        self.trackers.update(matched[:, 1], dets[matched[:, 0]])
 
         # create and initialise new trackers for unmatched detections
-        for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i, :], window_size=self.window_size)
-            self.trackers.append(trk)
-        i = len(self.trackers)
-        for trk in reversed(self.trackers):
-            d = trk.get_state()[0]
-            if self.min_hits:
-                seen_enough = trk.hit_streak >= self.min_hits
-                min_frames = self.min_hits
-            else:
-                seen_enough = (np.mean(trk.seen_in_window) >= self.percent_seen)
-                min_frames = self.window_size
-
-            if (trk.time_since_update < 1) and (seen_enough or self.frame_count <= min_frames):
-                # trk.id + 1 as MOT benchmark requires positive
-                ret.append(np.concatenate((d, trk.extra_info, [trk.id + 1])).reshape(1, -1))
-            i -= 1
-
-            # remove dead tracklet
-            if trk.time_since_update > self.max_age:
-                self.trackers.pop(i)
+        self.trackers.add(dets[unmatched_dets.astype(int)])
+        trackers = self.trackers
+        if self.min_hits:
+            seen_enough = trackers.hit_streak >= self.min_hits
+            min_frames = self.min_hits
+        else:
+            seen_enough = np.mean(trackers.seen_in_window, axis=1) >= self.percent_seen
+            min_frames = self.window_size
+        returned = (trackers.time_since_update < 1) & (seen_enough | (self.frame_count <= min_frames))
+        # trk.id + 1 as MOT benchmark requires positive
+        ret = np.concatenate((trackers.get_state(), trackers.extra_info, trackers.ids[:, None] + 1),
+                             axis=1)[returned][::-1]
+
+        # remove dead tracklets
+        trackers.keep(trackers.time_since_update <= self.max_age)
         self.logger.debug(f"Update: unmatched detections-{len(unmatched_dets)}; unmatched tracks-{len(unmatched_trks)}"
                           f"; deleted tracks-{len(to_del)}; matched-{len(matched)}; returned-{len(ret)}")
         if len(ret) > 0:
-            return np.concatenate(ret)
+            return ret
         # return np.empty((0, 5))
         return None
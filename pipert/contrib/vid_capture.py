@@ -7,10 +7,11 @@ from urllib.parse import urlparse
 import os
 
 from pipert.contrib.metrics_collectors.prometheus_collector import PrometheusCollector
-from pipert.core.message import Message
+from pipert.core.message import Message, get_frame_codec
 from pipert.core.metrics_collector import NullCollector
 from pipert.core.mini_logics import Message2Redis
 from pipert.core import QueueHandler
+from pipert.utils.frame_grabber import FrameGrabber
 from pipert.contrib.metrics_collectors.splunk_collector import SplunkCollector
 
 
@@ -21,19 +22,16 @@ class Listen2Stream(Routine):
         super().__init__(*args, **kwargs)
         self.stream_address = stream_address
         self.is_file = str(stream_address).endswith("mp4")
-        self.stream = None
-        # self.stream = cv2.VideoCapture(self.stream_address)
+        self.grabber = None
         self.q_handler = QueueHandler(queue)
         self.fps = fps
         self.updated_config = {}
 
     def begin_capture(self):
-        self.stream = cv2.VideoCapture(self.stream_address)
-        if self.is_file:
-            self.fps = self.stream.get(cv2.CAP_PROP_FPS)
-            self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        _, _ = self.grab_frame()
+        if self.grabber is not None:
+            self.grabber.stop()
+        self.grabber = FrameGrabber(self.stream_address, pace=self.is_file, fps=self.fps).start()
+        self.fps = self.grabber.fps
         self.logger.info("Starting video capture on %s", self.stream_address)
 
     def change_stream(self):
@@ -47,26 +45,29 @@ class Listen2Stream(Routine):
         self.begin_capture()
 
     def grab_frame(self):
-        grabbed, frame = self.stream.read()
+        grabbed = self.grabber.read(timeout=self.STOP_CHECK_INTERVAL)
+        if grabbed is None:
+            return False, None
+        frame, _ = grabbed
         msg = Message(frame, self.stream_address)
         msg.record_entry(self.component_name, self.logger)
-        return grabbed, msg
+        return True, msg
 
     def main_logic(self, *args, **kwargs):
         if self.updated_config:
             self.change_stream()
             self.updated_config = {}
 
-        grabbed, frame = self.stream.read()
+        grabbed, msg = self.grab_frame()
         if grabbed:
-            msg = Message(frame, self.stream_address)
-            msg.record_entry(self.component_name, self.logger)
-
-            frame = resize(frame, 640, 480)
+            frame = msg.get_payload()
+            resized = resize(frame, 640, 480)
+            # the grabber reuses the frame's buffer once it's released
+            self.grabber.release(frame)
             # if the stream is from a webcam, flip the frame
             if self.stream_address == 0:
-                frame = cv2.flip(frame, 1)
-            msg.update_payload(frame)
+                resized = cv2.flip(resized, 1)
+            msg.update_payload(resized)
 
             success = self.q_handler.deque_non_blocking_put(msg)
             return success
@@ -75,15 +76,15 @@ class Listen2Stream(Routine):
         self.begin_capture()
 
     def cleanup(self, *args, **kwargs):
-        self.stream.release()
-        del self.stream
+        self.grabber.stop()
+        self.grabber = None
 
 
 class VideoCapture(BaseComponent):
 
     def __init__(self, endpoint, stream_address, out_key, redis_url, metrics_collector, use_memory=False, fps=30.0,
-                 maxlen=10, name="VideoCapture"):
-        super().__init__(endpoint, name, metrics_collector, use_memory=use_memory)
+                 maxlen=10, name="VideoCapture", codec=None):
+        super().__init__(endpoint, name, metrics_collector, use_memory=use_memory, codec=codec)
         # TODO: should queue maxsize be configurable?
         self.queue = Queue(maxsize=10)
 
@@ -113,11 +114,17 @@ if __name__ == '__main__':
     parser.add_argument('--monitoring', help='Name of the monitoring service', type=str, default='prometheus')
     parser.add_argument('-s', '--shared', help='Shared memory', type=bool, default=False)
     parser.add_argument('--count', help='Count of frames to capture', type=int, default=None)
-    parser.add_argument('--fmt', help='Frame storage format', type=str, default='.jpg')
+    parser.add_argument('--fmt', help='Frame storage format, a frame codec optionally with its parameter '
+                                      '(raw, jpeg:80, png, webp:90, turbojpeg)', type=str, default='.jpg')
     parser.add_argument('--fps', help='Frames per second (webcam)', type=float, default=15.0)
     parser.add_argument('--maxlen', help='Maximum length of output stream', type=int, default=100)
     opts = parser.parse_args()
 
+    # the format used to be given as a file extension, unknown formats
+    # fail here rather than on the first frame
+    codec = {"jpg": "jpeg"}.get(opts.fmt.lstrip('.'), opts.fmt.lstrip('.'))
+    get_frame_codec(codec)
+
     # Set up Redis connection
     url = os.environ.get('REDIS_URL')
     url = urlparse(url) if url is not None else urlparse(opts.url)
@@ -133,11 +140,11 @@ if __name__ == '__main__':
     if opts.infile is None:
         zpc = VideoCapture(endpoint="tcp://0.0.0.0:4242", stream_address=opts.webcam, out_key=opts.output,
                            redis_url=url, metrics_collector=collector, fps=opts.fps, maxlen=opts.maxlen,
-                           use_memory=opts.shared)
+                           use_memory=opts.shared, codec=codec)
     else:
         zpc = VideoCapture(endpoint="tcp://0.0.0.0:4242", stream_address=opts.infile, out_key=opts.output,
                            redis_url=url, metrics_collector=collector, fps=opts.fps, maxlen=opts.maxlen,
-                           use_memory=opts.shared)
+                           use_memory=opts.shared, codec=codec)
     print(f"run {zpc.name}")
     zpc.run()
     print(f"Killed {zpc.name}")
@@ -5,6 +5,7 @@ import argparse
 from urllib.parse import urlparse
 from pipert.core.mini_logics import MessageFromRedis
 from pipert.core import QueueHandler, Message
+from pipert.core.message import MessageIdAllocator
 
 
 class VideoWriterLogic(Routine):
@@ -14,6 +15,7 @@ class VideoWriterLogic(Routine):
         self.writer = None
         self.output_file = output_file
         self.q_handler = QueueHandler(in_queue)
+        self.input_queues = [in_queue]
         self.w, self.h = im_size
         self.fps = fps
 
@@ -27,7 +29,8 @@ class VideoWriterLogic(Routine):
                                               (frame.shape[1], frame.shape[0]))
                 self.h, self.w = frame.shape[0], frame.shape[1]
 
-            frame = cv2.putText(frame, f"{msg.id.split('_')[-1]}", (0, self.h - 10), cv2.FONT_HERSHEY_SIMPLEX,
+            frame_number = MessageIdAllocator.split(msg.id)[2]
+            frame = cv2.putText(frame, str(frame_number), (0, self.h - 10), cv2.FONT_HERSHEY_SIMPLEX,
                                 1, (0, 0, 255), 2, cv2.LINE_AA)
             self.writer.write(frame)
 
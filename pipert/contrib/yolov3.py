@@ -1,4 +1,5 @@
 import argparse
+from collections import defaultdict
 from queue import Queue
 from urllib.parse import urlparse
 # from sys import platform
@@ -11,7 +12,12 @@ from pipert.contrib.metrics_collectors.splunk_collector import SplunkCollector
 from pipert.core.metrics_collector import NullCollector
 from pipert.core.mini_logics import MessageFromRedis, Message2Redis
 from pipert.utils.structures import Instances, Boxes
-from pipert.core import Routine, BaseComponent, QueueHandler
+from pipert.core import BaseComponent
+from pipert.core.motion_gate import MotionGate, MOTION_METHODS
+from pipert.core.processing_routine import ProcessingRoutine
+from pipert.core.sampling import get_sampling_policy
+from pipert.core.utlis import QueueHandler
+from pipert.utils.preprocessing import FramePreprocessor
 
 
 def letterbox(img, new_shape=416, color=(128, 128, 128), mode='auto'):
@@ -51,12 +57,23 @@ def letterbox(img, new_shape=416, color=(128, 128, 128), mode='auto'):
     return img, ratiow, ratioh, dw, dh
 
 
-class YoloV3Logic(Routine):
+class YoloV3Logic(ProcessingRoutine):
+    """
+    Detects objects in the frames of the input messages.
 
-    def __init__(self, in_queue, out_queue, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.in_queue = QueueHandler(in_queue)
-        self.out_queue = QueueHandler(out_queue)
+    With a batch_size above 1 the routine takes up to batch_size messages
+    at once (possibly from different cameras), waiting up to batch_wait_ms
+    milliseconds for them, and runs a single forward pass for all the
+    frames that are letterboxed to the same shape. Batching is done in
+    main_logic, so a routine that runs as a worker pool detects one frame
+    at a time.
+    """
+
+    def __init__(self, in_queue, out_queue, batch_size=1, batch_wait_ms=0, *args, **kwargs):
+        super().__init__(in_queue, out_queue, *args, **kwargs)
+        self.batch_size = batch_size
+        self.batch_wait_ms = batch_wait_ms
+        self.in_handler = QueueHandler(in_queue)
         self.img_size = (320, 192) if ONNX_EXPORT else opt.img_size  # (320, 192) or (416, 256) or (608, 352)
         out, source, weights, half = opt.output, opt.source, opt.weights, opt.half
         device = torch_utils.select_device(force_cpu=ONNX_EXPORT)
@@ -74,71 +91,126 @@ class YoloV3Logic(Routine):
         self.classes = load_classes(opt.names)
         self.colors = [[random.randint(0, 255) for _ in range(3)] for _ in range(len(self.classes))]
         self.device = device
+        # letterboxes like letterbox(mode='auto'), straight into the batches
+        self.preprocessor = FramePreprocessor(self.img_size, stride=32,
+                                              dtype=np.float16 if self.half else np.float32)
+        self._batches = {}
 
     def main_logic(self, *args, **kwargs):
+        if self.batch_size <= 1:
+            return super().main_logic(*args, **kwargs)
+        msgs = [msg for msg in self.in_handler.get_batch(self.batch_size, self.batch_wait_ms / 1000)
+                if self.accepts(msg)]
+        if not msgs:
+            return False
+        # the frames the motion gate answers are emitted in order with the
+        # detected ones
+        reused = [self.reuses_result(msg) for msg in msgs]
+        detected = iter(self.process_batch([msg for msg, is_reused in zip(msgs, reused) if not is_reused]))
+        for msg, is_reused in zip(msgs, reused):
+            self.emit(msg if is_reused else next(detected))
+        return True
+
+    def process(self, msg):
+        return self.process_batch([msg])[0]
+
+    def process_batch(self, msgs):
+        """
+        Detects the objects in the frames of the messages and replaces their
+        payloads with the predictions. Frames that are letterboxed to the
+        same shape go through the model together.
+        """
+        frames = [msg.get_payload() for msg in msgs]
+        indices_by_shape = defaultdict(list)
+        for i, im0 in enumerate(frames):
+            indices_by_shape[self.preprocessor.get_output_shape(im0.shape)].append(i)
 
-        msg = self.in_queue.non_blocking_get()
-        if msg:
-            im0 = msg.get_payload()
-            img, *_ = letterbox(im0, new_shape=self.img_size)
-
-            # Normalize RGB
-            img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB
-            img = np.ascontiguousarray(img, dtype=np.float16 if self.half else np.float32)  # uint8 to fp16/fp32
-            img /= 255.0
-            img = torch.from_numpy(img).to(self.device)
-            # print(f"yolo {self.device}")
-            if img.ndimension() == 3:
-                img = img.unsqueeze(0)
+        for shape, indices in indices_by_shape.items():
+            images = self._get_batch(len(indices), shape)
+            for image, i in zip(images, indices):
+                self.preprocessor(frames[i], out=image)
+            batch = torch.from_numpy(images).to(self.device)
             with torch.no_grad():
-                pred, _ = self.model(img)
-            det = non_max_suppression(pred,  opt.conf_thres, opt.nms_thres)[0]
-            if det is not None and len(det):
-                # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape).round()
-                # print(det.shape)
-                # print(det)
-                # for *xyxy, conf, _, cls in det:
-                #     label = '%s %.2f' % (self.classes[int(cls)], conf)
-                #     plot_one_box(xyxy, im0, label=label, color=self.colors[int(cls)])
-                res = Instances(im0.shape)
-                res.set("pred_boxes", Boxes(det[:, :4]))
-                res.set("scores", det[:, 4])
-                res.set("class_scores", det[:, 5:-1].unsqueeze(1))
-                res.set("pred_classes", det[:, -1].round().int())
-            else:
-                res = Instances(im0.shape)
-                res.set("pred_boxes", [])
-
-            msg.payload = PredictionPayload(res.to("cpu"))
-            success = self.out_queue.deque_non_blocking_put(msg)
-            return success
+                pred, _ = self.model(batch)
+            dets = non_max_suppression(pred, opt.conf_thres, opt.nms_thres)
+            for i, det in zip(indices, dets):
+                msgs[i].payload = PredictionPayload(
+                    self._get_instances(det, batch.shape[2:], frames[i].shape))
+        return msgs
 
+    def _get_batch(self, count, shape):
+        # the model's input buffers are reused for batches of the same size
+        batch = self._batches.get((count, shape))
+        if batch is None:
+            batch = np.empty((count,) + shape, dtype=self.preprocessor.dtype)
+            self._batches[(count, shape)] = batch
+        return batch
+
+    @staticmethod
+    def _get_instances(det, img_shape, im0_shape):
+        if det is not None and len(det):
+            # Rescale boxes from img_size to im0 size
+            det[:, :4] = scale_coords(img_shape, det[:, :4], im0_shape).round()
+            # print(det.shape)
+            # print(det)
+            # for *xyxy, conf, _, cls in det:
+            #     label = '%s %.2f' % (self.classes[int(cls)], conf)
+            #     plot_one_box(xyxy, im0, label=label, color=self.colors[int(cls)])
+            res = Instances(im0_shape)
+            res.set("pred_boxes", Boxes(det[:, :4]))
+            res.set("scores", det[:, 4])
+            res.set("class_scores", det[:, 5:-1].unsqueeze(1))
+            res.set("pred_classes", det[:, -1].round().int())
         else:
-            return None
+            res = Instances(im0_shape)
+            res.set("pred_boxes", [])
+        return res.to("cpu")
+
+    @staticmethod
+    def get_constructor_parameters():
+        dicts = ProcessingRoutine.get_constructor_parameters()
+        dicts.update({
+            "batch_size": "Integer",
+            "batch_wait_ms": "Integer",
+        })
+        return dicts
 
     def setup(self, *args, **kwargs):
         self.state.dropped = 0
 
     def cleanup(self, *args, **kwargs):
         del self.model, self.device, self.classes, self.colors
+        self._batches.clear()
 
 
 class YoloV3(BaseComponent):
 
-    def __init__(self, endpoint, out_key, in_key, redis_url, maxlen, metrics_collector, name="YoloV3"):
+    def __init__(self, endpoint, out_key, in_key, redis_url, maxlen, metrics_collector, name="YoloV3", group=None,
+                 workers=0, batch_size=1, batch_wait_ms=0, sampling_policy=None, motion_gate=None):
         super().__init__(endpoint, name, metrics_collector)
-        self.in_queue = Queue(maxsize=1)
-        self.out_queue = Queue(maxsize=1)
+        # with a sampling policy every frame is read and the policy chooses
+        # the frames to detect, so the queue holds the frames that arrive
+        # while a batch is detected
+        self.in_queue = Queue(maxsize=batch_size if sampling_policy is None else max(2 * batch_size, 32))
+        self.out_queue = Queue(maxsize=batch_size)
 
-        t_get = MessageFromRedis(in_key, redis_url, self.in_queue, name="get_frames", component_name=self.name,
+        t_get = MessageFromRedis(in_key, redis_url, self.in_queue, most_recent=sampling_policy is None,
+                                 batch_size=batch_size, name="get_frames", component_name=self.name, group=group,
                                  metrics_collector=self.metrics_collector).as_thread()
         self.register_routine(t_get)
-        t_det = YoloV3Logic(self.in_queue, self.out_queue, name='yolo_logic', component_name=self.name,
-                            metrics_collector=self.metrics_collector).as_thread()
+        t_det = YoloV3Logic(self.in_queue, self.out_queue, batch_size, batch_wait_ms, name='yolo_logic',
+                            component_name=self.name, metrics_collector=self.metrics_collector)
+        if sampling_policy is not None:
+            t_det.sample(sampling_policy)
+        if motion_gate is not None:
+            t_det.gate(motion_gate)
+        if workers:
+            t_det.as_worker_pool(workers)
+        else:
+            t_det.as_thread()
         self.register_routine(t_det)
-        t_send = Message2Redis(out_key, redis_url, self.out_queue, maxlen, name="upload_redis", component_name=self.name,
-                               metrics_collector=self.metrics_collector).as_thread()
+        t_send = Message2Redis(out_key, redis_url, self.out_queue, maxlen, batch_size=batch_size, name="upload_redis",
+                               component_name=self.name, metrics_collector=self.metrics_collector).as_thread()
         self.register_routine(t_send)
 
 
@@ -154,6 +226,18 @@ if __name__ == '__main__':
     parser.add_argument('-z', '--zpc', help='zpc port', type=str, default='4243')
     parser.add_argument('--monitoring', help='Name of the monitoring service', type=str, default='prometheus')
     parser.add_argument('--maxlen', help='Maximum length of output stream', type=int, default=100)
+    parser.add_argument('--group', help='Consumer group shared by detector replicas', type=str, default=None)
+    parser.add_argument('--workers', help='Number of detection worker processes, 0 to detect in a thread', type=int,
+                        default=0)
+    parser.add_argument('--batch-size', help='Maximal number of frames to detect in a single forward pass', type=int,
+                        default=1)
+    parser.add_argument('--batch-wait-ms', help='Maximal time to wait for a full batch of frames', type=int, default=0)
+    parser.add_argument('--sample', help='Frames to detect, every:N for every Nth frame, fps:F for F frames a '
+                                         'second or adaptive[:max_load] for as many as the detector keeps up with',
+                        type=str, default=None)
+    parser.add_argument('--motion-gate', help='Detect only the frames that changed from their camera\'s background, '
+                                              'by the blocks or mog2 method, and repeat the last detections otherwise',
+                        type=str, choices=MOTION_METHODS, default=None)
     parser.add_argument('--img-size', type=int, default=416, help='inference size (pixels)')
     parser.add_argument('--conf-thres', type=float, default=0.3, help='object confidence threshold')
     parser.add_argument('--nms-thres', type=float, default=0.5, help='iou threshold for non-maximum suppression')
@@ -172,7 +256,10 @@ if __name__ == '__main__':
     else:
         collector = NullCollector()
 
-    zpc = YoloV3(f"tcp://0.0.0.0:{opt.zpc}", opt.output, opt.input, url, opt.maxlen, collector)
+    zpc = YoloV3(f"tcp://0.0.0.0:{opt.zpc}", opt.output, opt.input, url, opt.maxlen, collector, group=opt.group,
+                 workers=opt.workers, batch_size=opt.batch_size, batch_wait_ms=opt.batch_wait_ms,
+                 sampling_policy=get_sampling_policy(opt.sample) if opt.sample else None,
+                 motion_gate=MotionGate(method=opt.motion_gate) if opt.motion_gate else None)
     print(f"run {zpc.name}")
     zpc.run()
     print(f"Killed {zpc.name}")
@@ -1,5 +1,5 @@
 from .routine import Routine, Events
 from .component import BaseComponent
 from .message import Message, Payload
-from .message_handlers import MessageHandler, RedisHandler
+from .message_handlers import MessageHandler, RedisHandler, AsyncRedisHandler
 from .utlis import QueueHandler
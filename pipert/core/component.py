@@ -1,4 +1,6 @@
+import logging
 import threading
+from collections import defaultdict
 from torch.multiprocessing import Event, Process
 from pipert.core.routine import Routine
 from threading import Thread
@@ -6,17 +8,29 @@ from typing import Union
 import signal
 import gevent
 from .metrics_collector import NullCollector
-from .multiprocessing_shared_memory import MpSharedMemoryGenerator
+from .multiprocessing_shared_memory import MpSharedMemorySlab, \
+    MpSharedMemoryRing
 from .errors import RegisteredException, QueueDoesNotExist
-from queue import Queue
+from .utlis import AutoQueue, create_queue_of_kind, close_queue
 
 
 class BaseComponent:
+    # how often the component checks that its routines are alive
+    SUPERVISION_INTERVAL = 1.0
 
     def __init__(self, name="", metrics_collector=NullCollector(),
-                 use_memory=False, *args, **kwargs):
+                 use_memory=False, raw_frames=False, codec=None,
+                 max_routine_restarts=0, *args, **kwargs):
         """
         Args:
+            use_memory: whether frames are passed through shared memory.
+            raw_frames: if use_memory is True, frames are written unencoded
+            into a ring of shared memory slots instead of being encoded.
+            codec: the codec the component's routines encode frames with,
+            see pipert.core.message.get_frame_codec.
+            max_routine_restarts: how many times a routine that died while
+            the component is running is started again, routines that die
+            more often are only reported.
             *args: TBD
             **kwargs: TBD
         """
@@ -35,8 +49,15 @@ class BaseComponent:
         self.queues = {}
         self._routines = {}
         self.use_memory = use_memory
+        self.codec = codec
+        self.max_routine_restarts = max_routine_restarts
+        self.routine_restarts = defaultdict(int)
+        self.logger = logging.getLogger(self.name)
         if use_memory:
-            self.generator = MpSharedMemoryGenerator(self.name)
+            if raw_frames:
+                self.generator = MpSharedMemoryRing(self.name)
+            else:
+                self.generator = MpSharedMemorySlab(self.name)
         self.component_runner = None
         self.runner_creator = None
         self.runner_creator_kwargs = {}
@@ -47,9 +68,43 @@ class BaseComponent:
         Goes over the component's routines registered in self.routines and
         starts running them.
         """
+        if self.use_memory:
+            self.generator.setup()
+        # the routines only know how they run once they are registered, so
+        # the kinds of the "auto" queues are chosen just before they start
+        for q in self.queues.values():
+            if isinstance(q, AutoQueue):
+                q.switch_to(self._choose_queue_kind(q))
         for routine in self._routines.values():
             routine.start()
 
+    def _choose_queue_kind(self, q):
+        """
+        Returns the kind of queue that the routines using q need. A thread
+        queue is enough when they all run in the component's process, two
+        routines in different processes (a producer and a consumer) use
+        shared memory and more use a multiprocessing queue. Queues with an
+        overflow policy stay thread queues, as only thread queues support
+        overflow policies.
+        """
+        users = [routine for routine in self._routines.values()
+                 if isinstance(routine, Routine)
+                 and routine.does_routine_use_queue(q)]
+        in_processes = [routine.name for routine in users
+                        if routine.has_own_process()]
+        if not in_processes:
+            return "thread"
+        if q.overflow is not None:
+            self.logger.warning("A queue with the overflow policy %s stays a "
+                                "thread queue, as only thread queues support "
+                                "overflow policies, although the routines %s "
+                                "that use it run in processes of their own",
+                                q.overflow, ", ".join(in_processes))
+            return "thread"
+        if len(users) == 2:
+            return "shared_memory"
+        return "process"
+
     def run(self):
         self.component_runner = self.runner_creator(**self.runner_creator_kwargs)
         self.component_runner.start()
@@ -63,11 +118,36 @@ class BaseComponent:
         gevent.signal_handler(signal.SIGTERM, self.stop_run)
         self.metrics_collector.setup()
 
-        # keeps the component execution alive
-        while not self.stop_event.is_set():
-            pass
+        # keeps the component execution alive until it's stopped, checking
+        # on its routines every once in a while
+        while not self.stop_event.wait(self.SUPERVISION_INTERVAL):
+            self._supervise_routines()
         self._stop_run()
 
+    def _supervise_routines(self):
+        """
+        Restarts routines that died while the component is running, up to
+        max_routine_restarts times each, and reports the ones that can't be
+        restarted.
+        """
+        for name, routine in self._routines.items():
+            if not isinstance(routine, Routine) or routine.runner is None \
+                    or routine.runner.is_alive() or self.stop_event.is_set():
+                continue
+            exit_code = getattr(routine.runner, "exitcode", None)
+            if self.routine_restarts[name] < self.max_routine_restarts:
+                self.routine_restarts[name] += 1
+                self.logger.warning("Routine %s died (exit code %s), "
+                                    "restarting it (%d/%d)", name, exit_code,
+                                    self.routine_restarts[name],
+                                    self.max_routine_restarts)
+                routine.start()
+            elif self.routine_restarts[name] == self.max_routine_restarts:
+                # reported once, a routine that isn't restarted stays dead
+                self.routine_restarts[name] += 1
+                self.logger.error("Routine %s died (exit code %s)", name,
+                                  exit_code)
+
     def register_routine(self, routine: Union[Routine, Process, Thread]):
         """
         Registers routine to the list of component's routines
@@ -81,6 +161,8 @@ class BaseComponent:
                 if self.use_memory:
                     routine.use_memory = self.use_memory
                     routine.generator = self.generator
+                if routine.codec is None:
+                    routine.codec = self.codec
             else:
                 raise RegisteredException("routine is already registered")
             self._routines[routine.name] = routine
@@ -110,28 +192,59 @@ class BaseComponent:
         """
         try:
             self._teardown_callback()
-            if self.use_memory:
-                self.generator.cleanup()
+            for routine in self._routines.values():
+                if isinstance(routine, Routine):
+                    routine.wake()
             for routine in self._routines.values():
                 if isinstance(routine, Routine):
                     routine.runner.join()
                 elif isinstance(routine, (Process, Thread)):
                     routine.join()
+            # the memory is released only once no routine can write to it
+            if self.use_memory:
+                self.generator.cleanup()
+            for q in self.queues.values():
+                if isinstance(q, AutoQueue):
+                    q.switch_to("thread")
             return 0
         except RuntimeError:
             return 1
 
-    def create_queue(self, queue_name, queue_size=1):
+    def create_queue(self, queue_name, queue_size=1, queue_kind="auto",
+                     overflow=None, slot_size=None):
         """
            Create a new queue for the component.
            Returns True if created or False otherwise
            Args:
                queue_name: the name of the queue, must be unique
                queue_size: the size of the queue
+               queue_kind: "thread" for routines that run in the component's
+               process, "process" or "shared_memory" (a single producer)
+               for routines that run in processes of their own, or "auto"
+               to choose by the routines that use the queue when the
+               component starts.
+               overflow: what a thread queue does when an item is put while
+               it's full, "drop_oldest", "drop_newest", "block" or
+               "latest_only" (see RingQueue). By default put blocks or
+               raises queue.Full like in `queue.Queue`.
+               slot_size: the maximal size in bytes of a pickled item if the
+               queue passes its items through shared memory, e.g. big raw
+               frames or batches of frames (see SharedMemoryQueue).
+           Raises:
+               ValueError - if the queue kind or the overflow policy doesn't
+               exist, or the queue kind doesn't support overflow policies
         """
         if queue_name in self.queues:
             return False
-        self.queues[queue_name] = Queue(maxsize=queue_size)
+        if queue_kind == "auto":
+            self.queues[queue_name] = AutoQueue(maxsize=queue_size,
+                                                overflow=overflow,
+                                                slot_size=slot_size)
+        else:
+            self.queues[queue_name] = create_queue_of_kind(queue_kind,
+                                                           queue_size,
+                                                           overflow,
+                                                           slot_size)
         return True
 
     def get_queue(self, queue_name):
@@ -173,10 +286,11 @@ class BaseComponent:
                KeyError - if no queue has the name queue_name
         """
         try:
-            del self.queues[queue_name]
-            return True
+            q = self.queues.pop(queue_name)
         except KeyError:
             raise QueueDoesNotExist(queue_name)
+        close_queue(q.queue if isinstance(q, AutoQueue) else q)
+        return True
 
     def does_routine_name_exist(self, routine_name):
         return routine_name in self._routines
@@ -1,11 +1,17 @@
-import collections
+from array import array
+import os
+import socket
+import threading
+import zlib
 from abc import ABC, abstractmethod
 
-from pipert.core.multiprocessing_shared_memory import get_shared_memory_object
+from pipert.core.multiprocessing_shared_memory import get_shared_memory_object, \
+    get_ring_frame, MpSharedMemoryRing, SharedFrameReference
 
 import numpy as np
 import time
 import pickle
+import struct
 import cv2
 
 
@@ -21,7 +27,7 @@ class Payload(ABC):
         pass
 
     @abstractmethod
-    def encode(self, generator):
+    def encode(self, generator, codec=None):
         pass
 
     @abstractmethod
@@ -29,63 +35,546 @@ class Payload(ABC):
         pass
 
 
+class FrameCodec(ABC):
+    """
+    Compresses frames into the bytes that are sent between components.
+    """
+    name = None
+
+    @abstractmethod
+    def encode(self, frame):
+        pass
+
+    def decode(self, buf):
+        return cv2.imdecode(np.frombuffer(buf, dtype=np.uint8),
+                            cv2.IMREAD_COLOR)
+
+
+class RawCodec(FrameCodec):
+    """
+    Sends the frame's pixels as they are, after a small header with their
+    shape and type. Costs no CPU but the most bandwidth, so it's meant for
+    components on the same host. The decoded frame is a read-only view of
+    the received bytes.
+    """
+    name = "raw"
+    MAGIC = b"PRTR"
+    HEADER = struct.Struct("<4sB3s")
+
+    def encode(self, frame):
+        dtype = frame.dtype.str.encode()
+        header = self.HEADER.pack(self.MAGIC, frame.ndim, dtype)
+        shape = struct.pack(f"<{frame.ndim}I", *frame.shape)
+        return b"".join([header, shape, np.ascontiguousarray(frame).data])
+
+    def decode(self, buf):
+        _, ndim, dtype = self.HEADER.unpack_from(buf)
+        shape = struct.unpack_from(f"<{ndim}I", buf, self.HEADER.size)
+        return np.frombuffer(buf, dtype=np.dtype(dtype.decode()),
+                             offset=self.HEADER.size + 4 * ndim) \
+            .reshape(shape)
+
+
+class JpegCodec(FrameCodec):
+    """
+    Encodes frames as JPEG with the given quality (0-100).
+    """
+    name = "jpeg"
+
+    def __init__(self, quality=95):
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+
+    def encode(self, frame):
+        return cv2.imencode('.jpeg', frame, self.params)[1].tobytes()
+
+
+class TurboJpegCodec(JpegCodec):
+    """
+    Encodes and decodes JPEG frames with libjpeg-turbo through PyTurboJPEG,
+    which is faster than OpenCV. Falls back to OpenCV when PyTurboJPEG isn't
+    installed.
+    """
+    name = "turbojpeg"
+
+    def __init__(self, quality=95):
+        super().__init__(quality)
+        self.quality = int(quality)
+        try:
+            from turbojpeg import TurboJPEG
+            self.turbo = TurboJPEG()
+        except (ImportError, RuntimeError):
+            self.turbo = None
+
+    def encode(self, frame):
+        if self.turbo is None:
+            return super().encode(frame)
+        return self.turbo.encode(frame, quality=self.quality)
+
+    def decode(self, buf):
+        if self.turbo is None:
+            return super().decode(buf)
+        return self.turbo.decode(bytes(buf))
+
+
+class PngCodec(FrameCodec):
+    """
+    Encodes frames as lossless PNG with the given compression level (0-9).
+    """
+    name = "png"
+
+    def __init__(self, compression=3):
+        self.params = [cv2.IMWRITE_PNG_COMPRESSION, int(compression)]
+
+    def encode(self, frame):
+        return cv2.imencode('.png', frame, self.params)[1].tobytes()
+
+
+class WebpCodec(FrameCodec):
+    """
+    Encodes frames as WebP with the given quality (1-100), smaller than JPEG
+    of the same quality but slower to encode.
+    """
+    name = "webp"
+
+    def __init__(self, quality=80):
+        self.params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+
+    def encode(self, frame):
+        return cv2.imencode('.webp', frame, self.params)[1].tobytes()
+
+
+FRAME_CODECS = {codec.name: codec for codec in
+                [RawCodec, JpegCodec, TurboJpegCodec, PngCodec, WebpCodec]}
+DEFAULT_FRAME_CODEC = "jpeg"
+_frame_codecs = {}
+
+
+def get_frame_codec(spec=None):
+    """
+    Returns the codec described by spec, the name of one of FRAME_CODECS
+    optionally followed by its parameter, for example "jpeg:80" for JPEG
+    with quality 80 or "png:1" for PNG with compression level 1.
+    The codecs are created once per spec.
+
+    Args:
+        spec: the codec description, DEFAULT_FRAME_CODEC if not given.
+    """
+    spec = spec or DEFAULT_FRAME_CODEC
+    if spec not in _frame_codecs:
+        name, _, param = spec.partition(":")
+        if name not in FRAME_CODECS:
+            raise ValueError(f"Unknown frame codec {name}, expected one of "
+                             f"{list(FRAME_CODECS)}")
+        codec_class = FRAME_CODECS[name]
+        _frame_codecs[spec] = codec_class(param) if param else codec_class()
+    return _frame_codecs[spec]
+
+
+def _detect_frame_codec(buf):
+    if bytes(buf[:len(RawCodec.MAGIC)]) == RawCodec.MAGIC:
+        return get_frame_codec("raw")
+    # the other formats are recognized by OpenCV, JPEG is decoded faster
+    # by libjpeg-turbo if it's available
+    if bytes(buf[:2]) == b"\xff\xd8":
+        return get_frame_codec("turbojpeg")
+    return get_frame_codec("jpeg")
+
+
 class FramePayload(Payload):
+    """
+    Keeps a frame in its encoded form, its decoded form or both.
+
+    The frame is decoded only when it's accessed, and the decoded frame is
+    kept so it's decoded once no matter how many times it's accessed. As
+    long as the frame isn't replaced (the payload isn't dirty) encoding it
+    again reuses the encoded frame, so routines that only pass frames on
+    don't pay for encoding or decoding them.
+    """
 
     def __init__(self, data):
+        self.encoded_data = None
+        self.frame = None
+        self.dirty = False
+        # the spec of the codec encoded_data was encoded with, if known
+        self.codec = None
         super().__init__(data)
 
+    @classmethod
+    def from_encoded(cls, encoded_data, codec=None):
+        payload = cls(None)
+        payload.encoded_data = encoded_data
+        payload.codec = codec
+        payload.dirty = False
+        payload.encoded = True
+        return payload
+
+    @property
+    def data(self):
+        return self.encoded_data if self.encoded else self.frame
+
+    @data.setter
+    def data(self, frame):
+        self.frame = frame
+        self.encoded_data = None
+        self.dirty = True
+        self.encoded = False
+
     def decode(self):
-        if isinstance(self.data, str):
-            decoded_img = self._get_frame()
-        else:
-            decoded_img = cv2.imdecode(np.fromstring(self.data,
-                                                     dtype=np.uint8),
-                                       cv2.IMREAD_COLOR)
-        self.data = decoded_img
+        if self.frame is None and self.encoded_data is not None:
+            self.frame = self._decode_frame()
         self.encoded = False
 
-    def encode(self, generator):
-        buf = cv2.imencode('.jpeg', self.data)[1].tobytes()
-        if generator is None:
-            self.data = buf
+    def encode(self, generator, codec=None):
+        """
+        Encodes the frame with the codec described by codec (see
+        get_frame_codec). If codec isn't given, an up to date encoded frame
+        is kept as it is, whatever it was encoded with.
+        """
+        if isinstance(generator, MpSharedMemoryRing):
+            # raw frames are written once into the ring without encoding
+            if self.dirty or \
+                    not isinstance(self.encoded_data, SharedFrameReference):
+                self.decode()
+                self.encoded_data = generator.write_frame(self.frame)
+                self.codec = None
+        elif generator is None:
+            # frames read with the binary wire format are memoryviews of
+            # the received message
+            if not self._is_encoded_with(codec) or \
+                    not isinstance(self.encoded_data,
+                                   (bytes, bytearray, memoryview)):
+                self.encoded_data = self._get_encoded_bytes(codec)
         else:
+            buf = self._get_encoded_bytes(codec)
             memory = generator.get_next_shared_memory(size=len(buf))
-            memory.buf[:] = bytes(buf)
-            self.data = memory.name
+            memory.buf[:] = buf
+            self.encoded_data = memory.name
+        self.dirty = False
         self.encoded = True
 
     def is_empty(self):
-        return self.data is None
+        return self.frame is None and self.encoded_data is None
+
+    def _is_encoded_with(self, codec):
+        return not self.dirty and self.encoded_data is not None and \
+            (codec is None or codec == self.codec)
+
+    def _get_encoded_bytes(self, codec):
+        """
+        Returns the frame encoded with codec, taken from the encoded frame
+        when it's still up to date and encoded only when it isn't.
+        """
+        if self._is_encoded_with(codec):
+            if isinstance(self.encoded_data, (bytes, bytearray, memoryview)):
+                return bytes(self.encoded_data)
+            if isinstance(self.encoded_data, str):
+                buf = self._read_shared_memory()
+                if buf is not None:
+                    return buf
+        self.decode()
+        if self.frame is None:
+            return b""
+        self.codec = codec or DEFAULT_FRAME_CODEC
+        return get_frame_codec(self.codec).encode(self.frame)
+
+    def _decode_frame(self):
+        if isinstance(self.encoded_data, SharedFrameReference):
+            return get_ring_frame(self.encoded_data)
+        if isinstance(self.encoded_data, str):
+            buf = self._read_shared_memory()
+        else:
+            buf = self.encoded_data
+        if not buf:
+            return None
+        return _detect_frame_codec(buf).decode(buf)
 
-    def _get_frame(self):
-        memory = get_shared_memory_object(self.data)
+    def _read_shared_memory(self):
+        memory = get_shared_memory_object(self.encoded_data)
         if memory:
             data = bytes(memory.buf)
             memory.close()
-            frame = np.fromstring(data, dtype=np.uint8)
-            return cv2.imdecode(frame, cv2.IMREAD_COLOR)
+            return data
         return None
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # only the encoded frame is sent when it's up to date
+        if self.encoded_data is not None and not self.dirty:
+            state["frame"] = None
+            state["encoded"] = True
+        if isinstance(self.encoded_data, memoryview):
+            state["encoded_data"] = bytes(self.encoded_data)
+        return state
+
 
 class PredictionPayload(Payload):
     def __init__(self, data):
         super().__init__(data)
 
     def decode(self):
-        pass
+        # only the binary wire format leaves the payload encoded, as a
+        # description of the instances' fields holding numpy arrays
+        if not self.encoded:
+            return
+        import torch
+        from pipert.utils.structures import Instances, Boxes, Keypoints
+        field_types = {"boxes": Boxes, "keypoints": Keypoints}
+        instances = Instances(self.data["image_size"])
+        for name, (kind, value) in self.data["fields"].items():
+            if kind == "object":
+                instances.set(name, value)
+                continue
+            value = torch.from_numpy(np.array(value))
+            if kind in field_types:
+                value = field_types[kind](value)
+            instances.set(name, value)
+        self.data = instances
+        self.encoded = False
 
-    def encode(self, generator):
+    def encode(self, generator, codec=None):
         pass
 
     def is_empty(self):
+        if self.encoded:
+            fields = self.data["fields"]
+            return "pred_boxes" not in fields or \
+                not len(fields["pred_boxes"][1])
         if not self.data.has("pred_boxes") or not self.data.pred_boxes:
             return True
         else:
             return False
 
 
+HOST_NAME = socket.gethostname()
+# the offset of this process' wall clock from the host's monotonic clock
+_CLOCK_ANCHOR_NS = time.time_ns() - time.monotonic_ns()
+
+
+class MessageIdAllocator:
+    """
+    Allocates message ids that are unique across the threads and processes
+    of a host. An id is a 63 bit integer made of a node id, the id of the
+    process and a counter:
+
+        | node (9 bits) | pid (22 bits) | counter (32 bits) |
+
+    The counter starts over in a forked process, which gets its own pid,
+    and ids repeat after 2 ** 32 messages of a process.
+
+    Ids are unique across hosts only if every host is given its own node
+    id, between 0 and 511, with the node_id argument or the PIPERT_NODE_ID
+    environment variable. Otherwise the node id is a hash of the host name,
+    so two hosts share it with a probability of 1/512 (and among 27 hosts
+    some two share it with a probability of about a half), and then the ids
+    of their processes that have the same pid collide.
+    """
+    HOST_BITS, PID_BITS, COUNTER_BITS = 9, 22, 32
+
+    def __init__(self, node_id=None):
+        if node_id is None:
+            node_id = os.environ.get("PIPERT_NODE_ID")
+        if node_id is None:
+            node_id = zlib.crc32(HOST_NAME.encode()) & ((1 << self.HOST_BITS) - 1)
+        node_id = int(node_id)
+        if not 0 <= node_id < 1 << self.HOST_BITS:
+            raise ValueError(f"A node id must be between 0 and {(1 << self.HOST_BITS) - 1}, got {node_id}")
+        self.node_id = node_id
+        self.reset()
+
+    def reset(self):
+        pid = os.getpid() & ((1 << self.PID_BITS) - 1)
+        self.prefix = ((self.node_id << self.PID_BITS) | pid) << self.COUNTER_BITS
+        self.counter = 0
+        # a lock held by another thread at fork time is never released in
+        # the child
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            counter = self.counter
+            self.counter = (counter + 1) & ((1 << self.COUNTER_BITS) - 1)
+        return self.prefix | counter
+
+    @classmethod
+    def split(cls, msg_id):
+        """
+        Returns the (node id, pid, counter) an id is made of.
+        """
+        counter = msg_id & ((1 << cls.COUNTER_BITS) - 1)
+        pid = (msg_id >> cls.COUNTER_BITS) & ((1 << cls.PID_BITS) - 1)
+        host = msg_id >> (cls.COUNTER_BITS + cls.PID_BITS)
+        return host, pid, counter
+
+
+message_ids = MessageIdAllocator()
+os.register_at_fork(after_in_child=message_ids.reset)
+
+
+class MessageHistory:
+    """
+    The timestamps of the events a message went through in every component
+    (stage) it passed. Each record is a (stage index, event index, host
+    index) triple and a timestamp, kept in two flat arrays. The names of the
+    stages and events are stored once per message, "entry" and "exit" are
+    always the first two events.
+
+    Timestamps are taken from the monotonic clock of the host that recorded
+    them, in nanoseconds, so they don't jump when the wall clock is set.
+    The first process of every host that records an event adds the offset
+    between its wall clock and its monotonic clock (its anchor) to the
+    history's host table. Intervals between records of the same host are
+    measured on the monotonic clock alone, records of different hosts are
+    compared through their anchors.
+
+    It can be read like the dictionary it replaces,
+    history[component_name][event] is the event's wall clock time in
+    seconds.
+    """
+    __slots__ = ("stages", "events", "hosts", "anchors", "record_keys",
+                 "times")
+    KEY_SIZE = 3
+
+    def __init__(self):
+        self.stages = []
+        self.events = ["entry", "exit"]
+        self.hosts = []
+        self.anchors = array("q")
+        self.record_keys = array("H")
+        self.times = array("q")
+
+    def record(self, stage, event, timestamp_ns=None):
+        """
+        Records that the message reached event in stage, now or at the wall
+        clock time given in nanoseconds.
+        """
+        if timestamp_ns is None:
+            host = self._host_index(HOST_NAME, _CLOCK_ANCHOR_NS)
+            timestamp_ns = time.monotonic_ns()
+        else:
+            # wall clock times are kept as if they came from a host whose
+            # monotonic clock is the wall clock
+            host = self._host_index("", 0)
+        self.record_keys.extend((self._index(self.stages, stage),
+                                 self._index(self.events, event),
+                                 host))
+        self.times.append(timestamp_ns)
+
+    def get_ns(self, stage, event):
+        """
+        Returns the wall clock time in nanoseconds of the latest record of
+        event in stage, or None if there is no such record.
+        """
+        record = self._find(stage, event)
+        if record is None:
+            return None
+        return self._wall_clock_ns(record)
+
+    def get_interval_ns(self, start, end):
+        """
+        Returns the nanoseconds between two records, each given as a
+        (stage, event) pair, or None if one of them is missing.
+        """
+        start, end = self._find(*start), self._find(*end)
+        if start is None or end is None:
+            return None
+        if self._host(start) == self._host(end):
+            return self.times[end] - self.times[start]
+        return self._wall_clock_ns(end) - self._wall_clock_ns(start)
+
+    def has(self, stage, event):
+        return self._find(stage, event) is not None
+
+    def to_dict(self):
+        history = {}
+        for record in range(len(self.times)):
+            stage = self.stages[self.record_keys[self.KEY_SIZE * record]]
+            event = self.events[self.record_keys[self.KEY_SIZE * record + 1]]
+            history.setdefault(stage, {})[event] = \
+                self._wall_clock_ns(record) / 1e9
+        return history
+
+    @classmethod
+    def from_dict(cls, history_dict):
+        history = cls()
+        for stage, events in history_dict.items():
+            for event, timestamp in events.items():
+                history.record(stage, event, int(timestamp * 1e9))
+        return history
+
+    def _find(self, stage, event):
+        if stage not in self.stages or event not in self.events:
+            return None
+        stage_index = self.stages.index(stage)
+        event_index = self.events.index(event)
+        keys = self.record_keys
+        for record in range(len(self.times) - 1, -1, -1):
+            if keys[self.KEY_SIZE * record] == stage_index and \
+                    keys[self.KEY_SIZE * record + 1] == event_index:
+                return record
+        return None
+
+    def _host(self, record):
+        return self.record_keys[self.KEY_SIZE * record + 2]
+
+    def _wall_clock_ns(self, record):
+        return self.times[record] + self.anchors[self._host(record)]
+
+    def _host_index(self, host, anchor_ns):
+        try:
+            return self.hosts.index(host)
+        except ValueError:
+            self.hosts.append(host)
+            self.anchors.append(anchor_ns)
+            return len(self.hosts) - 1
+
+    def __getitem__(self, stage):
+        return self.to_dict().get(stage, {})
+
+    def __contains__(self, stage):
+        return stage in self.stages
+
+    def __iter__(self):
+        return iter(self.stages)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def keys(self):
+        return list(self.stages)
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __eq__(self, other):
+        if isinstance(other, MessageHistory):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __getstate__(self):
+        return self.stages, self.events, self.hosts, self.anchors.tobytes(), \
+            self.record_keys.tobytes(), self.times.tobytes()
+
+    def __setstate__(self, state):
+        self.stages, self.events, self.hosts, anchors, keys, times = state
+        self.anchors = array("q", anchors)
+        self.record_keys = array("H", keys)
+        self.times = array("q", times)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    @staticmethod
+    def _index(names, name):
+        try:
+            return names.index(name)
+        except ValueError:
+            names.append(name)
+            return len(names) - 1
+
+
 class Message:
-    counter = 0
+    __slots__ = ("payload", "source_address", "history", "reached_exit", "id",
+                 "skipped_frames")
 
     def __init__(self, data, source_address):
         if isinstance(data, np.ndarray):
@@ -93,15 +582,16 @@ class Message:
         else:
             self.payload = PredictionPayload(data)
         self.source_address = source_address
-        self.history = collections.defaultdict(dict)  # TODO: Maybe use OrderedDict?
+        self.history = MessageHistory()
         self.reached_exit = False
-        self.id = f"{self.source_address}_{Message.counter}"
-        Message.counter += 1
+        self.id = message_ids.next_id()
+        # the number of frames of the source that were skipped right before
+        # this one by sampling policies, see pipert.core.sampling
+        self.skipped_frames = 0
 
     def update_payload(self, data):
-        if self.payload.encoded:
-            self.payload.decode()
         self.payload.data = data
+        self.payload.encoded = False
 
     def get_payload(self):
         if self.payload.encoded:
@@ -120,7 +610,7 @@ class Message:
             component_name: the name of the component that the message entered.
             logger: the logger object of the component's input routine.
         """
-        self.history[component_name]["entry"] = time.time()
+        self.history.record(component_name, "entry")
         logger.debug("Received the following message: %s", str(self))
 
     def record_custom(self, component_name, section):
@@ -133,7 +623,7 @@ class Message:
             section: the name of the section within the component that the
             message entered.
         """
-        self.history[component_name][section] = time.time()
+        self.history.record(component_name, section)
 
     def record_exit(self, component_name, logger):
         """
@@ -145,8 +635,8 @@ class Message:
             component_name: the name of the component that the message exited.
             logger: the logger object of the component's output routine.
         """
-        if "exit" not in self.history[component_name]:
-            self.history[component_name]["exit"] = time.time()
+        if not self.history.has(component_name, "exit"):
+            self.history.record(component_name, "exit")
             if component_name == "FlaskVideoDisplay" or component_name == "VideoWriter":
                 logger.debug("The following message has reached the exit: %s", str(self))
                 self.reached_exit = True
@@ -164,11 +654,10 @@ class Message:
         Args:
             component_name: the name of the relevant component.
         """
-        if component_name in self.history and \
-                'entry' in self.history[component_name] and \
-                'exit' in self.history[component_name]:
-            return self.history[component_name]['exit'] - \
-                self.history[component_name]['entry']
+        latency = self.history.get_interval_ns((component_name, "entry"),
+                                               (component_name, "exit"))
+        if latency is not None:
+            return latency / 1e9
         else:
             return None
 
@@ -180,10 +669,11 @@ class Message:
             output_component: the name of the pipeline's output component.
         """
         if output_component in self.history and self.reached_exit:
-            try:
-                return self.history[output_component]['exit'] - self.history['VideoCapture']['entry']
-            except KeyError:
+            latency = self.history.get_interval_ns(("VideoCapture", "entry"),
+                                                   (output_component, "exit"))
+            if latency is None:
                 return None
+            return latency / 1e9
         else:
             return None
 
@@ -199,34 +689,176 @@ class Message:
                f"history: {self.history} \n"
 
 
-def message_encode(msg, generator=None):
+class WireFormat(ABC):
+    """
+    Serializes messages, after their payload was encoded, into the bytes that
+    are sent to the message broker.
+    """
+
+    @abstractmethod
+    def dumps(self, msg):
+        pass
+
+    @abstractmethod
+    def loads(self, encoded_msg):
+        pass
+
+
+class PickleWireFormat(WireFormat):
+    """
+    Pickles the whole message object.
+    """
+
+    def dumps(self, msg):
+        return pickle.dumps(msg)
+
+    def loads(self, encoded_msg):
+        return pickle.loads(encoded_msg)
+
+
+class BinaryWireFormat(WireFormat):
+    """
+    Serializes a message into a versioned binary layout:
+
+        header    magic, version, payload kind, number of buffers and the
+                  length of the metadata section.
+        lengths   the length of each of the buffers.
+        metadata  the message fields and a description of the payload,
+                  pickled with protocol 5.
+        buffers   the raw payload buffers (encoded frames and numpy arrays),
+                  carried out-of-band so they are never copied into pickle.
+
+    Predictions are described by their image size and their fields as numpy
+    arrays, so decoding them doesn't import torch, the instances are only
+    rebuilt once the payload is accessed.
+    """
+    MAGIC = b"PRTW"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBBHI")
+    FRAME = 0
+    PREDICTION = 1
+
+    def dumps(self, msg):
+        codec = None
+        if isinstance(msg.payload, FramePayload):
+            kind = self.FRAME
+            codec = msg.payload.codec
+            payload = msg.payload.data
+            if isinstance(payload, (bytes, bytearray, memoryview)):
+                payload = pickle.PickleBuffer(payload)
+        else:
+            kind = self.PREDICTION
+            payload = self._describe_instances(msg.payload.data)
+
+        metadata = {
+            "id": msg.id,
+            "source_address": msg.source_address,
+            "history": msg.history,
+            "reached_exit": msg.reached_exit,
+            "skipped_frames": msg.skipped_frames,
+            "codec": codec,
+            "payload": payload
+        }
+        buffers = []
+        metadata = pickle.dumps(metadata, protocol=5,
+                                buffer_callback=buffers.append)
+        buffers = [buffer.raw() for buffer in buffers]
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, kind,
+                                  len(buffers), len(metadata))
+        lengths = struct.pack(f"<{len(buffers)}Q",
+                              *[buffer.nbytes for buffer in buffers])
+        return b"".join([header, lengths, metadata, *buffers])
+
+    def loads(self, encoded_msg):
+        view = memoryview(encoded_msg)
+        magic, version, kind, buffer_count, metadata_length = \
+            self.HEADER.unpack_from(view)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Unsupported wire format version {version}")
+        offset = self.HEADER.size
+        lengths = struct.unpack_from(f"<{buffer_count}Q", view, offset)
+        offset += 8 * buffer_count
+        metadata = view[offset:offset + metadata_length]
+        offset += metadata_length
+        buffers = []
+        for length in lengths:
+            buffers.append(view[offset:offset + length])
+            offset += length
+        metadata = pickle.loads(metadata, buffers=buffers)
+
+        msg = Message.__new__(Message)
+        if kind == self.FRAME:
+            msg.payload = FramePayload.from_encoded(metadata["payload"],
+                                                    metadata.get("codec"))
+        else:
+            msg.payload = PredictionPayload(metadata["payload"])
+            msg.payload.encoded = True
+        msg.source_address = metadata["source_address"]
+        msg.history = metadata["history"]
+        msg.reached_exit = metadata["reached_exit"]
+        msg.id = metadata["id"]
+        msg.skipped_frames = metadata.get("skipped_frames", 0)
+        return msg
+
+    @staticmethod
+    def _describe_instances(instances):
+        import torch
+        from pipert.utils.structures import Boxes, Keypoints
+        fields = {}
+        for name, value in instances.get_fields().items():
+            if isinstance(value, Boxes):
+                fields[name] = ("boxes", value.tensor.cpu().numpy())
+            elif isinstance(value, Keypoints):
+                fields[name] = ("keypoints", value.tensor.cpu().numpy())
+            elif isinstance(value, torch.Tensor):
+                fields[name] = ("tensor", value.cpu().numpy())
+            else:
+                fields[name] = ("object", value)
+        return {"image_size": tuple(instances.image_size), "fields": fields}
+
+
+WIRE_FORMATS = {
+    "pickle": PickleWireFormat(),
+    "binary": BinaryWireFormat()
+}
+
+
+def message_encode(msg, generator=None, wire_format="pickle", codec=None):
     """
     Encodes the message object.
 
     This method compresses the message payload and then serializes the whole
-    message object into bytes, using pickle.
+    message object into bytes, using the given wire format.
 
     Args:
         msg: the message to encode.
         generator: generator necessary for shared memory usage.
+        wire_format: the name of the wire format to serialize with, one of
+        WIRE_FORMATS.
+        codec: the codec frames are encoded with, see get_frame_codec. If
+        not given, frames that are already encoded are sent as they are and
+        others are encoded with DEFAULT_FRAME_CODEC.
     """
-    msg.payload.encode(generator)
-    return pickle.dumps(msg)
+    msg.payload.encode(generator, codec)
+    return WIRE_FORMATS[wire_format].dumps(msg)
 
 
 def message_decode(encoded_msg, lazy=False):
     """
     Decodes the message object.
 
-    This method deserializes the pickled message, and decodes the message
-    payload if 'lazy' is False.
+    This method deserializes the message, detecting the wire format it was
+    serialized with, and decodes the message payload if 'lazy' is False.
 
     Args:
         encoded_msg: the message to decode.
         lazy: if this is True, then the payload will only be decoded once it's
         accessed.
     """
-    msg = pickle.loads(encoded_msg)
+    if encoded_msg[:len(BinaryWireFormat.MAGIC)] == BinaryWireFormat.MAGIC:
+        msg = WIRE_FORMATS["binary"].loads(encoded_msg)
+    else:
+        msg = WIRE_FORMATS["pickle"].loads(encoded_msg)
     if not lazy:
         msg.payload.decode()
     return msg
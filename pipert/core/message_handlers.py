@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 import redis
+import redis.asyncio
 
 
 class MessageHandler(ABC):
@@ -16,7 +17,7 @@ class MessageHandler(ABC):
         pass
 
     @abstractmethod
-    def read_next_msg(self, in_key):
+    def read_next_msg(self, in_key, block_ms=None):
         """
         Reads the following message from the one that was last read,
         if no message has been read before,
@@ -26,11 +27,13 @@ class MessageHandler(ABC):
         Args:
             in_key: the name of the queue/stream at which the relevant message
             is located.
+            block_ms: if given, the number of milliseconds to wait for a new
+            message when there is none.
         """
         pass
 
     @abstractmethod
-    def read_most_recent_msg(self, in_key):
+    def read_most_recent_msg(self, in_key, block_ms=None):
         """
         Reads the latest message in the message broker,
         cannot read the same message twice.
@@ -38,9 +41,92 @@ class MessageHandler(ABC):
         Args:
             in_key: the name of the queue/stream at which the relevant message
             is located.
+            block_ms: if given, the number of milliseconds to wait for a new
+            message when there is none.
         """
         pass
 
+    def read_batch(self, in_key, max_count, block_ms=None):
+        """
+        Reads up to max_count messages that follow the one that was last
+        read, in the same way read_next_msg does. Returns a list of
+        messages, which is empty if there are no new messages.
+
+        Args:
+            in_key: the name of the queue/stream at which the relevant
+            messages are located.
+            max_count: the maximal number of messages to read.
+            block_ms: if given and not 0, the number of milliseconds to
+            wait for new messages when there are none.
+        """
+        msgs = []
+        for _ in range(max_count):
+            msg = self.read_next_msg(in_key)
+            if msg is None:
+                break
+            msgs.append(msg)
+        return msgs
+
+    def join_group(self, in_key, group, consumer):
+        """
+        Joins a consumer group on a queue/stream, creating both if they do
+        not exist yet. The consumers of a group split the messages between
+        them, so every message is handed to only one of them.
+
+        Args:
+            in_key: the name of the queue/stream to consume.
+            group: the name of the consumer group.
+            consumer: a name that identifies this consumer inside the group.
+        """
+        raise NotImplementedError
+
+    def read_group(self, in_key, group, consumer, max_count=1, block_ms=None):
+        """
+        Reads up to max_count messages that were not handed to any consumer
+        of the group yet. The messages stay pending until they are
+        acknowledged with ack. Returns a list of (message id, message)
+        pairs, which is empty if there are no new messages.
+
+        Args:
+            in_key: the name of the queue/stream at which the relevant
+            messages are located.
+            group: the name of the consumer group.
+            consumer: the name of this consumer inside the group.
+            max_count: the maximal number of messages to read.
+            block_ms: if given and not 0, the number of milliseconds to
+            wait for new messages when there are none.
+        """
+        raise NotImplementedError
+
+    def ack(self, in_key, group, *msg_ids):
+        """
+        Marks messages that were read with read_group as processed.
+
+        Args:
+            in_key: the name of the queue/stream the messages were read from.
+            group: the name of the consumer group.
+            msg_ids: the ids of the processed messages.
+        """
+        raise NotImplementedError
+
+    def claim_stale(self, in_key, group, consumer, min_idle_ms, max_count=1):
+        """
+        Takes over messages that were read by another consumer of the group
+        but were not acknowledged for at least min_idle_ms, which happens
+        when that consumer died. Returns a list of (message id, message)
+        pairs like read_group.
+
+        Args:
+            in_key: the name of the queue/stream at which the relevant
+            messages are located.
+            group: the name of the consumer group.
+            consumer: the name of the consumer that takes the messages over.
+            min_idle_ms: how long a message has to be pending before it is
+            considered abandoned.
+            max_count: the maximal number of messages to claim.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def send(self, out_key, msg):
         """
@@ -53,6 +139,29 @@ class MessageHandler(ABC):
         """
         pass
 
+    def send_many(self, out_key, msgs):
+        """
+        Sends several messages to the message broker, in order.
+
+        Args:
+            out_key: the name of the queue/stream at which the messages will
+            be placed.
+            msgs: the message objects that are being sent.
+        """
+        for msg in msgs:
+            self.send(out_key, msg)
+
+    def send_to_keys(self, entries):
+        """
+        Sends messages to several queues/streams, in order.
+
+        Args:
+            entries: pairs of the name of the queue/stream at which a
+            message will be placed and the message object.
+        """
+        for out_key, msg in entries:
+            self.send(out_key, msg)
+
     @abstractmethod
     def connect(self):
         """
@@ -74,31 +183,39 @@ class RedisHandler(MessageHandler):
         self.conn = None
         self.url = url
         self.maxlen = maxlen
-        self.last_msg_id = None
+        # the id of the last message that was read from each stream
+        self.last_msg_ids = {}
         self.connect()
 
-    def read_next_msg(self, in_key):
+    def read_next_msg(self, in_key, block_ms=None):
+        if block_ms:
+            return self._wait_for_next_msg(in_key, block_ms)
         return self._read_from_redis_using_method(
             in_key=in_key,
             reading_method=self.conn.xrange,
             name=in_key,
             count=1,
-            min=self._add_offset_to_stream_id(self.last_msg_id, 1)
+            min=self._add_offset_to_stream_id(self.last_msg_ids.get(in_key), 1)
         )
 
-    def read_most_recent_msg(self, in_key):
-        return self._read_from_redis_using_method(
+    def read_most_recent_msg(self, in_key, block_ms=None):
+        msg = self._read_from_redis_using_method(
             in_key=in_key,
             reading_method=self.conn.xrevrange,
             name=in_key,
             count=1,
-            min=self._add_offset_to_stream_id(self.last_msg_id, 1)
+            min=self._add_offset_to_stream_id(self.last_msg_ids.get(in_key), 1)
         )
+        if msg is None and block_ms:
+            # the stream has nothing new, so the next message to arrive
+            # is also the most recent one
+            msg = self._wait_for_next_msg(in_key, block_ms)
+        return msg
 
     def receive(self, in_key):
-        # Need to set value in last_msg_id so
+        # Need to set value in last_msg_ids so
         # _read_from_redis_using_method will not cause an infinite loop
-        self.last_msg_id = ""
+        self.last_msg_ids[in_key] = ""
         msg = self._read_from_redis_using_method(
             in_key,
             self.conn.xrevrange,
@@ -106,31 +223,94 @@ class RedisHandler(MessageHandler):
             count=1
         )
         if msg is None:
-            self.last_msg_id = None
+            del self.last_msg_ids[in_key]
 
         return msg
 
+    def read_batch(self, in_key, max_count, block_ms=None):
+        if in_key not in self.last_msg_ids:
+            msg = self.receive(in_key)
+            if msg is not None:
+                return [msg]
+        # "$" stands for messages that arrive after the call
+        last_msg_id = self.last_msg_ids.get(in_key, "$")
+        # BLOCK 0 waits forever, so 0 doesn't wait at all, like None
+        response = self.conn.xread({in_key: last_msg_id},
+                                   count=max_count,
+                                   block=block_ms or None)
+        if not response:
+            return []
+        entries = response[0][1]
+        self.last_msg_ids[in_key] = entries[-1][0].decode()
+        return [fields["msg".encode("utf-8")] for _, fields in entries]
+
+    def _wait_for_next_msg(self, in_key, block_ms):
+        msgs = self.read_batch(in_key, 1, block_ms)
+        return msgs[0] if msgs else None
+
     def _read_from_redis_using_method(self,
                                       in_key,
                                       reading_method,
                                       **method_args):
-        if self.last_msg_id is None:
+        if in_key not in self.last_msg_ids:
             return self.receive(in_key)
         redis_msg = reading_method(**method_args)
 
         if not redis_msg:
             return None
-        self.last_msg_id = redis_msg[0][0].decode()
+        self.last_msg_ids[in_key] = redis_msg[0][0].decode()
         msg = redis_msg[0][1]["msg".encode("utf-8")]
 
         return msg
 
+    def join_group(self, in_key, group, consumer):
+        try:
+            # "$" makes a new group start with the messages that arrive
+            # from now on
+            self.conn.xgroup_create(in_key, group, id="$", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self.conn.xgroup_createconsumer(in_key, group, consumer)
+
+    def read_group(self, in_key, group, consumer, max_count=1, block_ms=None):
+        response = self.conn.xreadgroup(group, consumer, {in_key: ">"},
+                                        count=max_count,
+                                        block=block_ms or None)
+        if not response:
+            return []
+        return self._unpack_entries(response[0][1])
+
+    def ack(self, in_key, group, *msg_ids):
+        if msg_ids:
+            self.conn.xack(in_key, group, *msg_ids)
+
+    def claim_stale(self, in_key, group, consumer, min_idle_ms, max_count=1):
+        response = self.conn.xautoclaim(in_key, group, consumer,
+                                        min_idle_time=min_idle_ms,
+                                        start_id="0-0",
+                                        count=max_count)
+        return self._unpack_entries(response[1])
+
     def send(self, out_key, msg):
         fields = {
             "msg": msg
         }
         _ = self.conn.xadd(out_key, fields, maxlen=self.maxlen)
 
+    def send_many(self, out_key, msgs):
+        # all the messages are sent in a single round trip
+        pipe = self.conn.pipeline(transaction=False)
+        for msg in msgs:
+            pipe.xadd(out_key, {"msg": msg}, maxlen=self.maxlen)
+        pipe.execute()
+
+    def send_to_keys(self, entries):
+        pipe = self.conn.pipeline(transaction=False)
+        for out_key, msg in entries:
+            pipe.xadd(out_key, {"msg": msg}, maxlen=self.maxlen)
+        pipe.execute()
+
     def connect(self):
         self.conn = redis.Redis(host=self.url.hostname, port=self.url.port)
         if not self.conn.ping():
@@ -139,6 +319,13 @@ class RedisHandler(MessageHandler):
     def close(self):
         self.conn.close()
 
+    @staticmethod
+    def _unpack_entries(entries):
+        # entries that were trimmed from the stream while pending are
+        # returned without their fields
+        return [(msg_id.decode(), fields["msg".encode("utf-8")])
+                for msg_id, fields in entries if fields]
+
     @staticmethod
     def _add_offset_to_stream_id(stream_id, offset):
         if stream_id is None:
@@ -147,3 +334,128 @@ class RedisHandler(MessageHandler):
         last_msg_id_to_read = '-'.join([fixed_id[0],
                                         str(int(fixed_id[1]) + offset)])
         return last_msg_id_to_read
+
+
+class AsyncRedisHandler:
+    """
+    The asyncio version of RedisHandler, for routines that run as
+    coroutines. It has the same methods, as coroutine functions, and the
+    connection is only established when connect is awaited.
+    """
+
+    def __init__(self, url, maxlen=100):
+        self.conn = None
+        self.url = url
+        self.maxlen = maxlen
+        # the id of the last message that was read from each stream
+        self.last_msg_ids = {}
+
+    async def read_next_msg(self, in_key, block_ms=None):
+        if in_key not in self.last_msg_ids:
+            msg = await self.receive(in_key)
+            if msg is None and block_ms:
+                # the stream is empty, so it's waited on like the sync
+                # handler does instead of returning at once
+                msg = await self._wait_for_next_msg(in_key, block_ms)
+            return msg
+        if block_ms:
+            return await self._wait_for_next_msg(in_key, block_ms)
+        response = await self.conn.xrange(
+            in_key,
+            min=RedisHandler._add_offset_to_stream_id(self.last_msg_ids[in_key], 1),
+            count=1)
+        return self._get_last_msg(in_key, response)
+
+    async def read_most_recent_msg(self, in_key, block_ms=None):
+        if in_key not in self.last_msg_ids:
+            msg = await self.receive(in_key)
+        else:
+            response = await self.conn.xrevrange(
+                in_key,
+                min=RedisHandler._add_offset_to_stream_id(self.last_msg_ids[in_key], 1),
+                count=1)
+            msg = self._get_last_msg(in_key, response)
+        if msg is None and block_ms:
+            msg = await self._wait_for_next_msg(in_key, block_ms)
+        return msg
+
+    async def receive(self, in_key):
+        response = await self.conn.xrevrange(in_key, count=1)
+        return self._get_last_msg(in_key, response)
+
+    async def read_batch(self, in_key, max_count, block_ms=None):
+        if in_key not in self.last_msg_ids:
+            msg = await self.receive(in_key)
+            if msg is not None:
+                return [msg]
+        last_msg_id = self.last_msg_ids.get(in_key, "$")
+        response = await self.conn.xread({in_key: last_msg_id},
+                                         count=max_count,
+                                         block=block_ms or None)
+        if not response:
+            return []
+        entries = response[0][1]
+        self.last_msg_ids[in_key] = entries[-1][0].decode()
+        return [fields["msg".encode("utf-8")] for _, fields in entries]
+
+    async def _wait_for_next_msg(self, in_key, block_ms):
+        msgs = await self.read_batch(in_key, 1, block_ms)
+        return msgs[0] if msgs else None
+
+    def _get_last_msg(self, in_key, response):
+        if not response:
+            return None
+        self.last_msg_ids[in_key] = response[0][0].decode()
+        return response[0][1]["msg".encode("utf-8")]
+
+    async def join_group(self, in_key, group, consumer):
+        try:
+            await self.conn.xgroup_create(in_key, group, id="$", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        await self.conn.xgroup_createconsumer(in_key, group, consumer)
+
+    async def read_group(self, in_key, group, consumer, max_count=1, block_ms=None):
+        response = await self.conn.xreadgroup(group, consumer, {in_key: ">"},
+                                              count=max_count,
+                                              block=block_ms or None)
+        if not response:
+            return []
+        return RedisHandler._unpack_entries(response[0][1])
+
+    async def ack(self, in_key, group, *msg_ids):
+        if msg_ids:
+            await self.conn.xack(in_key, group, *msg_ids)
+
+    async def claim_stale(self, in_key, group, consumer, min_idle_ms, max_count=1):
+        response = await self.conn.xautoclaim(in_key, group, consumer,
+                                              min_idle_time=min_idle_ms,
+                                              start_id="0-0",
+                                              count=max_count)
+        return RedisHandler._unpack_entries(response[1])
+
+    async def send(self, out_key, msg):
+        await self.conn.xadd(out_key, {"msg": msg}, maxlen=self.maxlen)
+
+    async def send_many(self, out_key, msgs):
+        pipe = self.conn.pipeline(transaction=False)
+        for msg in msgs:
+            pipe.xadd(out_key, {"msg": msg}, maxlen=self.maxlen)
+        await pipe.execute()
+
+    async def send_to_keys(self, entries):
+        pipe = self.conn.pipeline(transaction=False)
+        for out_key, msg in entries:
+            pipe.xadd(out_key, {"msg": msg}, maxlen=self.maxlen)
+        await pipe.execute()
+
+    async def connect(self):
+        self.conn = redis.asyncio.Redis(host=self.url.hostname, port=self.url.port)
+        if not await self.conn.ping():
+            raise Exception('Redis unavailable')
+
+    async def close(self):
+        # close was renamed to aclose in redis-py 5
+        close = getattr(self.conn, "aclose", self.conn.close)
+        await close()
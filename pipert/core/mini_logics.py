@@ -1,5 +1,8 @@
+import asyncio
+import os
+import socket
 import time
-from pipert.core.message_handlers import RedisHandler
+from pipert.core.message_handlers import RedisHandler, AsyncRedisHandler
 from pipert.core.message import message_decode, message_encode, FramePayload
 from pipert.core.routine import Routine
 from pipert.core import QueueHandler
@@ -8,27 +11,43 @@ from pipert.core import QueueHandler
 # TODO: add Error handling to connection
 class Message2Redis(Routine):
 
-    def __init__(self, out_key, url, queue, maxlen, *args, **kwargs):
+    def __init__(self, out_key, url, queue, maxlen, wire_format="pickle", batch_size=1, codec=None,
+                 batch_wait_ms=0, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.out_key = out_key
         self.url = url
         self.q_handler = QueueHandler(queue)
         self.maxlen = maxlen
+        self.wire_format = wire_format
+        self.batch_size = batch_size
+        # how long to wait for a full batch, by default whatever is already
+        # waiting in the queue is sent
+        self.batch_wait_ms = batch_wait_ms
+        self.codec = codec
         self.msg_handler = None
+        self.input_queues = [self.q_handler]
 
     def main_logic(self, *args, **kwargs):
-        msg = self.q_handler.non_blocking_get()
-        if msg:
-            msg.record_exit(self.component_name, self.logger)
-            if self.use_memory and isinstance(msg.payload, FramePayload):
-                encoded_msg = message_encode(msg,
-                                             generator=self.generator)
-            else:
-                encoded_msg = message_encode(msg)
-            self.msg_handler.send(self.out_key, encoded_msg)
-            return True
-        else:
+        msgs = [self._encode(msg) for msg in
+                self.q_handler.get_batch(self.batch_size, self.batch_wait_ms / 1000)]
+        if not msgs:
             return False
+        if len(msgs) == 1:
+            self.msg_handler.send(self.out_key, msgs[0])
+        else:
+            self.msg_handler.send_many(self.out_key, msgs)
+        return True
+
+    def _encode(self, msg):
+        msg.record_exit(self.component_name, self.logger)
+        if self.use_memory and isinstance(msg.payload, FramePayload):
+            return message_encode(msg,
+                                  generator=self.generator,
+                                  wire_format=self.wire_format,
+                                  codec=self.codec)
+        else:
+            return message_encode(msg, wire_format=self.wire_format,
+                                  codec=self.codec)
 
     def setup(self, *args, **kwargs):
         self.msg_handler = RedisHandler(self.url, self.maxlen)
@@ -37,33 +56,129 @@ class Message2Redis(Routine):
     def cleanup(self, *args, **kwargs):
         self.msg_handler.close()
 
+    @staticmethod
+    def get_constructor_parameters():
+        dicts = Routine.get_constructor_parameters()
+        dicts.update({
+            "out_key": "String",
+            "url": "String",
+            "queue": "QueueIn",
+            "maxlen": "Integer",
+            "wire_format": "String",
+            "batch_size": "Integer",
+            "codec": "String",
+            "batch_wait_ms": "Integer"
+        })
+        return dicts
+
+    def does_routine_use_queue(self, queue):
+        return self.q_handler.q == queue
+
+
+class MultiKeyMessage2Redis(Message2Redis):
+    """
+    Message2Redis for a queue of (out_key, message) pairs, it sends every
+    batch of messages to their own streams in a single round trip.
+    """
+
+    def __init__(self, url, queue, maxlen, *args, **kwargs):
+        super().__init__(None, url, queue, maxlen, *args, **kwargs)
+
+    def main_logic(self, *args, **kwargs):
+        entries = [(out_key, self._encode(msg)) for out_key, msg in
+                   self.q_handler.get_batch(self.batch_size, self.batch_wait_ms / 1000)]
+        if not entries:
+            return False
+        self.msg_handler.send_to_keys(entries)
+        return True
+
+    @staticmethod
+    def get_constructor_parameters():
+        dicts = Message2Redis.get_constructor_parameters()
+        del dicts["out_key"]
+        return dicts
+
 
 class MessageFromRedis(Routine):
 
-    def __init__(self, in_key, url, queue, most_recent=True, *args, **kwargs):
+    def __init__(self, in_key, url, queue, most_recent=True, batch_size=1, block_ms=100,
+                 group=None, consumer=None, min_idle_ms=30000, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.in_key = in_key
         self.url = url
         self.q_handler = QueueHandler(queue)
         self.msg_handler = None
-        self.most_recent = most_recent
+        # the messages of a consumer group are split between its consumers,
+        # so each of them reads every message it is handed
+        self.group = group
+        self.consumer = consumer or \
+            f"{socket.gethostname()}-{os.getpid()}-{self.component_name}-{self.name}"
+        # pending messages of a consumer that were not acknowledged for
+        # this long are taken over by the other consumers of the group
+        self.min_idle_ms = min_idle_ms
+        self.next_claim_time = 0
+        self.most_recent = most_recent and group is None
+        # batches are only read when every message is wanted
+        self.batch_size = 1 if self.most_recent else batch_size
+        # how long to wait for new messages before checking the stop event,
+        # None to poll without waiting
+        self.block_ms = block_ms
         self.read_method = None
         self.flip = False
         self.negative = False
 
     def main_logic(self, *args, **kwargs):
-        encoded_msg = self.read_method(self.in_key)
-        if encoded_msg:
-            msg = message_decode(encoded_msg)
-            msg.record_entry(self.component_name, self.logger)
-            success = self.q_handler.deque_non_blocking_put(msg)
+        if self.group is not None:
+            return self._read_from_group()
+        if self.batch_size > 1:
+            encoded_msgs = self.msg_handler.read_batch(self.in_key,
+                                                       self.batch_size,
+                                                       self.block_ms)
+        else:
+            encoded_msg = self.read_method(self.in_key, self.block_ms)
+            encoded_msgs = [encoded_msg] if encoded_msg else []
+        if encoded_msgs:
+            success = True
+            for encoded_msg in encoded_msgs:
+                msg = message_decode(encoded_msg, lazy=True)
+                msg.record_entry(self.component_name, self.logger)
+                success = self.q_handler.deque_non_blocking_put(msg)
             return success
         else:
-            time.sleep(0)
+            if not self.block_ms:
+                time.sleep(0)
             return None
 
+    def _read_from_group(self):
+        entries = []
+        if time.time() >= self.next_claim_time:
+            entries = self.msg_handler.claim_stale(self.in_key, self.group, self.consumer,
+                                                   self.min_idle_ms, self.batch_size)
+            self.next_claim_time = time.time() + self.min_idle_ms / 2000
+        if not entries:
+            entries = self.msg_handler.read_group(self.in_key, self.group, self.consumer,
+                                                  self.batch_size, self.block_ms)
+        if not entries:
+            if not self.block_ms:
+                time.sleep(0)
+            return None
+        for msg_id, encoded_msg in entries:
+            msg = message_decode(encoded_msg, lazy=True)
+            msg.record_entry(self.component_name, self.logger)
+            # wait for room in the queue instead of dropping, a busy
+            # consumer reads less and leaves the messages to the others
+            while not self.q_handler.timeout_put(msg, 0.1):
+                if self.stop_event.is_set():
+                    # the message stays pending and is claimed by another
+                    # consumer later
+                    return False
+            self.msg_handler.ack(self.in_key, self.group, msg_id)
+        return True
+
     def setup(self, *args, **kwargs):
         self.msg_handler = RedisHandler(self.url)
+        if self.group is not None:
+            self.msg_handler.join_group(self.in_key, self.group, self.consumer)
         if self.most_recent:
             self.read_method = self.msg_handler.read_most_recent_msg
         else:
@@ -72,3 +187,110 @@ class MessageFromRedis(Routine):
 
     def cleanup(self, *args, **kwargs):
         self.msg_handler.close()
+
+    @staticmethod
+    def get_constructor_parameters():
+        dicts = Routine.get_constructor_parameters()
+        dicts.update({
+            "in_key": "String",
+            "url": "String",
+            "queue": "QueueOut",
+            "most_recent": "Boolean",
+            "batch_size": "Integer",
+            "block_ms": "Integer",
+            "group": "String",
+            "consumer": "String",
+            "min_idle_ms": "Integer"
+        })
+        return dicts
+
+    def does_routine_use_queue(self, queue):
+        return self.q_handler.q == queue
+
+
+class AsyncMessage2Redis(Message2Redis):
+    """
+    Message2Redis for components that run it with as_coroutine, so the
+    routines sending many streams share a single thread.
+    """
+
+    async def main_logic(self, *args, **kwargs):
+        # waiting for a full batch would block the event loop
+        msgs = [self._encode(msg) for msg in
+                self.q_handler.get_batch(self.batch_size, 0)]
+        if not msgs:
+            return False
+        if len(msgs) == 1:
+            await self.msg_handler.send(self.out_key, msgs[0])
+        else:
+            await self.msg_handler.send_many(self.out_key, msgs)
+        return True
+
+    async def setup(self, *args, **kwargs):
+        self.msg_handler = AsyncRedisHandler(self.url, self.maxlen)
+        await self.msg_handler.connect()
+
+    async def cleanup(self, *args, **kwargs):
+        await self.msg_handler.close()
+
+
+class AsyncMessageFromRedis(MessageFromRedis):
+    """
+    MessageFromRedis for components that run it with as_coroutine, so the
+    routines reading many streams share a single thread.
+    """
+
+    async def main_logic(self, *args, **kwargs):
+        if self.group is not None:
+            return await self._read_from_group()
+        if self.batch_size > 1:
+            encoded_msgs = await self.msg_handler.read_batch(self.in_key,
+                                                             self.batch_size,
+                                                             self.block_ms)
+        else:
+            encoded_msg = await self.read_method(self.in_key, self.block_ms)
+            encoded_msgs = [encoded_msg] if encoded_msg else []
+        if encoded_msgs:
+            success = True
+            for encoded_msg in encoded_msgs:
+                msg = message_decode(encoded_msg, lazy=True)
+                msg.record_entry(self.component_name, self.logger)
+                success = self.q_handler.deque_non_blocking_put(msg)
+            return success
+        else:
+            return None
+
+    async def _read_from_group(self):
+        entries = []
+        if time.time() >= self.next_claim_time:
+            entries = await self.msg_handler.claim_stale(self.in_key, self.group, self.consumer,
+                                                         self.min_idle_ms, self.batch_size)
+            self.next_claim_time = time.time() + self.min_idle_ms / 2000
+        if not entries:
+            entries = await self.msg_handler.read_group(self.in_key, self.group, self.consumer,
+                                                        self.batch_size, self.block_ms)
+        if not entries:
+            return None
+        for msg_id, encoded_msg in entries:
+            msg = message_decode(encoded_msg, lazy=True)
+            msg.record_entry(self.component_name, self.logger)
+            # waiting for room in the queue must not block the event loop
+            while not self.q_handler.non_blocking_put(msg):
+                if self.stop_event.is_set():
+                    return False
+                await asyncio.sleep(self.POLL_INTERVAL)
+            await self.msg_handler.ack(self.in_key, self.group, msg_id)
+        return True
+
+    async def setup(self, *args, **kwargs):
+        self.msg_handler = AsyncRedisHandler(self.url)
+        await self.msg_handler.connect()
+        if self.group is not None:
+            await self.msg_handler.join_group(self.in_key, self.group, self.consumer)
+        if self.most_recent:
+            self.read_method = self.msg_handler.read_most_recent_msg
+        else:
+            self.read_method = self.msg_handler.read_next_msg
+
+    async def cleanup(self, *args, **kwargs):
+        await self.msg_handler.close()
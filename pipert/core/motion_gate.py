@@ -0,0 +1,214 @@
+import cv2
+import numpy as np
+from .message import PredictionPayload
+from .processing_routine import ProcessingRoutine
+from pipert.utils.preprocessing import FramePreprocessor
+
+MOTION_METHODS = ("blocks", "mog2")
+
+
+class MotionDetector:
+    """
+    Tells whether a frame of a single source changed from the source's
+    background, comparing a small grayscale copy of the frame with a
+    background model:
+
+        blocks  a running average of the frames. The frame is split into
+                blocks of block_size pixels, and a block changed when the
+                mean absolute difference of its pixels from the background
+                is above threshold gray levels.
+        mog2    OpenCV's MOG2 background subtractor, a pixel changed when
+                it's a foreground pixel (threshold is its varThreshold).
+
+    A frame has motion when at least min_changed of its blocks (or pixels)
+    changed. The first frame always has motion.
+    """
+    DEFAULT_THRESHOLDS = {"blocks": 12., "mog2": 16.}
+
+    def __init__(self, method="blocks", width=160, threshold=None, min_changed=0.01, block_size=8,
+                 learning_rate=0.05, history=500):
+        """
+        Args:
+            method: the background model, one of MOTION_METHODS.
+            width: the width the frames are scaled down to before they're
+            compared.
+            threshold: the change of a block (or pixel) that counts as a
+            change, see DEFAULT_THRESHOLDS.
+            min_changed: the fraction of changed blocks (or pixels) that
+            counts as motion.
+            learning_rate: how fast the background follows the frames, the
+            weight of a new frame in the background.
+            history: the number of frames the MOG2 model is learned from.
+        """
+        if method not in MOTION_METHODS:
+            raise ValueError(f"Unknown motion detection method {method}, expected one of {list(MOTION_METHODS)}")
+        self.method = method
+        self.width = width
+        self.threshold = self.DEFAULT_THRESHOLDS[method] if threshold is None else threshold
+        self.min_changed = min_changed
+        self.block_size = block_size
+        self.learning_rate = learning_rate
+        self.history = history
+        # the fraction of the last frame that changed
+        self.changed = None
+        self._preprocessor = None
+        self._background = None
+        self._subtractor = None
+
+    def has_motion(self, frame):
+        small = self._scale_down(frame)
+        if self.method == "mog2":
+            if self._subtractor is None:
+                self._subtractor = cv2.createBackgroundSubtractorMOG2(self.history, self.threshold,
+                                                                      detectShadows=False)
+                self._subtractor.apply(small, learningRate=1.)
+                self.changed = 1.
+            else:
+                mask = self._subtractor.apply(small, learningRate=self.learning_rate)
+                self.changed = cv2.countNonZero(mask) / mask.size
+        elif self._background is None:
+            self._background = small.copy()
+            self.changed = 1.
+        else:
+            diff = cv2.absdiff(small, self._background)
+            height, width = diff.shape
+            blocks = cv2.resize(diff, (max(width // self.block_size, 1), max(height // self.block_size, 1)),
+                                interpolation=cv2.INTER_AREA)
+            self.changed = np.count_nonzero(blocks > self.threshold) / blocks.size
+            cv2.accumulateWeighted(small, self._background, self.learning_rate)
+        return self.changed >= self.min_changed
+
+    def _scale_down(self, frame):
+        if self._preprocessor is None:
+            height = max(int(round(frame.shape[0] * self.width / frame.shape[1])), 1)
+            self._preprocessor = FramePreprocessor(
+                (self.width, height), letterbox=False, gray=True, chw=False, pixel_scale=None,
+                dtype=np.uint8 if self.method == "mog2" else np.float32)
+        return self._preprocessor(frame)[..., 0]
+
+
+class MotionGate:
+    """
+    Answers the frames of static sources with the last result of their
+    source instead of processing them again. Every source has its own
+    MotionDetector, and the results are the predictions (e.g. Instances)
+    of the messages that were processed.
+
+    A frame is processed when it has motion, when its source has no result
+    yet, or when refresh_every frames of its source in a row were answered
+    with the last result.
+    """
+
+    def __init__(self, refresh_every=None, **detector_kwargs):
+        """
+        Args:
+            refresh_every: the maximal number of frames of a source in a
+            row that are answered with its last result, None for no limit.
+            **detector_kwargs: the arguments of the sources' MotionDetectors.
+        """
+        self.refresh_every = refresh_every
+        self.detector_kwargs = detector_kwargs
+        self.detectors = {}
+        self.results = {}
+        self.reused = 0
+        self._reused_in_row = {}
+
+    def has_motion(self, msg):
+        """
+        Returns whether the frame of msg changed from its source's
+        background.
+        """
+        detector = self.detectors.get(msg.source_address)
+        if detector is None:
+            detector = MotionDetector(**self.detector_kwargs)
+            self.detectors[msg.source_address] = detector
+        return detector.has_motion(msg.get_payload())
+
+    def reuse_result(self, msg):
+        """
+        Replaces the frame of msg with the last result of its source and
+        returns True if the frame doesn't have to be processed, returns
+        False and leaves msg as it is otherwise.
+        """
+        source = msg.source_address
+        # the background is updated with every frame, even one that is
+        # processed anyway
+        if self.has_motion(msg) or source not in self.results:
+            self._reused_in_row[source] = 0
+            return False
+        reused_in_row = self._reused_in_row.get(source, 0)
+        if self.refresh_every is not None and reused_in_row >= self.refresh_every:
+            self._reused_in_row[source] = 0
+            return False
+        self._reused_in_row[source] = reused_in_row + 1
+        msg.payload = PredictionPayload(self.results[source])
+        self.reused += 1
+        return True
+
+    def remember(self, msg):
+        """
+        Keeps the prediction of msg as the last result of its source.
+        """
+        if isinstance(msg.payload, PredictionPayload):
+            if msg.payload.encoded:
+                msg.payload.decode()
+            self.results[msg.source_address] = msg.payload.data
+
+    def forget(self, source_address=None):
+        """
+        Drops the background models and the results of a source, or of all
+        the sources.
+        """
+        if source_address is None:
+            self.detectors.clear()
+            self.results.clear()
+        else:
+            self.detectors.pop(source_address, None)
+            self.results.pop(source_address, None)
+
+
+class MotionFilter(ProcessingRoutine):
+    """
+    Passes on only the frames that have motion, dropping the frames of
+    static sources. Like a sampling policy, the routine adds the frames it
+    dropped to the skipped_frames of the next message of their source it
+    passes on.
+
+    The background models follow the frames of every source in order, so
+    the routine can't run as a worker pool.
+    """
+
+    def __init__(self, in_queue, out_queue, method="blocks", threshold=None, min_changed=0.01, *args, **kwargs):
+        super().__init__(in_queue, out_queue, *args, **kwargs)
+        self.method = method
+        self.threshold = threshold
+        self.min_changed = min_changed
+        self.motion_detectors = MotionGate(method=method, threshold=threshold, min_changed=min_changed)
+        self._skipped_by_source = {}
+
+    def process(self, msg):
+        source = msg.source_address
+        if self.motion_detectors.has_motion(msg):
+            msg.skipped_frames += self._skipped_by_source.pop(source, 0)
+            return msg
+        # with the frames the message already stands for
+        self._skipped_by_source[source] = self._skipped_by_source.get(source, 0) + 1 + msg.skipped_frames
+        return None
+
+    def setup(self, *args, **kwargs):
+        self.motion_detectors.forget()
+        self._skipped_by_source.clear()
+
+    def as_worker_pool(self, workers=None):
+        raise ValueError("A MotionFilter can't run as a worker pool, as every worker would keep background models "
+                         "of its own")
+
+    @staticmethod
+    def get_constructor_parameters():
+        dicts = ProcessingRoutine.get_constructor_parameters()
+        dicts.update({
+            "method": "String",
+            "threshold": "Float",
+            "min_changed": "Float",
+        })
+        return dicts
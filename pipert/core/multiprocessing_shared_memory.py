@@ -1,4 +1,11 @@
+from collections import namedtuple, deque
+from multiprocessing import resource_tracker
 from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import fcntl
+import os
+import tempfile
+import threading
 
 
 class MemoryIdGenerator:
@@ -32,10 +39,14 @@ class MemoryIdGenerator:
 
 def get_shared_memory_object(name):
     """
-    Returns a SharedMemory object that correlates to the name given.
+    Returns a SharedMemory object that correlates to the name given, or a
+    SlabBlock if the name is of a block handed out by MpSharedMemorySlab.
+    Returns None if the memory doesn't exist anymore.
     Params:
         -name: The name of a shared memory.
     """
+    if name.startswith(SLAB_PREFIX):
+        return get_slab_block(name)
     try:
         memory = SharedMemory(name=name)
     except FileNotFoundError:
@@ -55,6 +66,9 @@ class MpSharedMemoryGenerator:
         self.max_count = max_count
         self.shared_memories = {}
 
+    def setup(self):
+        pass
+
     def get_next_shared_memory(self, size=500000):
         next_name, name_to_unlink = self.memory_id_gen.get_next()
 
@@ -85,3 +99,375 @@ class MpSharedMemoryGenerator:
         self.shared_memories[name_to_unlink].close()
         self.shared_memories[name_to_unlink].unlink()
         self.shared_memories.pop(name_to_unlink)
+
+
+SharedFrameReference = namedtuple("SharedFrameReference",
+                                  ["ring_name", "slot", "sequence",
+                                   "shape", "dtype"])
+
+# rings created by this process and rings this process has attached to,
+# both keyed by the name of their shared memory
+_owned_rings = {}
+_attached_rings = {}
+
+
+class MpSharedMemoryRing:
+    """
+    Holds a fixed ring of pre-allocated shared memory slots that raw
+    (unencoded) frames are written into. Every slot starts with a header that
+    holds the sequence number of the frame currently stored in it, this lets
+    a reader tell whether the slot was reused since its reference was created.
+    The whole ring lives in a single shared memory that is created when the
+    first frame is written, if slot_size isn't given it's taken from the size
+    of that first frame.
+    """
+    HEADER_SIZE = 64
+
+    def __init__(self, component_name, slot_count=5, slot_size=None):
+        self.name = "{0}_ring".format(component_name)
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.memory = None
+        self.sequence = 0
+
+    def setup(self):
+        # the ring is created with the first frame, once the slot size
+        # is known
+        pass
+
+    def write_frame(self, frame):
+        """
+        Copies the frame into the next slot of the ring and returns a
+        SharedFrameReference that can be used to read it.
+        Params:
+            -frame: a numpy array to write.
+        """
+        if self.memory is None:
+            self._create_memory(frame.nbytes)
+        if frame.nbytes > self.slot_size:
+            raise ValueError("Frame of {0} bytes doesn't fit in a ring slot "
+                             "of {1} bytes".format(frame.nbytes,
+                                                   self.slot_size))
+
+        slot = self.sequence % self.slot_count
+        self.sequence += 1
+        header = _slot_header(self.memory, slot, self.slot_size)
+        # mark the slot as being written so readers won't trust its content
+        header[0] = 0
+        view = _slot_view(self.memory, slot, self.slot_size,
+                          frame.shape, frame.dtype)
+        view[...] = frame
+        header[0] = self.sequence
+        del view, header
+
+        return SharedFrameReference(self.name, slot, self.sequence,
+                                    frame.shape, frame.dtype.str)
+
+    def cleanup(self):
+        if self.memory is not None:
+            _owned_rings.pop(self.name, None)
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def _create_memory(self, frame_size):
+        if self.slot_size is None:
+            self.slot_size = frame_size
+        size = self.slot_count * (self.HEADER_SIZE + self.slot_size)
+        try:
+            self.memory = SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            memory = SharedMemory(name=self.name)
+            memory.close()
+            memory.unlink()
+            self.memory = SharedMemory(name=self.name, create=True, size=size)
+        # readers find the slot size in the header of the first slot
+        _slot_header(self.memory, 0, 0, field=1)[0] = self.slot_size
+        _owned_rings[self.name] = self.memory
+
+
+def get_ring_frame(reference):
+    """
+    Returns a numpy array that is a view straight onto the ring slot the
+    reference points to, or None if the ring doesn't exist or the slot was
+    already reused for a newer frame. The view stays valid only until the
+    writer wraps around the ring, use is_ring_frame_current to check
+    whether that already happened or copy the array to keep it.
+    Params:
+        -reference: a SharedFrameReference returned by write_frame.
+    """
+    memory = _get_ring_memory(reference.ring_name)
+    if memory is None or not is_ring_frame_current(reference):
+        return None
+    slot_size = _get_slot_size(memory)
+    return _slot_view(memory, reference.slot, slot_size,
+                      reference.shape, np.dtype(reference.dtype))
+
+
+def is_ring_frame_current(reference):
+    """
+    Returns True if the ring slot still holds the frame of the reference.
+    Params:
+        -reference: a SharedFrameReference returned by write_frame.
+    """
+    memory = _get_ring_memory(reference.ring_name)
+    if memory is None:
+        return False
+    header = _slot_header(memory, reference.slot, _get_slot_size(memory))
+    return int(header[0]) == reference.sequence
+
+
+def _get_ring_memory(name):
+    return _attach_memory(name, _owned_rings, _attached_rings)
+
+
+def _attach_memory(name, owned, attached):
+    if name in owned:
+        return owned[name]
+    if name not in attached:
+        try:
+            memory = SharedMemory(name=name)
+        except FileNotFoundError:
+            return None
+        # the memory is owned by its writer, don't let this process'
+        # resource tracker unlink it when this process exits
+        resource_tracker.unregister(memory._name, "shared_memory")
+        attached[name] = memory
+    return attached[name]
+
+
+def _get_slot_size(memory):
+    return int(_slot_header(memory, 0, 0, field=1)[0])
+
+
+def _slot_header(memory, slot, slot_size, field=0):
+    offset = slot * (MpSharedMemoryRing.HEADER_SIZE + slot_size)
+    return np.ndarray((1,), dtype=np.uint64, buffer=memory.buf,
+                      offset=offset + field * 8)
+
+
+def _slot_view(memory, slot, slot_size, shape, dtype):
+    offset = slot * (MpSharedMemoryRing.HEADER_SIZE + slot_size) \
+        + MpSharedMemoryRing.HEADER_SIZE
+    return np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)
+
+
+SLAB_PREFIX = "slab:"
+# the default block sizes of a slab and the number of blocks of each size
+SLAB_SIZE_CLASSES = {
+    2 ** 16: 16,
+    2 ** 18: 16,
+    2 ** 20: 16,
+    2 ** 22: 4
+}
+
+# slabs created by this process and slabs this process has attached to,
+# both keyed by the name of their shared memory
+_owned_slabs = {}
+_attached_slabs = {}
+# the locks guarding the block headers of each slab, see _SlabLock
+_slab_locks = {}
+
+
+class MpSharedMemorySlab:
+    """
+    Hands out blocks of a single long lived shared memory instead of
+    creating a new shared memory for every frame. The memory is split into
+    blocks of a few size classes, each request is served by a free block of
+    the smallest class it fits in.
+    Every block starts with a header that holds a reference count and a
+    generation number. The generator holds a reference to each of the last
+    max_count blocks it handed out, and every reader that opens a block with
+    get_shared_memory_object holds one until it closes the block. A block is
+    only reused once its count drops to zero, so a frame can't be
+    overwritten while it's being read, and readers that come after the block
+    was reused find a newer generation and get None.
+    The counts are shared between processes, their updates are guarded by a
+    lock file.
+    Requests that no free block fits, e.g. raw frames bigger than the
+    biggest size class, get a shared memory of their own, like the ones of
+    MpSharedMemoryGenerator, which is unlinked once max_count more of them
+    were handed out.
+    """
+    HEADER_SIZE = 64
+    REFCOUNT, GENERATION, LENGTH = range(3)
+
+    def __init__(self, component_name, max_count=5, size_classes=None):
+        self.name = "{0}_slab".format(component_name)
+        self.max_count = max_count
+        self.size_classes = sorted((size_classes or SLAB_SIZE_CLASSES).items())
+        self.memory = None
+        # the offsets of the blocks of every size class, each one is
+        # rotated as it's searched for a free block
+        self.free_lists = []
+        self.held_blocks = deque()
+        self.oversized = MpSharedMemoryGenerator(
+            "{0}_oversized".format(self.name), max_count)
+
+    def setup(self):
+        """
+        Creates the shared memory of the slab. Called before the routines of
+        the component start, so that routines running in forked processes
+        share it.
+        """
+        if self.memory is not None:
+            return
+        offset = 0
+        self.free_lists = []
+        for block_size, block_count in self.size_classes:
+            self.free_lists.append(deque(
+                offset + index * (self.HEADER_SIZE + block_size)
+                for index in range(block_count)))
+            offset += block_count * (self.HEADER_SIZE + block_size)
+        try:
+            self.memory = SharedMemory(name=self.name, create=True,
+                                       size=offset)
+        except FileExistsError:
+            memory = SharedMemory(name=self.name)
+            memory.close()
+            memory.unlink()
+            self.memory = SharedMemory(name=self.name, create=True,
+                                       size=offset)
+        _owned_slabs[self.name] = self.memory
+
+    def get_next_shared_memory(self, size=500000):
+        """
+        Returns a SlabBlock of exactly size bytes to write into. The block
+        keeps its content until max_count more blocks were handed out and
+        all of its readers closed it. If no free block fits, a new shared
+        memory of size bytes is returned instead.
+        Params:
+            -size: the number of bytes needed.
+        """
+        if self.memory is None:
+            self.setup()
+        if len(self.held_blocks) >= self.max_count:
+            self.held_blocks.popleft().close()
+
+        for (block_size, _), free_list in zip(self.size_classes,
+                                              self.free_lists):
+            if block_size < size:
+                continue
+            with _SlabLock(self.name):
+                for _ in range(len(free_list)):
+                    offset = free_list[0]
+                    free_list.rotate(-1)
+                    header = _block_header(self.memory, offset)
+                    if header[self.REFCOUNT] == 0:
+                        header[self.REFCOUNT] = 1
+                        header[self.GENERATION] += 1
+                        header[self.LENGTH] = size
+                        block = SlabBlock(self.name, self.memory, offset,
+                                          int(header[self.GENERATION]), size)
+                        break
+                else:
+                    # every block of this class is in use, try a bigger one
+                    continue
+            self.held_blocks.append(block)
+            return block
+
+        return self.oversized.get_next_shared_memory(size)
+
+    def cleanup(self):
+        while self.held_blocks:
+            self.held_blocks.popleft().close()
+        self.oversized.cleanup()
+        if self.memory is not None:
+            _owned_slabs.pop(self.name, None)
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+            _SlabLock.remove(self.name)
+
+
+class SlabBlock:
+    """
+    A block of a MpSharedMemorySlab, it has the buf and name of a
+    SharedMemory object and holds a reference to the block until it's
+    closed.
+    """
+    def __init__(self, slab_name, memory, offset, generation, size):
+        self.name = "{0}{1}:{2}:{3}:{4}".format(SLAB_PREFIX, slab_name,
+                                                offset, generation, size)
+        self.slab_name = slab_name
+        self.memory = memory
+        self.offset = offset
+        start = offset + MpSharedMemorySlab.HEADER_SIZE
+        self.buf = memory.buf[start:start + size]
+
+    def close(self):
+        if self.buf is None:
+            return
+        self.buf.release()
+        self.buf = None
+        with _SlabLock(self.slab_name):
+            header = _block_header(self.memory, self.offset)
+            header[MpSharedMemorySlab.REFCOUNT] -= 1
+
+
+def get_slab_block(name):
+    """
+    Opens the block of a MpSharedMemorySlab that the name points to and
+    takes a reference to it, the block has to be closed once it was read.
+    Returns None if the slab doesn't exist anymore or the block was already
+    reused.
+    Params:
+        -name: the name of a SlabBlock.
+    """
+    slab_name, offset, generation, size = \
+        name[len(SLAB_PREFIX):].rsplit(":", 3)
+    offset, generation, size = int(offset), int(generation), int(size)
+    memory = _attach_memory(slab_name, _owned_slabs, _attached_slabs)
+    if memory is None:
+        return None
+    with _SlabLock(slab_name):
+        header = _block_header(memory, offset)
+        if header[MpSharedMemorySlab.GENERATION] != generation or \
+                header[MpSharedMemorySlab.REFCOUNT] == 0:
+            return None
+        header[MpSharedMemorySlab.REFCOUNT] += 1
+    return SlabBlock(slab_name, memory, offset, generation, size)
+
+
+class _SlabLock:
+    """
+    Guards the block headers of a slab between threads and processes. flock
+    locks belong to an open file, so the lock file is opened again in
+    every process, forked ones included, and the threads of a process
+    are serialized with a threading lock.
+    """
+    def __init__(self, slab_name):
+        lock = _slab_locks.get(slab_name)
+        if lock is None or lock[0] != os.getpid():
+            fd = os.open(self.path(slab_name), os.O_CREAT | os.O_RDWR, 0o600)
+            lock = (os.getpid(), threading.Lock(), fd)
+            _slab_locks[slab_name] = lock
+        _, self.thread_lock, self.fd = lock
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *args):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+    @staticmethod
+    def path(slab_name):
+        return os.path.join(tempfile.gettempdir(),
+                            "{0}.lock".format(slab_name))
+
+    @staticmethod
+    def remove(slab_name):
+        lock = _slab_locks.pop(slab_name, None)
+        if lock is not None and lock[0] == os.getpid():
+            os.close(lock[2])
+        try:
+            os.remove(_SlabLock.path(slab_name))
+        except FileNotFoundError:
+            pass
+
+
+def _block_header(memory, offset):
+    return np.ndarray((3,), dtype=np.uint64, buffer=memory.buf,
+                      offset=offset)
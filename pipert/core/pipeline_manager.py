@@ -8,6 +8,7 @@ from os import listdir
 from os.path import isfile, join
 from jsonschema import validate, ValidationError
 import functools
+import inspect
 
 
 # import gc
@@ -40,11 +41,14 @@ class PipelineManager:
         self.components = {}
         self.ROUTINES_FOLDER_PATH = "pipert/contrib/routines"
         self.COMPONENTS_FOLDER_PATH = "pipert/contrib/components"
+        self.ROUTINE_EXECUTION_MODES = ("thread", "process", "coroutine", "worker_pool")
 
     @component_name_existence_error(need_to_be_exist=False)
-    def create_component(self, component_name, use_shared_memory=False, metrics_collector=NullCollector()):
+    def create_component(self, component_name, use_shared_memory=False, metrics_collector=NullCollector(),
+                         raw_frames=False, codec=None):
         self.components[component_name] = \
-            BaseComponent(name=component_name, use_memory=use_shared_memory, metrics_collector=metrics_collector)
+            BaseComponent(name=component_name, use_memory=use_shared_memory, metrics_collector=metrics_collector,
+                          raw_frames=raw_frames, codec=codec)
         return self._create_response(
             True,
             f"Component {component_name} has been created"
@@ -54,7 +58,9 @@ class PipelineManager:
     def create_premade_component(self, component_name,
                                  component_type_name,
                                  use_shared_memory=False,
-                                 metrics_collector=NullCollector()):
+                                 metrics_collector=NullCollector(),
+                                 raw_frames=False,
+                                 codec=None):
         component_class = \
             self._get_component_class_object_by_type_name(component_type_name)
         if component_class is None:
@@ -63,7 +69,8 @@ class PipelineManager:
                 f"The component type {component_type_name} doesn't exist"
             )
         self.components[component_name] = \
-            component_class(name=component_name, use_memory=use_shared_memory, metrics_collector=metrics_collector)
+            component_class(name=component_name, use_memory=use_shared_memory, metrics_collector=metrics_collector,
+                            raw_frames=raw_frames, codec=codec)
         return self._create_response(
             True,
             f"Component {component_name} has been created"
@@ -110,6 +117,17 @@ class PipelineManager:
                 " already exist in this component"
             )
 
+        execution_mode = routine_parameters_kwargs.pop(
+            "execution_mode", self._get_default_execution_mode(routine_class_object))
+        # the number of processes of a routine that runs as a worker pool
+        workers = routine_parameters_kwargs.pop("workers", None)
+        if execution_mode.lower() not in self.ROUTINE_EXECUTION_MODES or \
+                not hasattr(routine_class_object, "as_" + execution_mode.lower()):
+            return self._create_response(
+                False,
+                f"Cannot find execution mode '{execution_mode}'"
+            )
+
         try:
             # replace all queue names with the queue objects of the component before creating routine
             for key, value in routine_parameters_kwargs.items():
@@ -119,9 +137,12 @@ class PipelineManager:
 
             routine_parameters_kwargs["component_name"] = component_name
 
-            self.components[component_name] \
-                .register_routine(routine_class_object(**routine_parameters_kwargs)
-                                  .as_thread())
+            routine = routine_class_object(**routine_parameters_kwargs)
+            if execution_mode.lower() == "worker_pool":
+                routine.as_worker_pool(workers)
+            else:
+                getattr(routine, "as_" + execution_mode.lower())()
+            self.components[component_name].register_routine(routine)
             return self._create_response(
                 True,
                 f"The routine {routine_parameters_kwargs['name']} has been added"
@@ -158,15 +179,24 @@ class PipelineManager:
 
     @component_name_existence_error(need_to_be_exist=True)
     def create_queue_to_component(self, component_name,
-                                  queue_name, queue_size=1):
+                                  queue_name, queue_size=1, queue_kind="auto",
+                                  overflow=None):
         if self.components[component_name].does_queue_exist(queue_name):
             return self._create_response(
                 False,
                 f"Queue named {queue_name} already exist"
             )
 
-        self.components[component_name].create_queue(queue_name=queue_name,
-                                                     queue_size=queue_size)
+        try:
+            self.components[component_name].create_queue(queue_name=queue_name,
+                                                         queue_size=queue_size,
+                                                         queue_kind=queue_kind,
+                                                         overflow=overflow)
+        except ValueError as error:
+            return self._create_response(
+                False,
+                str(error)
+            )
         return self._create_response(
             True,
             f"The Queue {queue_name} has been created"
@@ -281,6 +311,13 @@ class PipelineManager:
                 f"Cannot find execution mode '{execution_mode}'"
             )
 
+    @staticmethod
+    def _get_default_execution_mode(routine_class_object):
+        # routines with an async main_logic run on the event loop
+        if inspect.iscoroutinefunction(routine_class_object.main_logic):
+            return "coroutine"
+        return "thread"
+
     # helping method for changing the file name to class name
     @staticmethod
     def _remove_string_with_underscore(match):
@@ -307,7 +344,7 @@ class PipelineManager:
 
           "components": {
             "component_name": {
-              "queues": [str],
+              "queues": [str or {"name": str, "size": int, "kind": str, "overflow": str}],
               "routines": {
                 "routine_name": {
                   "routine_type_name": str,
@@ -322,7 +359,19 @@ class PipelineManager:
         component_validator = {
             "type": "object",
             "properties": {
-                "queues": {"type": "array", "items": {"type": "string"}},
+                "queues": {"type": "array", "items": {"anyOf": [
+                    {"type": "string"},
+                    {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string"},
+                            "size": {"type": "integer"},
+                            "kind": {"type": "string"},
+                            "overflow": {"type": "string"}
+                        },
+                        "required": ["name"]
+                    }
+                ]}},
                 "routines": {"type": "object"}
             },
             "required": ["queues", "routines"]
@@ -343,25 +392,39 @@ class PipelineManager:
             try:
                 validate(instance=component_parameters, schema=component_validator)
                 to_use_shared_memory = component_parameters.get("shared_memory", False)
+                raw_frames = component_parameters.get("raw_frames", False)
+                codec = component_parameters.get("codec", None)
                 metrics_collector = component_parameters.get("metrics_collector", NullCollector())
                 if "component_type_name" in component_parameters:
                     responses.append(self.create_premade_component(
                         component_name=component_name,
                         component_type_name=component_parameters["component_type_name"],
                         use_shared_memory=to_use_shared_memory,
-                        metrics_collector=metrics_collector))
+                        metrics_collector=metrics_collector,
+                        raw_frames=raw_frames,
+                        codec=codec))
                 else:
                     responses.append(self.create_component(component_name=component_name,
                                                            use_shared_memory=to_use_shared_memory,
-                                                           metrics_collector=metrics_collector))
+                                                           metrics_collector=metrics_collector,
+                                                           raw_frames=raw_frames,
+                                                           codec=codec))
                 if "execution_mode" in component_parameters:
                     responses.append(self.change_component_execution_mode(
                         component_name=component_name,
                         execution_mode=component_parameters["execution_mode"]))
                 for queue in component_parameters["queues"]:
-                    responses.append(self.create_queue_to_component(
-                        component_name=component_name,
-                        queue_name=queue))
+                    if isinstance(queue, dict):
+                        responses.append(self.create_queue_to_component(
+                            component_name=component_name,
+                            queue_name=queue["name"],
+                            queue_size=queue.get("size", 1),
+                            queue_kind=queue.get("kind", "auto"),
+                            overflow=queue.get("overflow")))
+                    else:
+                        responses.append(self.create_queue_to_component(
+                            component_name=component_name,
+                            queue_name=queue))
                 for routine_name, routine_parameters in component_parameters["routines"].items():
                     routine_type_name = routine_parameters.pop("routine_type_name", "")
                     routine_parameters["name"] = routine_name
@@ -0,0 +1,298 @@
+import os
+import threading
+import time
+from abc import abstractmethod
+from queue import Empty
+import torch.multiprocessing as mp
+from .routine import Routine, RoutineTypes, State
+from .utlis import put_dropping_oldest
+
+
+class ProcessingRoutine(Routine):
+    """
+    A routine that takes items from its input queue, processes each of them
+    on its own and puts the results in its output queue.
+
+    Splitting the work into fetch, process and emit lets the routine run as
+    a pool of worker processes with as_worker_pool, where only process runs
+    in the workers. Routines whose process depends on the previous items
+    (e.g. trackers) must not run as a worker pool.
+    """
+    routine_type = RoutineTypes.PROCESSING
+
+    def __init__(self, in_queue, out_queue, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_queue = in_queue
+        self.input_queues = [in_queue]
+        self.out_queue = out_queue
+        # answers static frames with previous results, see gate
+        self.motion_gate = None
+
+    def main_logic(self, *args, **kwargs):
+        item = self.fetch()
+        if item is None:
+            return False
+        output = self.process(item)
+        if output is None:
+            return False
+        return self.emit(output)
+
+    def fetch(self):
+        """
+        Returns the next item to process, or None if there is none. Items
+        that don't have to be processed are skipped, see admits.
+        """
+        while True:
+            try:
+                item = self.in_queue.get(block=False)
+            except Empty:
+                return None
+            if self.admits(item):
+                return item
+
+    def admits(self, item):
+        """
+        Returns whether to process an input item. Items that the routine's
+        sampling policy skips are dropped, and items that the routine's
+        motion gate answers with a previous result are emitted right away.
+        """
+        if not self.accepts(item):
+            return False
+        if self.reuses_result(item):
+            self.emit(item)
+            return False
+        return True
+
+    def reuses_result(self, item):
+        """
+        Returns whether the routine's motion gate answered an input item
+        with a previous result, which replaced the item's frame.
+        """
+        return self.motion_gate is not None and self.motion_gate.reuse_result(item)
+
+    @abstractmethod
+    def process(self, item):
+        """
+        Processes a single item and returns the output to emit, or None if
+        there is nothing to emit. When the routine runs as a worker pool,
+        this is called in the worker processes, so the item and the output
+        must be picklable.
+        """
+        raise NotImplementedError
+
+    def emit(self, output):
+        """
+        Puts the output in the output queue, dropping the oldest output in
+        the queue if it's full.
+        """
+        if self.motion_gate is not None:
+            self.motion_gate.remember(output)
+        if not put_dropping_oldest(self.out_queue, output):
+            self.state.dropped = getattr(self.state, "dropped", 0) + 1
+        return True
+
+    def setup(self, *args, **kwargs):
+        pass
+
+    def cleanup(self, *args, **kwargs):
+        pass
+
+    def gate(self, motion_gate):
+        """
+        Puts a MotionGate (see pipert.core.motion_gate) in front of the
+        routine, so the frames of static sources aren't processed and the
+        last output of their source is emitted for them instead. The
+        outputs must be messages with predictions.
+        """
+        self.motion_gate = motion_gate
+        return self
+
+    def as_worker_pool(self, workers=None):
+        """
+        Runs process in a pool of worker processes, so CPU bound routines
+        aren't limited by the GIL. The items are fetched from the input
+        queue and the outputs are emitted in the component's process, in
+        the order the items were fetched, together with the items that the
+        motion gate answers with previous results. setup and cleanup run in
+        every worker.
+
+        Args:
+            workers: the number of worker processes, the number of CPUs
+            by default.
+        """
+        self.runner_creator = WorkerPoolRunner
+        self.runner_creator_kwargs = {"routine": self,
+                                      "workers": workers or os.cpu_count()}
+        return self
+
+    @staticmethod
+    def get_constructor_parameters():
+        dicts = Routine.get_constructor_parameters()
+        dicts.update({
+            "in_queue": "QueueIn",
+            "out_queue": "QueueOut",
+        })
+        return dicts
+
+    def does_routine_use_queue(self, queue):
+        return (self.in_queue == queue) or (self.out_queue == queue)
+
+
+class WorkerPoolRunner:
+    """
+    Runs a ProcessingRoutine as a pool of worker processes, with the part
+    of the `threading.Thread` interface that components use to start, join
+    and supervise their routines.
+
+    A dispatcher thread sends the fetched items to the workers through a
+    multiprocessing queue, and a collector thread puts the outputs back in
+    the order the items were fetched before emitting them. Items that the
+    routine's motion gate answers with a previous result skip the workers
+    and are passed straight to the collector, so they are emitted in order
+    too, and only the collector emits. If a worker dies the whole pool
+    stops, so the component can restart it.
+    """
+    # items that are sent to the workers for every worker and aren't
+    # emitted yet, so a slow item doesn't hold back an unbounded backlog
+    ITEMS_IN_FLIGHT_PER_WORKER = 2
+    # how long to wait for a terminated worker before killing it
+    TERMINATE_TIMEOUT = 1.
+
+    def __init__(self, routine, workers):
+        self.routine = routine
+        self.workers = workers
+        self.exitcode = None
+        self._tasks = None
+        self._results = None
+        self._pool_stop = None
+        self._in_flight = None
+        self._processes = []
+        self._threads = []
+
+    def start(self):
+        self.routine.state = State()
+        self.routine.state.dropped = 0
+        self._tasks = mp.Queue()
+        self._results = mp.Queue()
+        self._pool_stop = mp.Event()
+        self._in_flight = threading.BoundedSemaphore(
+            self.workers * self.ITEMS_IN_FLIGHT_PER_WORKER)
+        self._processes = [mp.Process(target=self._work, daemon=True)
+                           for _ in range(self.workers)]
+        for process in self._processes:
+            process.start()
+        # daemon threads don't keep the interpreter alive if the pool is
+        # never joined, e.g. when its component crashed
+        self._threads = [threading.Thread(target=self._dispatch, daemon=True),
+                         threading.Thread(target=self._collect, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pool_stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(self.TERMINATE_TIMEOUT)
+            if process.is_alive():
+                # workers that inherited a SIGTERM handler ignore terminate
+                process.kill()
+                process.join()
+        # items that no worker took are dropped instead of keeping the
+        # process alive until they are flushed
+        self._tasks.cancel_join_thread()
+
+    def _is_stopped(self):
+        return self.routine.stop_event.is_set() or self._pool_stop.is_set()
+
+    def _dispatch(self):
+        routine = self.routine
+        routine._listen_to_input_queues()
+        seq = 0
+        while not self._is_stopped():
+            if not routine.wait_for_input(routine.STOP_CHECK_INTERVAL):
+                break
+            if not self._in_flight.acquire(timeout=routine.STOP_CHECK_INTERVAL):
+                continue
+            item = self._fetch()
+            if item is None:
+                self._in_flight.release()
+                continue
+            if routine.reuses_result(item):
+                # no elapsed time marks an item that wasn't processed
+                self._results.put((seq, item, None))
+            else:
+                self._tasks.put((seq, item))
+            seq += 1
+        routine._listen_to_input_queues(listen=False)
+
+    def _fetch(self):
+        # like the routine's fetch, but leaves the items that the motion
+        # gate answers to the dispatcher
+        routine = self.routine
+        while True:
+            try:
+                item = routine.in_queue.get(block=False)
+            except Empty:
+                return None
+            if routine.accepts(item):
+                return item
+
+    def _collect(self):
+        routine = self.routine
+        outputs = {}
+        next_seq = 0
+        while not self._is_stopped():
+            try:
+                seq, output, elapsed = \
+                    self._results.get(timeout=routine.STOP_CHECK_INTERVAL)
+            except Empty:
+                if not all(process.is_alive() for process in self._processes):
+                    routine.logger.error("A worker of %s died, stopping its "
+                                         "worker pool", routine.name)
+                    self._pool_stop.set()
+                continue
+            outputs[seq] = (output, elapsed)
+            while next_seq in outputs:
+                output, elapsed = outputs.pop(next_seq)
+                next_seq += 1
+                self._in_flight.release()
+                if elapsed is None:
+                    # answered by the motion gate
+                    routine.emit(output)
+                    continue
+                routine.state.count += 1
+                if routine.sampling_policy is not None:
+                    # the workers process the items side by side
+                    routine.sampling_policy.record_processing_time(
+                        elapsed / self.workers)
+                if output is not None and routine.emit(output):
+                    routine.metrics_collector.collect_execution_time(
+                        elapsed, routine.name, routine.component_name)
+                    routine.state.success += 1
+
+    def _work(self):
+        routine = self.routine
+        routine.state = State()
+        routine.setup()
+        while not self._is_stopped():
+            try:
+                seq, item = self._tasks.get(timeout=routine.STOP_CHECK_INTERVAL)
+            except Empty:
+                continue
+            tick = time.time()
+            try:
+                output = routine.process(item)
+            except Exception:
+                routine.logger.exception("Failed to process an item")
+                output = None
+            self._results.put((seq, output, time.time() - tick))
+        routine.cleanup()
+        # the outputs of a stopped pool aren't read anymore
+        self._results.cancel_join_thread()
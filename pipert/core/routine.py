@@ -1,3 +1,5 @@
+import asyncio
+import inspect
 import time
 from abc import ABC, abstractmethod
 from collections import defaultdict
@@ -8,6 +10,7 @@ from logging.handlers import TimedRotatingFileHandler
 import torch.multiprocessing as mp
 from .errors import NoRunnerException
 from .metrics_collector import NullCollector
+from .utlis import QueueHandler, NotifyingQueue, CoroutineRunner, AutoQueue
 
 
 class Events(Enum):
@@ -41,6 +44,10 @@ class RoutineTypes(Enum):
 
 
 class Routine(ABC):
+    # how often a routine waiting for input checks whether it was stopped
+    STOP_CHECK_INTERVAL = 0.1
+    # how often queues that can't wake a waiting routine are checked
+    POLL_INTERVAL = 0.005
     routine_type = RoutineTypes.NO_TYPE
 
     def __init__(self, name="", component_name="", metrics_collector=NullCollector()):
@@ -52,6 +59,9 @@ class Routine(ABC):
         self.metrics_collector = metrics_collector
         self.use_memory = False
         self.generator = None
+        # the codec frames are encoded with, set by the component unless
+        # the routine chose its own
+        self.codec = None
         self.stop_event: mp.Event = None
         self._event_handlers = defaultdict(list)
         self.state = None
@@ -60,6 +70,19 @@ class Routine(ABC):
         self.runner = None
         self.runner_creator = None
         self.runner_creator_kwargs = {}
+        # the queues main_logic reads from, when given the routine sleeps
+        # until one of them has data instead of calling main_logic in a
+        # busy loop, see wait_for_input
+        self.input_queues = []
+        # if given, main_logic is also called after this many seconds
+        # without input
+        self.idle_timeout = None
+        # decides which of the input messages are processed, see sample
+        self.sampling_policy = None
+        self._wakeup = threading.Event()
+        # set while the routine runs as a coroutine, see as_coroutine
+        self._loop = None
+        self._async_wakeup = None
         self._setup_logger()
 
     def _setup_logger(self):
@@ -229,6 +252,40 @@ class Routine(ABC):
                                last=True,
                                required_fps=fps)
 
+    def sample(self, policy):
+        """
+        Makes the routine process only the input messages that the sampling
+        policy accepts (see pipert.core.sampling), instead of every message
+        it fetches. The time main_logic takes is reported to the policy,
+        divided between the messages it accepted.
+
+        The routine must check its messages with accepts before accessing
+        their payloads, as ProcessingRoutine.fetch does.
+
+        Args:
+            policy: a SamplingPolicy.
+        """
+        def start_time(routine: Routine):
+            routine.state.sampling_start = (time.time(), policy.accepted)
+
+        def report_time(routine: Routine):
+            start, accepted = routine.state.sampling_start
+            accepted = policy.accepted - accepted
+            if routine.state.output and accepted:
+                policy.record_processing_time((time.time() - start) / accepted)
+
+        self.sampling_policy = policy
+        self.add_event_handler(Events.BEFORE_LOGIC, start_time, first=True)
+        self.add_event_handler(Events.AFTER_LOGIC, report_time, last=True)
+        return self
+
+    def accepts(self, msg):
+        """
+        Returns whether the routine's sampling policy accepts msg, always
+        True for routines without a policy.
+        """
+        return self.sampling_policy is None or self.sampling_policy.accept(msg)
+
     def on(self, event_name, *args, **kwargs):
         """
         Decorator shortcut for add_event_handler.
@@ -284,6 +341,98 @@ class Routine(ABC):
     def cleanup(self, *args, **kwargs):
         raise NotImplementedError
 
+    def wait_for_input(self, timeout=None):
+        """
+        Sleeps until one of the routine's input queues has data, the timeout
+        passes or the routine is stopped. Returns True if there is input or
+        the timeout passed, False if the routine was stopped.
+
+        Notifying queues wake the routine up as soon as they get an item,
+        other queues (e.g. of processes) are polled every POLL_INTERVAL
+        seconds.
+        Args:
+            timeout: the maximal number of seconds to wait.
+        """
+        queues = self._get_input_queues()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        notifying = all(isinstance(q, NotifyingQueue) for q in queues)
+        while not self.stop_event.is_set():
+            if notifying:
+                # cleared before checking, so an item put right after the
+                # check still wakes the routine
+                self._wakeup.clear()
+            if any(q.qsize() > 0 for q in queues):
+                return True
+            interval = self._get_wait_interval(deadline)
+            if interval <= 0:
+                return True
+            if notifying:
+                self._wakeup.wait(interval)
+            else:
+                time.sleep(min(interval, self.POLL_INTERVAL))
+        return False
+
+    async def wait_for_input_async(self, timeout=None):
+        """
+        The same as wait_for_input, for routines that run as coroutines.
+        The event loop keeps running the other routines while this one
+        waits.
+        Args:
+            timeout: the maximal number of seconds to wait.
+        """
+        queues = self._get_input_queues()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        notifying = all(isinstance(q, NotifyingQueue) for q in queues)
+        while not self.stop_event.is_set():
+            if notifying:
+                self._async_wakeup.clear()
+            if any(q.qsize() > 0 for q in queues):
+                return True
+            interval = self._get_wait_interval(deadline)
+            if interval <= 0:
+                return True
+            if notifying:
+                try:
+                    await asyncio.wait_for(self._async_wakeup.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(min(interval, self.POLL_INTERVAL))
+        return False
+
+    def _get_wait_interval(self, deadline):
+        if deadline is None:
+            return self.STOP_CHECK_INTERVAL
+        return min(deadline - time.monotonic(), self.STOP_CHECK_INTERVAL)
+
+    def _get_input_queues(self):
+        queues = [q.q if isinstance(q, QueueHandler) else q
+                  for q in self.input_queues]
+        return [q.queue if isinstance(q, AutoQueue) else q for q in queues]
+
+    def _listen_to_input_queues(self, listen=True):
+        for q in self._get_input_queues():
+            if isinstance(q, NotifyingQueue):
+                if listen:
+                    q.add_listener(self.wake)
+                else:
+                    q.remove_listener(self.wake)
+
+    def wake(self):
+        """
+        Wakes the routine up if it's waiting for input, e.g. after its stop
+        event was set.
+        """
+        self._wakeup.set()
+        # read once, as the routine's coroutine clears it when it ends
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._async_wakeup.set)
+            except RuntimeError:
+                # the loop was closed, so the routine isn't waiting on it
+                pass
+
     # TODO - replace plain 'setup()' and 'cleanup()' with context manager
     def _extended_run(self):
         """
@@ -294,8 +443,12 @@ class Routine(ABC):
         self.state = State()
         # TODO - how to pass different args to setup/cleanup/main_logic?
         self.setup()
+        self._listen_to_input_queues()
         # TODO - maybe add _fire_event before and after the while loop?
         while not self.stop_event.is_set():
+            if self.input_queues and \
+                    not self.wait_for_input(self.idle_timeout):
+                break
             self._fire_event(Events.BEFORE_LOGIC)
             tick = time.time()
             self.state.output = self.main_logic()
@@ -307,8 +460,51 @@ class Routine(ABC):
                 self.state.success += 1
             self._fire_event(Events.AFTER_LOGIC)
 
+        self._listen_to_input_queues(listen=False)
         self.cleanup()
 
+    async def _extended_run_async(self):
+        """
+        The coroutine version of _extended_run. setup, main_logic and
+        cleanup may be either coroutine functions, which are awaited, or
+        regular functions, which run on the event loop and must not block.
+        """
+        self.state = State()
+        self._async_wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self._run_hook(self.setup)
+            self._listen_to_input_queues()
+            while not self.stop_event.is_set():
+                if self.input_queues and \
+                        not await self.wait_for_input_async(self.idle_timeout):
+                    break
+                self._fire_event(Events.BEFORE_LOGIC)
+                tick = time.time()
+                self.state.output = await self._run_hook(self.main_logic)
+                self.state.count += 1
+                tock = time.time()
+
+                if self.state.output:
+                    self.metrics_collector.collect_execution_time(tock - tick, self.name, self.component_name)
+                    self.state.success += 1
+                self._fire_event(Events.AFTER_LOGIC)
+                # lets the other routines on the loop run even when
+                # main_logic didn't wait for anything
+                await asyncio.sleep(0)
+
+            self._listen_to_input_queues(listen=False)
+            await self._run_hook(self.cleanup)
+        finally:
+            self._loop = None
+
+    @staticmethod
+    async def _run_hook(hook):
+        result = hook()
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
     def as_thread(self):
         self.runner_creator = threading.Thread
         self.runner_creator_kwargs = {"target": self._extended_run}
@@ -319,6 +515,26 @@ class Routine(ABC):
         self.runner_creator_kwargs = {"target": self._extended_run}
         return self
 
+    def as_coroutine(self):
+        """
+        Runs the routine as a coroutine on the event loop that all the
+        coroutine routines of the process share, so many I/O bound routines
+        don't need a thread each. The routine should implement main_logic
+        (and optionally setup and cleanup) as coroutine functions.
+        """
+        self.runner_creator = CoroutineRunner
+        self.runner_creator_kwargs = {"target": self._extended_run_async,
+                                      "name": self.name}
+        return self
+
+    def has_own_process(self):
+        """
+        Returns True if the routine runs in a process of its own, so the
+        queues it shares with other routines have to pass items between
+        processes.
+        """
+        return self.runner_creator is mp.Process
+
     def start(self):
         if self.runner_creator is None:
             # TODO - create better errors
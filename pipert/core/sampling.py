@@ -0,0 +1,184 @@
+import time
+from abc import ABC, abstractmethod
+
+
+class SamplingPolicy(ABC):
+    """
+    Decides which of the messages a routine receives it processes, so an
+    expensive routine processes a predictable share of the frames instead
+    of the ones that happen to be left in its input queue.
+
+    The decision is made for every source (the messages' source_address)
+    on its own, when the routine fetches a message and before its payload
+    is decoded, so skipped frames are never decoded. The number of frames
+    of a source that were skipped right before a processed message is
+    added to its skipped_frames, so trackers downstream can keep predicting
+    through the gap.
+    """
+
+    def __init__(self):
+        self.accepted = 0
+        self.skipped = 0
+        self._skipped_by_source = {}
+
+    def accept(self, msg, now=None):
+        """
+        Returns whether the routine should process msg.
+
+        Args:
+            msg: the message the routine fetched.
+            now: the time the message was fetched at, in the clock of
+            time.monotonic.
+        """
+        now = time.monotonic() if now is None else now
+        source = msg.source_address
+        if not self.should_process(source, now):
+            self._skipped_by_source[source] = self._skipped_by_source.get(source, 0) + 1
+            self.skipped += 1
+            return False
+        msg.skipped_frames += self._skipped_by_source.pop(source, 0)
+        self.accepted += 1
+        return True
+
+    @abstractmethod
+    def should_process(self, source, now):
+        """
+        Returns whether to process the frame of source that was fetched at
+        now.
+        """
+        raise NotImplementedError
+
+    def record_processing_time(self, elapsed):
+        """
+        Reports the number of seconds it took the routine to process an
+        accepted message.
+        """
+        pass
+
+
+class EveryNth(SamplingPolicy):
+    """
+    Processes the first of every n frames of each source.
+    """
+
+    def __init__(self, n):
+        super().__init__()
+        if n < 1:
+            raise ValueError(f"n must be at least 1, got {n}")
+        self.n = int(n)
+        self._counts = {}
+
+    def should_process(self, source, now):
+        count = self._counts.get(source, 0)
+        self._counts[source] = (count + 1) % self.n
+        return count == 0
+
+
+class TargetFps(SamplingPolicy):
+    """
+    Processes up to fps frames a second of each source, spread as evenly
+    as the frames arrive. A frame that arrives less than half a frame
+    interval before its time is processed, as it's closer to that time
+    than the frame after it.
+    """
+    # the weight of the last interval between the frames of a source in
+    # the estimate of its frame interval
+    ARRIVAL_SMOOTHING = 0.1
+
+    def __init__(self, fps):
+        super().__init__()
+        if fps <= 0:
+            raise ValueError(f"fps must be positive, got {fps}")
+        self.fps = fps
+        self._next_times = {}
+        self._last_arrivals = {}
+        self._arrival_intervals = {}
+
+    def get_interval(self, source, now):
+        """
+        Returns the minimal number of seconds between processed frames of
+        source.
+        """
+        return 1 / self.fps
+
+    def should_process(self, source, now):
+        last_arrival = self._last_arrivals.get(source)
+        self._last_arrivals[source] = now
+        arrival_interval = self._arrival_intervals.get(source)
+        if last_arrival is not None:
+            interval = now - last_arrival
+            if arrival_interval is None:
+                arrival_interval = interval
+            else:
+                arrival_interval += self.ARRIVAL_SMOOTHING * (interval - arrival_interval)
+            self._arrival_intervals[source] = arrival_interval
+
+        tolerance = arrival_interval / 2 if arrival_interval is not None else 0.
+        next_time = self._next_times.get(source, now)
+        if now + tolerance < next_time:
+            return False
+        # keeps the cadence, unless the frames of the source stopped for
+        # a while
+        self._next_times[source] = max(next_time, now - tolerance) + self.get_interval(source, now)
+        return True
+
+
+class AdaptiveSampling(TargetFps):
+    """
+    Processes as many frames as the routine keeps up with, by the measured
+    time it takes to process a frame. The time is split between the
+    sources that sent frames lately, and each of them is processed at up to
+    max_load / (processing time * number of sources) frames a second, so
+    the routine is busy at most max_load of the time. Frames that arrive
+    slower than that are all processed.
+    """
+    # the weight of the last processing time in the estimate of the time
+    # it takes to process a frame
+    PROCESSING_SMOOTHING = 0.1
+    # sources without frames for this many seconds aren't given a share of
+    # the routine's time
+    ACTIVE_SOURCE_TIMEOUT = 1.
+
+    def __init__(self, max_load=0.9):
+        super().__init__(fps=float("inf"))
+        if not 0 < max_load <= 1:
+            raise ValueError(f"max_load must be in (0, 1], got {max_load}")
+        self.max_load = max_load
+        self.processing_time = None
+
+    def get_interval(self, source, now):
+        if self.processing_time is None:
+            return 0.
+        active_sources = sum(now - arrival < self.ACTIVE_SOURCE_TIMEOUT
+                             for arrival in self._last_arrivals.values())
+        return self.processing_time * max(active_sources, 1) / self.max_load
+
+    def record_processing_time(self, elapsed):
+        if self.processing_time is None:
+            self.processing_time = elapsed
+        else:
+            self.processing_time += self.PROCESSING_SMOOTHING * (elapsed - self.processing_time)
+
+
+SAMPLING_POLICIES = {
+    "every": EveryNth,
+    "fps": TargetFps,
+    "adaptive": AdaptiveSampling
+}
+
+
+def get_sampling_policy(spec):
+    """
+    Returns a new policy described by spec, the name of one of
+    SAMPLING_POLICIES optionally followed by its parameter, for example
+    "every:3" for every third frame, "fps:5" for 5 frames a second or
+    "adaptive:0.8" for keeping the routine busy at most 80% of the time.
+    """
+    name, _, param = spec.partition(":")
+    if name not in SAMPLING_POLICIES:
+        raise ValueError(f"Unknown sampling policy {name}, expected one of "
+                         f"{list(SAMPLING_POLICIES)}")
+    policy_class = SAMPLING_POLICIES[name]
+    if not param:
+        return policy_class()
+    return policy_class(int(param) if policy_class is EveryNth else float(param))
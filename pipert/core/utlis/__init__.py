@@ -1 +1,6 @@
 from .queue_handler import QueueHandler
+from .notifying_queue import NotifyingQueue
+from .event_loop import CoroutineRunner, get_event_loop
+from .ring_queue import RingQueue, OVERFLOW_POLICIES, put_dropping_oldest
+from .shared_memory_queue import SharedMemoryQueue
+from .auto_queue import AutoQueue, QUEUE_KINDS, create_queue_of_kind, close_queue
@@ -0,0 +1,97 @@
+from queue import Empty, Full
+import torch.multiprocessing as mp
+from .notifying_queue import NotifyingQueue
+from .ring_queue import RingQueue
+from .shared_memory_queue import SharedMemoryQueue
+
+QUEUE_KINDS = ("thread", "process", "shared_memory")
+
+
+def create_queue_of_kind(kind, maxsize=0, overflow=None, slot_size=None):
+    """
+    Creates a queue that can pass items between routines that run as
+    threads of the same process ("thread"), between any processes
+    ("process") or from a single producer process to another process
+    through shared memory ("shared_memory"). Only thread queues can have
+    an overflow policy, see RingQueue, and slot_size is the maximal size of
+    a pickled item in a shared memory queue (by default
+    SharedMemoryQueue.DEFAULT_SLOT_SIZE).
+    """
+    if overflow is not None and kind != "thread":
+        raise ValueError("Overflow policies are only supported by thread "
+                         "queues, not by {0} queues".format(kind))
+    if kind == "thread":
+        if overflow is not None:
+            return RingQueue(maxsize=maxsize, overflow=overflow)
+        return NotifyingQueue(maxsize=maxsize)
+    if kind == "process":
+        return mp.Queue(maxsize=maxsize)
+    if kind == "shared_memory":
+        return SharedMemoryQueue(maxsize=maxsize, slot_size=slot_size or SharedMemoryQueue.DEFAULT_SLOT_SIZE)
+    raise ValueError("Unknown queue kind '{0}', expected one of {1}"
+                     .format(kind, ", ".join(QUEUE_KINDS)))
+
+
+def close_queue(q):
+    if isinstance(q, SharedMemoryQueue):
+        q.close()
+    elif not isinstance(q, NotifyingQueue):
+        # items that weren't read don't keep the process alive
+        q.cancel_join_thread()
+        q.close()
+
+
+class AutoQueue:
+    """
+    A queue whose kind is chosen when its component starts, by the
+    execution modes of the routines that use it (see
+    BaseComponent.create_queue). Until then it's a thread queue.
+
+    The methods of the chosen queue are bound to the AutoQueue itself, so
+    using it costs the same as using that queue directly.
+    """
+
+    def __init__(self, maxsize=0, overflow=None, slot_size=None):
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.slot_size = slot_size
+        self.kind = None
+        self.queue = None
+        self._use("thread", create_queue_of_kind("thread", maxsize, overflow))
+
+    def switch_to(self, kind):
+        """
+        Replaces the queue with a queue of the given kind, moving the items
+        that are waiting in it to the new queue.
+        """
+        if kind == self.kind:
+            return
+        new_queue = create_queue_of_kind(kind, self.maxsize, self.overflow, self.slot_size)
+        while True:
+            try:
+                new_queue.put(self.queue.get(block=False), block=False)
+            except (Empty, Full):
+                break
+        close_queue(self.queue)
+        self._use(kind, new_queue)
+
+    def _use(self, kind, q):
+        self.kind = kind
+        self.queue = q
+        self.put = q.put
+        self.get = q.get
+        self.put_nowait = q.put_nowait
+        self.get_nowait = q.get_nowait
+        self.qsize = q.qsize
+        self.empty = q.empty
+        self.full = q.full
+        if isinstance(q, RingQueue):
+            self.put_overwrite = q.put_overwrite
+        else:
+            self.__dict__.pop("put_overwrite", None)
+
+    def __getattr__(self, name):
+        q = self.__dict__.get("queue")
+        if q is None:
+            raise AttributeError(name)
+        return getattr(q, name)
@@ -0,0 +1,65 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """
+    Returns the asyncio event loop that the coroutine routines of the
+    current process run on. The loop runs in a daemon thread that is
+    started the first time it's needed, a forked process starts its own.
+    """
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever,
+                             name="pipert-event-loop",
+                             daemon=True).start()
+        return _loop
+
+
+class CoroutineRunner:
+    """
+    Runs a coroutine function on the shared event loop, with the part of
+    the `threading.Thread` interface that components use to start, join
+    and supervise their routines.
+    """
+
+    def __init__(self, target, name=None):
+        self.target = target
+        self.name = name
+        self.exitcode = None
+        self._future = None
+
+    def start(self):
+        if self._future is not None:
+            raise RuntimeError("coroutines can only be started once")
+        self._future = asyncio.run_coroutine_threadsafe(self.target(),
+                                                        get_event_loop())
+        self._future.add_done_callback(self._report_exception)
+
+    def is_alive(self):
+        return self._future is not None and not self._future.done()
+
+    def join(self, timeout=None):
+        if self._future is None:
+            raise RuntimeError("cannot join a coroutine before it is started")
+        try:
+            self._future.exception(timeout)
+        except (concurrent.futures.TimeoutError,
+                concurrent.futures.CancelledError):
+            pass
+
+    def _report_exception(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.getLogger(__name__).error(
+                "Exception in coroutine %s", self.name,
+                exc_info=future.exception())
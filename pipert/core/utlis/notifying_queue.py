@@ -0,0 +1,62 @@
+import queue
+import time
+
+
+class NotifyingQueue(queue.Queue):
+    """
+    A `queue.Queue` that calls its listeners every time an item is put in
+    it. A routine that reads from several queues registers the same
+    listener on all of them, so it can sleep until any of them has data.
+    """
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        Registers a callable that is called, without arguments, after every
+        put. Listeners are called while the queue is locked, so they should
+        do nothing more than wake someone up, e.g. set a `threading.Event`.
+        """
+        with self.mutex:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.mutex:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def get_many(self, max_items, timeout=None):
+        """
+        Waits until max_items items are in the queue, or as many as the
+        queue can hold if that's fewer, or until timeout seconds passed, and
+        returns a list of up to max_items items, the oldest first. The items
+        are taken while the queue is locked once, instead of once for every
+        item.
+        Args:
+            max_items: the maximal number of items to return
+            timeout: the maximal number of seconds to wait, 0 returns the
+            items that are already in the queue and None waits for the
+            items without a limit
+        """
+        if self.maxsize > 0:
+            # a full queue doesn't grow anymore, e.g. a RingQueue that keeps
+            # only the latest item
+            max_items = min(max_items, self.maxsize)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.not_empty:
+            while self._qsize() < max_items:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.not_empty.wait(remaining)
+            items = [self._get() for _ in range(min(max_items, self._qsize()))]
+            if items:
+                self.not_full.notify(len(items))
+        return items
+
+    def _put(self, item):
+        super()._put(item)
+        for listener in self._listeners:
+            listener()
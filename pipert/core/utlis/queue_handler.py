@@ -2,6 +2,9 @@ import queue
 import multiprocessing as mp
 from typing import Union
 import time
+from .auto_queue import AutoQueue
+from .notifying_queue import NotifyingQueue
+from .ring_queue import put_dropping_oldest
 
 
 class QueueHandler:
@@ -45,12 +48,73 @@ class QueueHandler:
             time.sleep(0)
             return None
 
+    def get_batch(self, max_items, max_wait=None):
+        """
+        Waits until max_items items are in the queue, or as many as a
+        bounded thread queue can hold if that's fewer, or until max_wait
+        seconds passed, and returns a list of up to max_items items, the
+        oldest first. The list is empty if no item arrived in time.
+        Args:
+            max_items: the maximal number of items to return
+            max_wait: the maximal number of seconds to wait, 0 returns the
+            items that are already in the queue and None waits for
+            max_items items
+
+        Returns:
+            list of items from the queue
+        """
+        q = self.q.queue if isinstance(self.q, AutoQueue) else self.q
+        if isinstance(q, NotifyingQueue):
+            return q.get_many(max_items, max_wait)
+        if isinstance(q, queue.Queue) and q.maxsize > 0:
+            max_items = min(max_items, q.maxsize)
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        items = []
+        while len(items) < max_items:
+            try:
+                items.append(self.q.get(block=False))
+                continue
+            except queue.Empty:
+                pass
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                items.append(self.q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
     def put(self, item, block=True, timeout=None):
         """
         Works just like the `put` method of `queue.Queue`
         """
         self.q.put(item, block, timeout)
 
+    def put_many(self, items, block=True, timeout=None):
+        """
+        Puts the items in the queue in order. If the queue stays full for
+        timeout seconds, or at all if block is False, the rest of the items
+        aren't put.
+        Args:
+            items: the items to put in the queue
+            block: whether to wait for room in the queue
+            timeout: the maximal number of seconds to wait for all the items
+
+        Returns:
+            the number of items that were put in the queue
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        count = 0
+        for item in items:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                self.q.put(item, block, remaining)
+            except queue.Full:
+                break
+            count += 1
+        return count
+
     def timeout_put(self, item, timeout):
         """
         If timeout is reached returns `False`, else puts item in queue
@@ -99,14 +163,7 @@ class QueueHandler:
             self.q.put(item, timeout=timeout)
             return True
         except queue.Full:
-            try:
-                _ = self.q.get(block=False)
-                dropped = False
-            except queue.Empty:
-                dropped = True
-            # TODO - could crash due to a race condition, could be solved with a lock
-            self.q.put(item, block=False)
-            return dropped
+            return put_dropping_oldest(self.q, item)
 
     def deque_non_blocking_put(self, item):
         """
@@ -118,15 +175,4 @@ class QueueHandler:
         Returns:
             True if successful, False if had to deque an item
         """
-        try:
-            self.q.put(item, block=False)
-            return True
-        except queue.Full:
-            try:
-                _ = self.q.get(block=False)
-                dropped = False
-            except queue.Empty:
-                dropped = True
-            # TODO - could crash due to a race condition, could be solved with a lock
-            self.q.put(item, block=False)
-            return dropped
+        return put_dropping_oldest(self.q, item)
@@ -0,0 +1,100 @@
+from queue import Empty, Full
+from .notifying_queue import NotifyingQueue
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block", "latest_only")
+
+
+class RingQueue(NotifyingQueue):
+    """
+    A bounded queue that decides by itself what happens when an item is put
+    while it's full, and counts the items it drops:
+
+    - "drop_oldest": the oldest item is dropped to make room.
+    - "drop_newest": the new item is dropped.
+    - "block": put waits for room, like `queue.Queue`.
+    - "latest_only": only the newest item is kept, the queue holds a single
+      item whatever its size is.
+
+    Dropping is done in the same critical section as the put, so a consumer
+    can't take the queue's last item between the two (which made the
+    producer's put fail) and the queue is locked once instead of three times.
+
+    The queue is a lock and a condition variable around a deque rather than
+    a lock-free single producer ring: without atomic operations a lock-free
+    ring in Python relies on the GIL anyway, and the queues are not single
+    producer - the thread pool of MultiListen2Stream puts the frames of all
+    its sources into one queue, so a drop needs the lock to stay atomic.
+    """
+
+    def __init__(self, maxsize=1, overflow="drop_oldest"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy '{0}', expected one of "
+                             "{1}".format(overflow, ", ".join(OVERFLOW_POLICIES)))
+        if overflow == "latest_only":
+            maxsize = 1
+        elif maxsize <= 0 and overflow != "block":
+            raise ValueError("A queue that drops items must be bounded")
+        super().__init__(maxsize)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def put(self, item, block=True, timeout=None):
+        if self.overflow == "block":
+            super().put(item, block, timeout)
+        elif self.overflow == "drop_newest":
+            with self.mutex:
+                if self._qsize() >= self.maxsize:
+                    self.dropped += 1
+                else:
+                    self._put_locked(item)
+        else:
+            self.put_overwrite(item)
+
+    def put_overwrite(self, item):
+        """
+        Puts the item, dropping the oldest item if the queue is full,
+        whatever the overflow policy is. Returns True if no item was
+        dropped.
+        """
+        with self.mutex:
+            dropped = self._qsize() >= self.maxsize > 0
+            if dropped:
+                self.queue.popleft()
+                self.dropped += 1
+                # the dropped item will never be marked as done
+                self.unfinished_tasks -= 1
+            self._put_locked(item)
+        return not dropped
+
+    def _put_locked(self, item):
+        self._put(item)
+        self.unfinished_tasks += 1
+        self.not_empty.notify()
+
+
+def put_dropping_oldest(q, item):
+    """
+    Puts the item in q, dropping the oldest item in q if it's full. Returns
+    True if no item was dropped. RingQueues do it atomically, other queues
+    with a get and a put that may race with the consumer, in which case the
+    item is put once the consumer made room for it.
+    """
+    put_overwrite = getattr(q, "put_overwrite", None)
+    if put_overwrite is not None:
+        return put_overwrite(item)
+    try:
+        q.put(item, block=False)
+        return True
+    except Full:
+        pass
+    while True:
+        try:
+            q.get(block=False)
+        except Empty:
+            pass
+        try:
+            q.put(item, block=False)
+            return False
+        except Full:
+            # another producer filled the queue again, try again
+            continue
@@ -0,0 +1,117 @@
+import os
+import pickle
+import time
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty, Full
+import numpy as np
+import torch.multiprocessing as mp
+
+
+class SharedMemoryQueue:
+    """
+    A single producer queue that passes picklable items between processes
+    through a ring of slots in a single shared memory, so putting and
+    getting an item costs a copy into and out of the memory instead of a
+    round trip through a pipe and a feeder thread.
+
+    The producer writes the pickled item into the next slot and only then
+    advances the write counter, so the consumer never sees a slot that is
+    being written. Getting is done under a lock, because routines drop the
+    oldest item from the producer's side when the queue is full. Waiting for
+    room or for items polls every POLL_INTERVAL seconds.
+    """
+    # the read counter and the write counter, one cache line each
+    HEADER_SIZE = 128
+    SLOT_HEADER_SIZE = 8
+    DEFAULT_SLOT_SIZE = 2 ** 23
+    POLL_INTERVAL = 0.0005
+
+    def __init__(self, maxsize=1, slot_size=DEFAULT_SLOT_SIZE):
+        """
+        Args:
+            maxsize: the number of slots, an unbounded queue isn't possible
+            so 0 is taken as a single slot.
+            slot_size: the maximal size of a pickled item.
+        """
+        self.maxsize = max(maxsize, 1)
+        self.slot_size = slot_size
+        self.memory = SharedMemory(
+            create=True,
+            size=self.HEADER_SIZE
+            + self.maxsize * (self.SLOT_HEADER_SIZE + slot_size))
+        self._owner_pid = os.getpid()
+        self._read_count = np.ndarray((1,), np.uint64, self.memory.buf, 0)
+        self._write_count = np.ndarray((1,), np.uint64,
+                                       self.memory.buf, self.HEADER_SIZE // 2)
+        self._get_lock = mp.Lock()
+
+    def qsize(self):
+        return int(self._write_count[0] - self._read_count[0])
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        return self.qsize() >= self.maxsize
+
+    def put(self, item, block=True, timeout=None):
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.slot_size:
+            raise ValueError("An item of {0} bytes doesn't fit in a queue slot "
+                             "of {1} bytes".format(len(data), self.slot_size))
+        self._wait(self.full, block, timeout, Full)
+        write_count = int(self._write_count[0])
+        offset = self._get_slot_offset(write_count)
+        self.memory.buf[offset:offset + self.SLOT_HEADER_SIZE] = \
+            len(data).to_bytes(self.SLOT_HEADER_SIZE, "little")
+        start = offset + self.SLOT_HEADER_SIZE
+        self.memory.buf[start:start + len(data)] = data
+        self._write_count[0] = write_count + 1
+
+    def get(self, block=True, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._get_lock:
+                read_count = int(self._read_count[0])
+                if read_count < int(self._write_count[0]):
+                    offset = self._get_slot_offset(read_count)
+                    size = int.from_bytes(
+                        self.memory.buf[offset:offset + self.SLOT_HEADER_SIZE],
+                        "little")
+                    start = offset + self.SLOT_HEADER_SIZE
+                    item = pickle.loads(self.memory.buf[start:start + size])
+                    self._read_count[0] = read_count + 1
+                    return item
+            remaining = None if deadline is None else deadline - time.monotonic()
+            self._wait(self.empty, block, remaining, Empty)
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def close(self):
+        """
+        Releases the shared memory, the process that created the queue also
+        destroys it.
+        """
+        del self._read_count, self._write_count
+        self.memory.close()
+        if os.getpid() == self._owner_pid:
+            self.memory.unlink()
+
+    def _get_slot_offset(self, count):
+        slot = count % self.maxsize
+        return self.HEADER_SIZE + slot * (self.SLOT_HEADER_SIZE + self.slot_size)
+
+    def _wait(self, is_blocked, block, timeout, error):
+        if not is_blocked():
+            return
+        if not block or (timeout is not None and timeout <= 0):
+            raise error
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while is_blocked():
+            if deadline is not None and time.monotonic() >= deadline:
+                raise error
+            time.sleep(self.POLL_INTERVAL)
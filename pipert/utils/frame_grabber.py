@@ -0,0 +1,170 @@
+import threading
+import time
+import cv2
+
+
+class FrameGrabber:
+    """
+    Reads the frames of a video source in a thread of its own, so the
+    source's buffers are drained as fast as it produces frames, whatever
+    the rate its consumer reads them at, and the consumer always gets the
+    newest frame.
+
+    Every frame is grabbed, but a frame is only retrieved (converted into
+    an image) if the consumer may read it: when no frame is waiting for
+    the consumer, or when the consumer is expected to read before the
+    next frame arrives. Other frames are skipped without being converted.
+    Retrieved frames are written into a small pool of reused buffers.
+
+    Files are played at their own pace, each frame is grabbed at the time
+    its presentation timestamp says.
+    """
+    # the weight of the last interval between reads in the estimate of the
+    # consumer's read interval
+    READ_INTERVAL_SMOOTHING = 0.1
+
+    def __init__(self, stream_address, pool_size=3, pace=False, fps=30.):
+        """
+        Args:
+            stream_address: a camera index, a file or a stream URL, like
+            the source of `cv2.VideoCapture`.
+            pool_size: the number of frame buffers. A buffer is held by
+            the consumer, another by the frame waiting for the consumer and
+            the rest are retrieved into.
+            pace: whether to play the source at the pace of its timestamps,
+            for sources that are files.
+            fps: the frame rate to assume when the source doesn't report it.
+        """
+        self.stream_address = stream_address
+        self.pool_size = pool_size
+        self.pace = pace
+        self.fps = fps
+        self.stream = None
+        self.skipped = 0
+        self._free_buffers = []
+        # the ids of the buffers the consumer read and didn't release yet
+        self._lent = set()
+        self._ready = None
+        self._ended = False
+        self._consumer_waiting = False
+        self._last_read = None
+        self._read_interval = None
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.stream = cv2.VideoCapture(self.stream_address)
+        self.fps = self.stream.get(cv2.CAP_PROP_FPS) or self.fps
+        self._free_buffers = [None] * self.pool_size
+        self._lent = set()
+        self._ready = None
+        self._ended = False
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._grab_frames,
+                                        name="frame-grabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.stream is not None:
+            self.stream.release()
+            self.stream = None
+
+    def read(self, timeout=None):
+        """
+        Returns the newest frame and its presentation timestamp in seconds,
+        waiting up to timeout seconds for a frame. Returns None if there is
+        no new frame in time or the source ended.
+
+        The frame is one of the grabber's buffers, it must be given back
+        with release once it isn't used anymore.
+        """
+        with self._condition:
+            now = time.monotonic()
+            if self._last_read is not None:
+                interval = now - self._last_read
+                if self._read_interval is None:
+                    self._read_interval = interval
+                else:
+                    self._read_interval += \
+                        self.READ_INTERVAL_SMOOTHING * (interval - self._read_interval)
+            self._last_read = now
+            self._consumer_waiting = True
+            self._condition.wait_for(
+                lambda: self._ready is not None or self._ended, timeout)
+            self._consumer_waiting = False
+            ready, self._ready = self._ready, None
+            if ready is not None:
+                self._lent.add(id(ready[0]))
+            return ready
+
+    def release(self, frame):
+        """
+        Gives a frame that was read back to the pool of buffers. Returns
+        False and ignores the frame if it isn't a buffer the consumer holds,
+        e.g. a frame that was already released or that was read before the
+        grabber was started again.
+        """
+        with self._condition:
+            if id(frame) not in self._lent:
+                return False
+            self._lent.remove(id(frame))
+            self._free_buffers.append(frame)
+            return True
+
+    @property
+    def ended(self):
+        return self._ended
+
+    def _should_retrieve(self, frame_interval):
+        if self._ready is None or self._consumer_waiting or self._read_interval is None:
+            return True
+        next_read = self._last_read + self._read_interval
+        return time.monotonic() + frame_interval >= next_read
+
+    def _grab_frames(self):
+        frame_interval = 1 / self.fps
+        start = None
+        last_pts = None
+        while not self._stop_event.is_set():
+            if not self.stream.grab():
+                break
+            pts = self.stream.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            # sources without timestamps are taken to have a constant rate
+            if last_pts is not None and pts <= last_pts:
+                pts = last_pts + frame_interval
+            last_pts = pts
+            if self.pace:
+                if start is None:
+                    start = time.monotonic() - pts
+                delay = start + pts - time.monotonic()
+                if delay > 0 and self._stop_event.wait(delay):
+                    break
+
+            with self._condition:
+                if not self._free_buffers or not self._should_retrieve(frame_interval):
+                    self.skipped += 1
+                    continue
+                buffer = self._free_buffers.pop()
+            retrieved, frame = self.stream.retrieve(buffer)
+            with self._condition:
+                if not retrieved:
+                    self._free_buffers.append(buffer)
+                    continue
+                if self._ready is not None:
+                    # the consumer didn't get to the previous frame
+                    self._free_buffers.append(self._ready[0])
+                    self.skipped += 1
+                self._ready = (frame, pts)
+                self._condition.notify_all()
+
+        with self._condition:
+            self._ended = True
+            self._condition.notify_all()
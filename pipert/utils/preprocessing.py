@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+
+
+class FramePreprocessor:
+    """
+    Turns frames into model inputs: optionally converts them to grayscale,
+    resizes them, either keeping their aspect ratio by letterboxing them or
+    stretching them, swaps their channels from BGR to RGB, transposes them
+    from HWC to CHW and divides them by pixel_scale, converting them to
+    dtype.
+
+    The frames are resized straight into a padded canvas whose borders are
+    filled once, and the channels of the canvas are converted and scaled
+    straight into the output, a plane at a time. The intermediate buffers
+    and the outputs are allocated once for every frame shape and reused for
+    the next frames, so an output is only valid until the next frame of the
+    same shape is preprocessed, unless it's written into out.
+    """
+
+    def __init__(self, size, letterbox=True, stride=None, color=(128, 128, 128), gray=False, swap_rb=True,
+                 chw=True, pixel_scale=255., dtype=np.float32, interpolation=cv2.INTER_AREA):
+        """
+        Args:
+            size: the size of the outputs, an int for square outputs, a
+            (width, height) pair, or None to keep the size of the frames.
+            letterbox: whether to keep the aspect ratio of the frames and
+            pad them with color, or stretch them to size.
+            stride: if given, letterboxed outputs are cut to the smallest
+            size that holds the resized frame and is padded to a multiple
+            of stride (the 'auto' mode of yolov3's letterbox).
+            gray: whether to convert BGR frames to grayscale.
+            swap_rb: whether to swap the blue and red channels.
+            chw: whether the outputs are CHW (like the inputs of torch
+            models) rather than HWC.
+            pixel_scale: the outputs are the pixel values divided by
+            pixel_scale, None leaves them as they are.
+            dtype: the type of the outputs.
+        """
+        self.size = (size, size) if isinstance(size, int) else size and tuple(size)
+        self.letterbox = letterbox
+        self.stride = stride
+        self.color = color
+        self.gray = gray
+        self.swap_rb = swap_rb
+        self.chw = chw
+        self.pixel_scale = pixel_scale
+        self.dtype = dtype
+        self.interpolation = interpolation
+        self._geometries = {}
+        self._grays = {}
+        self._canvases = {}
+        self._planes = {}
+        self._outputs = {}
+
+    def get_output_shape(self, frame_shape):
+        """
+        Returns the shape of the output of a frame of the given shape.
+        """
+        height, width = self._get_geometry(frame_shape)[2]
+        channels = frame_shape[2] if len(frame_shape) > 2 and not self.gray else 1
+        return (channels, height, width) if self.chw else (height, width, channels)
+
+    def __call__(self, frame, out=None):
+        """
+        Preprocesses a frame into out, or into a buffer of the preprocessor
+        if out isn't given, and returns it.
+        """
+        if out is None:
+            out = self._outputs.get(frame.shape)
+            if out is None:
+                out = np.empty(self.get_output_shape(frame.shape), dtype=self.dtype)
+                self._outputs[frame.shape] = out
+        if self.gray and frame.ndim > 2:
+            frame = self._to_gray(frame)
+        canvas = self._resize(frame)
+        if canvas.ndim == 2:
+            canvas = canvas[..., None]
+
+        if self.chw:
+            # splitting the channels into planes is much faster than
+            # reading the transposed canvas
+            planes = self._planes.get(canvas.shape)
+            if planes is None:
+                planes = [np.empty(canvas.shape[:2], dtype=canvas.dtype) for _ in range(canvas.shape[2])]
+                self._planes[canvas.shape] = planes
+            cv2.split(canvas, planes)
+            pairs = zip(out, planes[::-1] if self.swap_rb else planes)
+        else:
+            pairs = [(out, canvas[..., ::-1] if self.swap_rb else canvas)]
+        for dst, src in pairs:
+            if self.pixel_scale is None:
+                np.copyto(dst, src, casting="unsafe")
+            else:
+                np.divide(src, self.pixel_scale, out=dst, dtype=dst.dtype, casting="unsafe")
+        return out
+
+    def _to_gray(self, frame):
+        gray = self._grays.get(frame.shape)
+        if gray is None:
+            gray = np.empty(frame.shape[:2], dtype=frame.dtype)
+            self._grays[frame.shape] = gray
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+
+    def _resize(self, frame):
+        new_unpad, padding, (height, width) = self._get_geometry(frame.shape)
+        if frame.shape[1::-1] == new_unpad and not any(padding):
+            # the frame is neither resized nor padded
+            return frame
+        canvas = self._canvases.get(frame.shape)
+        if canvas is None:
+            canvas = np.empty((height, width) + frame.shape[2:], dtype=frame.dtype)
+            # only the borders are left as they are, so they're filled once
+            canvas[...] = self.color[:frame.shape[2]] if frame.ndim > 2 else self.color[0]
+            self._canvases[frame.shape] = canvas
+        top, bottom, left, right = padding
+        inner = canvas[top:height - bottom, left:width - right]
+        if frame.shape[1::-1] != new_unpad:
+            cv2.resize(frame, new_unpad, dst=inner, interpolation=self.interpolation)
+        else:
+            np.copyto(inner, frame)
+        return canvas
+
+    def _get_geometry(self, frame_shape):
+        # the size of the resized frame, the padding around it and the
+        # size of the output, for frames of the given shape
+        geometry = self._geometries.get(frame_shape)
+        if geometry is not None:
+            return geometry
+        shape = frame_shape[:2]
+        if self.size is None:
+            geometry = (shape[::-1], (0, 0, 0, 0), shape)
+        elif not self.letterbox:
+            width, height = self.size
+            geometry = ((width, height), (0, 0, 0, 0), (height, width))
+        else:
+            width, height = self.size
+            ratio = min(width / shape[1], height / shape[0])
+            # a very thin frame keeps at least a pixel
+            new_unpad = (max(int(round(shape[1] * ratio)), 1), max(int(round(shape[0] * ratio)), 1))
+            if self.stride:
+                dw = np.mod(width - new_unpad[0], self.stride) / 2
+                dh = np.mod(height - new_unpad[1], self.stride) / 2
+            else:
+                dw = (width - new_unpad[0]) / 2
+                dh = (height - new_unpad[1]) / 2
+            top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+            left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+            geometry = (new_unpad, (top, bottom, left, right),
+                        (new_unpad[1] + top + bottom, new_unpad[0] + left + right))
+        self._geometries[frame_shape] = geometry
+        return geometry
@@ -0,0 +1,121 @@
+"""
+The per class, box by box non_max_suppression that the vectorized one
+replaced, and crowded YOLO outputs to compare them on. Used by test_nms and
+by benchmarks/nms.py.
+"""
+import torch
+from pipert.contrib.detection_demo.utils import bbox_iou, xywh2xyxy
+
+NMS_STYLES = ("OR", "AND", "MERGE", "SOFT")
+
+
+def reference_non_max_suppression(prediction, conf_thres=0.5, nms_thres=0.5, nms_style='MERGE'):
+    # the per class, box by box implementation that non_max_suppression replaced
+
+    min_wh = 2  # (pixels) minimum box width and height
+
+    output = [None] * len(prediction)
+    for image_i, pred in enumerate(prediction):
+        # Multiply conf by class conf to get combined confidence
+        class_conf, class_pred = pred[:, 5:].max(1)
+        pred[:, 4] *= class_conf
+
+        # Select only suitable predictions
+        i = (pred[:, 4] > conf_thres) & (pred[:, 2:4] > min_wh).all(1) & torch.isfinite(pred).all(1)
+        pred = pred[i]
+
+        # If none are remaining => process next image
+        if len(pred) == 0:
+            continue
+
+        # Select predicted classes
+        class_pred = class_pred[i].unsqueeze(1).float()
+
+        # Box (center x, center y, width, height) to (x1, y1, x2, y2)
+        pred[:, :4] = xywh2xyxy(pred[:, :4])
+
+        # Detections ordered as (x1y1x2y2, obj_conf, class_conf, class_pred)
+        pred = torch.cat((pred, class_pred), 1)
+
+        # Get detections sorted by decreasing confidence scores
+        pred = pred[(-pred[:, 4]).argsort()]
+
+        det_max = []
+        for c in pred[:, -1].unique():
+            dc = pred[pred[:, -1] == c]  # select class c
+            n = len(dc)
+            if n == 1:
+                det_max.append(dc)  # No NMS required if only 1 prediction
+                continue
+            elif n > 100:
+                dc = dc[:100]  # limit to first 100 boxes: https://github.com/ultralytics/yolov3/issues/117
+
+            # Non-maximum suppression
+            if nms_style == 'OR':  # default
+                while dc.shape[0]:
+                    det_max.append(dc[:1])  # save highest conf detection
+                    if len(dc) == 1:  # Stop if we're at the last detection
+                        break
+                    iou = bbox_iou(dc[0], dc[1:])  # iou with other boxes
+                    dc = dc[1:][iou < nms_thres]  # remove ious > threshold
+
+            elif nms_style == 'AND':  # requires overlap, single boxes erased
+                while len(dc) > 1:
+                    iou = bbox_iou(dc[0], dc[1:])  # iou with other boxes
+                    if iou.max() > 0.5:
+                        det_max.append(dc[:1])
+                    dc = dc[1:][iou < nms_thres]  # remove ious > threshold
+
+            elif nms_style == 'MERGE':  # weighted mixture box
+                while len(dc):
+                    if len(dc) == 1:
+                        det_max.append(dc)
+                        break
+                    i = bbox_iou(dc[0], dc) > nms_thres  # iou with other boxes
+                    weights = dc[i, 4:5]
+                    dc[0, :4] = (weights * dc[i, :4]).sum(0) / weights.sum()
+                    det_max.append(dc[:1])
+                    dc = dc[i == 0]
+
+            elif nms_style == 'SOFT':  # soft-NMS https://arxiv.org/abs/1704.04503
+                sigma = 0.5  # soft-nms sigma parameter
+                while len(dc):
+                    if len(dc) == 1:
+                        det_max.append(dc)
+                        break
+                    det_max.append(dc[:1])
+                    iou = bbox_iou(dc[0], dc[1:])  # iou with other boxes
+                    dc = dc[1:]
+                    dc[:, 4] *= torch.exp(-iou ** 2 / sigma)  # decay confidences
+
+        if len(det_max):
+            det_max = torch.cat(det_max)  # concatenate
+            output[image_i] = det_max[(-det_max[:, 4]).argsort()]  # sort
+
+    return output
+
+
+def create_prediction(batch_size, objects, boxes_per_object, classes, size=416):
+    """
+    Creates a YOLO output of crowded scenes, where every object is
+    detected by several overlapping boxes.
+    """
+    count = objects * boxes_per_object
+    centers = torch.rand(batch_size, objects, 1, 2) * size
+    wh = 16 + torch.rand(batch_size, objects, 1, 2) * 48
+    xy = centers + torch.randn(batch_size, objects, boxes_per_object, 2) * 4
+    wh = wh * (1 + torch.randn(batch_size, objects, boxes_per_object, 2) * 0.1)
+    prediction = torch.zeros(batch_size, count, 5 + classes)
+    prediction[..., :2] = xy.view(batch_size, count, 2)
+    prediction[..., 2:4] = wh.view(batch_size, count, 2)
+    prediction[..., 4] = torch.rand(batch_size, count)
+    object_classes = torch.randint(0, classes, (batch_size, objects, 1)).expand(-1, -1, boxes_per_object)
+    prediction[..., 5:] = torch.rand(batch_size, count, classes) * 0.5
+    prediction[..., 5:].scatter_(2, object_classes.reshape(batch_size, count, 1),
+                                 0.5 + torch.rand(batch_size, count, 1) * 0.5)
+    return prediction
+
+
+def outputs_equal(output, reference):
+    return all((a is None and b is None) or (a is not None and b is not None and torch.equal(a, b))
+               for a, b in zip(output, reference))
@@ -0,0 +1,180 @@
+import threading
+import time
+import cv2
+import numpy as np
+import pytest
+from queue import Queue
+from torch.multiprocessing import Event
+from pipert.contrib import multi_vid_capture
+from pipert.contrib.multi_vid_capture import MultiListen2Stream
+
+
+class FakeGrabber:
+    """
+    A FrameGrabber that always has a new frame, and fails to start on
+    addresses that start with "fail".
+    """
+
+    def __init__(self, stream_address, pace=False, fps=30.):
+        self.stream_address = stream_address
+        self.fps = fps
+        self.ended = False
+        self.running = False
+        self.reads = 0
+        self.released = []
+
+    def start(self):
+        if str(self.stream_address).startswith("fail"):
+            raise OSError(f"Can't open {self.stream_address}")
+        self.running = True
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def read(self, timeout=None):
+        self.reads += 1
+        return np.full((48, 64, 3), self.reads % 256, dtype=np.uint8), self.reads / self.fps
+
+    def release(self, frame):
+        self.released.append(frame)
+        return True
+
+
+@pytest.fixture
+def fake_grabbers(monkeypatch):
+    monkeypatch.setattr(multi_vid_capture, "FrameGrabber", FakeGrabber)
+
+
+@pytest.fixture
+def routine():
+    routine = MultiListen2Stream(Queue(), fps=30., workers=2, name="capture_frames")
+    routine.setup()
+    yield routine
+    routine.cleanup()
+
+
+def run_for(routine, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        routine.main_logic()
+    # waits for the hand-offs that are still running
+    routine.executor.submit(lambda: None).result()
+    time.sleep(0.05)
+
+
+def drain(q):
+    items = []
+    while not q.empty():
+        items.append(q.get())
+    return items
+
+
+def test_add_replace_and_remove_sources(fake_grabbers, routine):
+    routine.add_source("camera:0", "stream:a")
+    routine.add_source("camera:1", "stream:b")
+    run_for(routine, 0.2)
+    first = routine.sources["stream:a"]
+    assert set(routine.sources) == {"stream:a", "stream:b"}
+    assert {key for key, _ in drain(routine.q)} == {"stream:a", "stream:b"}
+
+    routine.add_source("camera:2", "stream:a")
+    run_for(routine, 0.2)
+    assert not first.grabber.running
+    assert routine.sources["stream:a"].stream_address == "camera:2"
+    assert {msg.source_address for key, msg in drain(routine.q) if key == "stream:a"} >= {"camera:2"}
+
+    routine.remove_source("stream:b")
+    run_for(routine, 0.2)
+    assert set(routine.sources) == {"stream:a"}
+    drain(routine.q)
+    run_for(routine, 0.1)
+    assert {key for key, _ in drain(routine.q)} == {"stream:a"}
+
+
+def test_sources_are_paced_to_their_fps(fake_grabbers, routine):
+    routine.add_source("camera:0", "slow", fps=10)
+    routine.add_source("camera:1", "fast", fps=50)
+    run_for(routine, 1)
+    keys = [key for key, _ in drain(routine.q)]
+    assert 8 <= keys.count("slow") <= 12
+    assert 40 <= keys.count("fast") <= 55
+
+
+def test_busy_source_isnt_read(fake_grabbers, routine):
+    routine.add_source("camera:0", "stream:a", fps=1000)
+    run_for(routine, 0.1)
+    source = routine.sources["stream:a"]
+    assert not source.busy
+    # every frame that was handed off went back to the grabber
+    assert len(source.grabber.released) == source.grabber.reads
+
+    source.busy = True
+    reads = source.grabber.reads
+    run_for(routine, 0.1)
+    assert source.grabber.reads == reads
+
+
+def test_slow_hand_off_holds_back_only_its_source(fake_grabbers, routine):
+    routine.add_source("camera:0", "stream:a", fps=1000)
+    routine.add_source("camera:1", "stream:b", fps=1000)
+    run_for(routine, 0.05)
+    unblocked = threading.Event()
+    slow = routine.sources["stream:a"]
+    release = slow.grabber.release
+
+    def blocking_release(frame):
+        unblocked.wait(5)
+        return release(frame)
+
+    slow.grabber.release = blocking_release
+    runner = threading.Thread(target=run_for, args=(routine, 0.2))
+    runner.start()
+    try:
+        time.sleep(0.1)
+        # the source isn't read again until its hand-off is done
+        assert slow.busy
+        reads = slow.grabber.reads
+        time.sleep(0.05)
+        assert slow.grabber.reads == reads
+    finally:
+        unblocked.set()
+        runner.join()
+    keys = [key for key, _ in drain(routine.q)]
+    assert keys.count("stream:b") > keys.count("stream:a")
+
+
+def test_source_that_fails_to_start_is_removed(fake_grabbers, routine):
+    routine.add_source("failing", "stream:a")
+    routine.add_source("camera:1", "stream:b")
+    run_for(routine, 0.2)
+    assert set(routine.sources) == {"stream:b"}
+    assert {key for key, _ in drain(routine.q)} == {"stream:b"}
+
+
+def test_file_sources(tmp_path):
+    paths = []
+    for i in range(2):
+        path = str(tmp_path / f"video{i}.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+        for _ in range(5):
+            writer.write(np.full((48, 64, 3), 100, dtype=np.uint8))
+        writer.release()
+        paths.append(path)
+
+    routine = MultiListen2Stream(Queue(), fps=1000., workers=2, name="capture_frames").as_thread()
+    routine.stop_event = Event()
+    for i, path in enumerate(paths):
+        routine.add_source(path, f"stream:{i}")
+    routine.start()
+    deadline = time.monotonic() + 5
+    # the sources are removed once they end
+    while time.monotonic() < deadline and (routine.q.empty() or routine.updated_configs or routine.sources):
+        time.sleep(0.05)
+    routine.stop_event.set()
+    routine.runner.join()
+    assert not routine.sources
+    items = drain(routine.q)
+    assert {key for key, _ in items} == {"stream:0", "stream:1"}
+    # the frames are resized to the output size
+    assert all(msg.get_payload().shape == (480, 640, 3) for _, msg in items)
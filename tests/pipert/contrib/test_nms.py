@@ -0,0 +1,23 @@
+import pytest
+import torch
+from tests.pipert.contrib.reference_nms import NMS_STYLES, create_prediction, outputs_equal, \
+    reference_non_max_suppression
+from pipert.contrib.detection_demo.utils import non_max_suppression
+
+
+@pytest.mark.parametrize("nms_style", NMS_STYLES)
+@pytest.mark.parametrize("objects,boxes_per_object,classes", [
+    # sparse scenes, where most classes have a single detection
+    (20, 1, 80),
+    (5, 2, 80),
+    # dense scenes, where every class has many overlapping detections
+    (200, 10, 80),
+    (30, 3, 3),
+])
+def test_non_max_suppression_matches_reference(nms_style, objects, boxes_per_object, classes):
+    torch.manual_seed(objects * boxes_per_object + classes)
+    prediction = create_prediction(2, objects, boxes_per_object, classes)
+    # both functions modify the prediction in place
+    reference = reference_non_max_suppression(prediction.clone(), 0.3, 0.5, nms_style)
+    output = non_max_suppression(prediction.clone(), 0.3, 0.5, nms_style)
+    assert outputs_equal(output, reference)
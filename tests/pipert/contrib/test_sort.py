@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+from pipert.contrib.sort_tracker.sort import KalmanBoxTrackers, Sort
+
+NO_DETECTIONS = np.empty((0, 5))
+# the tracks of create_scene, as the per object SORT implementation tracked
+# them: [x1, y1, x2, y2, score, id] for every frame, the newest track first
+EXPECTED_TRACKS = [
+    [
+        [270.06, 281.34, 330.06, 321.34, 0.64, 4],
+        [84.55, 164.01, 114.55, 234.01, 0.65, 3],
+        [174.73, 14.11, 224.73, 64.11, 0.73, 2],
+        [0.0, 0.3, 40.0, 60.3, 0.9, 1],
+    ],
+    [
+        [268.1, 278.71, 328.1, 318.71, 0.52, 4],
+        [86.66, 161.54, 116.66, 231.54, 0.81, 3],
+        [170.97, 20.7, 220.97, 70.7, 0.58, 2],
+        [6.11, 1.07, 46.11, 61.07, 0.61, 1],
+    ],
+    [
+        [268.33, 279.32, 328.33, 319.32, 0.68, 4],
+        [90.82, 159.11, 120.82, 229.11, 0.6, 3],
+        [164.64, 24.63, 214.64, 74.63, 0.85, 2],
+        [12.16, 3.69, 52.16, 63.69, 0.6, 1],
+    ],
+    [
+        [268.68, 279.96, 328.68, 319.96, 0.75, 4],
+        [94.18, 156.15, 124.18, 226.15, 0.77, 3],
+        [161.87, 29.76, 211.87, 79.76, 0.55, 2],
+        [18.01, 6.74, 58.01, 66.74, 0.87, 1],
+    ],
+    [
+        [269.58, 280.6, 329.58, 320.6, 0.8, 4],
+        [97.22, 153.55, 127.22, 223.55, 0.79, 3],
+        [23.49, 9.87, 63.49, 69.87, 0.69, 1],
+    ],
+    [
+        [270.66, 281.12, 330.66, 321.12, 0.94, 4],
+        [99.73, 150.08, 129.73, 220.08, 0.65, 3],
+        [29.96, 10.36, 69.96, 70.36, 0.61, 1],
+    ],
+    [
+        [270.17, 281.54, 330.17, 321.54, 0.94, 4],
+        [102.72, 146.79, 132.72, 216.79, 0.59, 3],
+        [35.65, 12.09, 75.65, 72.09, 0.96, 1],
+    ],
+    [
+        [270.14, 281.07, 330.14, 321.07, 0.51, 4],
+        [106.76, 144.4, 136.76, 214.4, 0.88, 3],
+        [41.73, 13.28, 81.73, 73.28, 0.77, 1],
+    ],
+    [
+        [270.24, 281.96, 330.24, 321.96, 0.68, 4],
+        [109.12, 140.55, 139.12, 210.55, 0.84, 3],
+        [141.79, 53.38, 191.79, 103.38, 0.8, 2],
+        [47.01, 15.99, 87.01, 75.99, 0.67, 1],
+    ],
+    [
+        [111.38, 137.79, 141.38, 207.79, 0.91, 3],
+        [139.06, 59.75, 189.06, 109.75, 0.71, 2],
+        [53.51, 17.87, 93.51, 77.87, 0.57, 1],
+    ],
+    [
+        [114.04, 135.18, 144.04, 205.18, 0.79, 3],
+        [134.97, 63.56, 184.97, 113.56, 0.97, 2],
+        [59.88, 19.57, 99.88, 79.57, 0.67, 1],
+    ],
+    [
+        [117.62, 131.9, 147.62, 201.9, 0.94, 3],
+        [131.85, 70.42, 181.85, 120.42, 0.71, 2],
+        [66.04, 20.82, 106.04, 80.82, 0.79, 1],
+    ],
+]
+
+
+@pytest.fixture(autouse=True)
+def reset_track_ids():
+    # the ids are counted by all the trackers together
+    KalmanBoxTrackers.count = 0
+
+
+@pytest.mark.parametrize("skipped_frames", [0, 1, 2])
+def test_tracks_expire_after_max_age_frames(skipped_frames):
+    tracker = Sort(max_age=6, min_hits=1)
+    tracker.update(np.array([[10., 10., 50., 50., 0.9]]))
+    frames = 0
+    # every update misses the track in 1 + skipped_frames frames
+    while len(tracker.trackers):
+        tracker.update(NO_DETECTIONS, skipped_frames)
+        frames += 1 + skipped_frames
+        if len(tracker.trackers):
+            assert tracker.trackers.age[0] == frames
+            assert tracker.trackers.time_since_update[0] == frames
+    # the track is dropped in the first update that misses it for more
+    # than max_age frames
+    assert 6 < frames <= 6 + 1 + skipped_frames
+
+
+def test_hit_streak_counts_detected_frames():
+    tracker = Sort(max_age=6, min_hits=3)
+    box = np.array([[10., 10., 50., 50., 0.9]])
+    tracker.update(box)
+    tracker.frame_count = 10  # past the first min_hits frames
+    # frames skipped between detections don't break the hit streak
+    assert tracker.update(box, 2) is None
+    assert tracker.update(box, 2) is None
+    output = tracker.update(box, 2)
+    assert tracker.trackers.hit_streak[0] == 3
+    assert output[0, -1] == 1
+
+
+def create_scene():
+    # four objects moving at constant velocities with noisy detections, the
+    # second is occluded for three frames and the fourth leaves
+    rng = np.random.default_rng(7)
+    starts = np.array([[20., 30.], [200., 40.], [100., 200.], [300., 300.]])
+    velocities = np.array([[6., 2.], [-4., 5.], [3., -3.], [0., 0.]])
+    sizes = np.array([[40., 60.], [50., 50.], [30., 70.], [60., 40.]])
+    frames = []
+    for t in range(12):
+        centers = starts + velocities * t + rng.normal(0, 1, starts.shape)
+        boxes = np.concatenate((centers - sizes / 2, centers + sizes / 2, rng.uniform(0.5, 1, (4, 1))), axis=1)
+        visible = np.ones(4, dtype=bool)
+        if 4 <= t < 7:
+            visible[1] = False
+        if t >= 9:
+            visible[3] = False
+        frames.append(np.round(boxes[visible], 2))
+    return frames
+
+
+def test_tracks_match_reference():
+    tracker = Sort(max_age=3, min_hits=2)
+    for dets, expected in zip(create_scene(), EXPECTED_TRACKS):
+        tracks = tracker.update(dets)
+        expected = np.array(expected)
+        np.testing.assert_array_equal(tracks[:, -1], expected[:, -1])
+        np.testing.assert_allclose(tracks[:, :-1], expected[:, :-1], atol=0.006)
@@ -0,0 +1,140 @@
+import argparse
+from queue import Queue
+import numpy as np
+import pytest
+import torch
+from pipert.contrib import yolov3
+from pipert.contrib.yolov3 import YoloV3Logic
+from pipert.core.message import Message, PredictionPayload
+from pipert.core.routine import State
+
+
+class StubModel:
+    """
+    A Darknet that doesn't detect anything by itself, and remembers the
+    batches it was given.
+    """
+
+    def __init__(self, cfg, img_size):
+        self.batches = []
+
+    def fuse(self):
+        pass
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+    def half(self):
+        return self
+
+    def __call__(self, batch):
+        self.batches.append((tuple(batch.shape), batch.data_ptr()))
+        return batch, None
+
+
+def stub_non_max_suppression(pred, conf_thres, nms_thres):
+    # a single detection that covers the whole letterboxed image, scored by
+    # the image's center pixel, and no detection for black frames
+    dets = []
+    for image in pred:
+        height, width = image.shape[1:]
+        score = image[0, height // 2, width // 2].item()
+        dets.append(torch.tensor([[0., 0., width, height, score, score, 1.]]) if score else None)
+    return dets
+
+
+class StubGate:
+    """
+    A MotionGate that answers the frames of the "static" source.
+    """
+
+    def reuse_result(self, msg):
+        if msg.source_address != "static":
+            return False
+        msg.payload = PredictionPayload("reused")
+        return True
+
+    def remember(self, msg):
+        pass
+
+
+@pytest.fixture
+def routine(monkeypatch):
+    monkeypatch.setattr(yolov3, "opt", argparse.Namespace(img_size=416, output="camera:2", source="0",
+                                                          weights="yolov3.weights", half=False, cfg="yolov3.cfg",
+                                                          names="coco.names", conf_thres=0.3, nms_thres=0.5),
+                        raising=False)
+    monkeypatch.setattr(yolov3, "Darknet", StubModel)
+    monkeypatch.setattr(yolov3, "load_darknet_weights", lambda model, weights: None)
+    monkeypatch.setattr(yolov3, "load_classes", lambda names: ["person"])
+    monkeypatch.setattr(yolov3, "non_max_suppression", stub_non_max_suppression)
+    routine = YoloV3Logic(Queue(), Queue(), batch_size=4, name="yolo_logic")
+    # the state a runner gives the routine
+    routine.state = State()
+    routine.setup()
+    return routine
+
+
+def create_message(height, width, value, source_address="camera:0"):
+    return Message(np.full((height, width, 3), value, dtype=np.uint8), source_address)
+
+
+def detect(routine, msgs):
+    for msg in msgs:
+        routine.in_queue.put(msg)
+    assert routine.main_logic()
+    outputs = []
+    while not routine.out_queue.empty():
+        outputs.append(routine.out_queue.get())
+    return outputs
+
+
+def test_batches_are_grouped_by_shape(routine):
+    shapes = [(480, 640), (640, 480), (240, 320), (640, 480)]
+    msgs = [create_message(*shape, value=50 * (i + 1)) for i, shape in enumerate(shapes)]
+    assert detect(routine, msgs) == msgs
+    # a forward pass for each letterboxed shape
+    assert sorted(shape for shape, _ in routine.model.batches) == [(2, 3, 320, 416), (2, 3, 416, 320)]
+    for i, (msg, shape) in enumerate(zip(msgs, shapes)):
+        instances = msg.get_payload()
+        assert instances.image_size == shape + (3,)
+        # each message has the detection of its own frame, in its coordinates
+        assert instances.scores.tolist() == pytest.approx([50 * (i + 1) / 255.])
+        assert instances.pred_boxes.tensor.tolist() == [[0, 0, shape[1], shape[0]]]
+        assert instances.pred_classes.tolist() == [1]
+
+
+def test_frames_without_detections(routine):
+    msgs = [create_message(480, 640, 0), create_message(480, 640, 100)]
+    detect(routine, msgs)
+    assert msgs[0].get_payload().pred_boxes == []
+    assert len(msgs[1].get_payload().pred_boxes) == 1
+
+
+def test_batch_buffers_are_reused(routine):
+    detect(routine, [create_message(480, 640, 10), create_message(480, 640, 20)])
+    detect(routine, [create_message(240, 320, 30), create_message(480, 640, 40)])
+    first, second = routine.model.batches
+    assert first == second
+    assert len(routine._batches) == 1
+    # a batch of another size has its own buffer
+    detect(routine, [create_message(480, 640, 50)])
+    assert routine.model.batches[2][0] == (1, 3, 320, 416)
+    assert len(routine._batches) == 2
+    routine.cleanup()
+    assert not routine._batches
+
+
+def test_motion_gated_messages_keep_their_order(routine):
+    routine.gate(StubGate())
+    msgs = [create_message(480, 640, 10, "static"), create_message(480, 640, 20),
+            create_message(640, 480, 30, "static"), create_message(640, 480, 40)]
+    assert detect(routine, msgs) == msgs
+    # only the frames that weren't answered by the gate are detected
+    assert [shape for shape, _ in routine.model.batches] == [(1, 3, 320, 416), (1, 3, 416, 320)]
+    assert msgs[0].get_payload() == msgs[2].get_payload() == "reused"
+    assert msgs[1].get_payload().scores.tolist() == pytest.approx([20 / 255.])
+    assert msgs[3].get_payload().scores.tolist() == pytest.approx([40 / 255.])
@@ -1,8 +1,11 @@
 import time
+import pytest
 from threading import Thread
 from torch.multiprocessing import Process
+from pipert.core.utlis import AutoQueue, NotifyingQueue, SharedMemoryQueue
 from tests.pipert.core.utils.dummy_routine import DummyRoutine
 from tests.pipert.core.utils.dummy_component import DummyComponent
+from tests.pipert.core.utils.dummy_routine_with_queue import DummyRoutineWithQueue
 
 
 def test_register_routine():
@@ -39,3 +42,139 @@ def test_change_runner():
     comp.as_process()
     process_runner = comp.runner_creator
     assert thread_runner != process_runner
+
+
+class FailingRoutine(DummyRoutine):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runs = 0
+
+    def setup(self, *args, **kwargs):
+        self.runs += 1
+
+    def main_logic(self, *args, **kwargs):
+        raise RuntimeError("routine failure")
+
+
+def supervise_failing_routine(max_routine_restarts):
+    comp = DummyComponent(max_routine_restarts=max_routine_restarts)
+    rout = FailingRoutine(name="failing").as_thread()
+    comp.register_routine(rout)
+    comp.stop_event.clear()
+    comp._start()
+    for _ in range(max_routine_restarts + 2):
+        rout.runner.join()
+        comp._supervise_routines()
+    comp.stop_event.set()
+    rout.runner.join()
+    return comp, rout
+
+
+def test_dead_routine_is_restarted():
+    comp, rout = supervise_failing_routine(max_routine_restarts=2)
+    assert rout.runs == 3
+    assert comp.routine_restarts["failing"] == 3
+
+
+def test_dead_routine_is_reported(caplog):
+    comp, rout = supervise_failing_routine(max_routine_restarts=0)
+    assert rout.runs == 1
+    assert "Routine failing died" in caplog.text
+
+
+def test_create_queue_of_kind():
+    comp = DummyComponent()
+    comp.create_queue("thread", queue_kind="thread")
+    comp.create_queue("shared_memory", queue_kind="shared_memory")
+    comp.create_queue("auto")
+    assert isinstance(comp.get_queue("thread"), NotifyingQueue)
+    assert isinstance(comp.get_queue("shared_memory"), SharedMemoryQueue)
+    assert isinstance(comp.get_queue("auto"), AutoQueue)
+    with pytest.raises(ValueError):
+        comp.create_queue("other", queue_kind="other")
+    comp.delete_queue("shared_memory")
+
+
+def test_create_queue_with_slot_size():
+    comp = DummyComponent()
+    comp.create_queue("shared_memory", queue_kind="shared_memory", slot_size=2 ** 24)
+    comp.create_queue("auto", slot_size=2 ** 24)
+    item = bytes(2 ** 23 + 1)
+    q = comp.get_queue("shared_memory")
+    q.put(item)
+    assert q.get() == item
+    q = comp.get_queue("auto")
+    q.switch_to("shared_memory")
+    q.put(item)
+    assert q.get() == item
+    comp.delete_queue("shared_memory")
+    comp.delete_queue("auto")
+
+
+def test_create_queue_with_overflow():
+    comp = DummyComponent()
+    comp.create_queue("latest", queue_size=3, overflow="latest_only")
+    q = comp.get_queue("latest")
+    for i in range(3):
+        q.put(i)
+    assert q.get() == 2
+    assert q.dropped == 2
+    with pytest.raises(ValueError):
+        comp.create_queue("process", queue_kind="process", overflow="drop_oldest")
+
+
+@pytest.mark.parametrize("producer_mode,consumer_mode,queue_kind", [
+    ("thread", "thread", "thread"),
+    ("process", "thread", "shared_memory"),
+    ("thread", None, "thread"),
+    ("process", None, "process"),
+])
+def test_choose_queue_kind(producer_mode, consumer_mode, queue_kind):
+    comp = DummyComponent()
+    comp.create_queue("queue")
+    q = comp.get_queue("queue")
+    for name, mode in [("producer", producer_mode), ("consumer", consumer_mode)]:
+        if mode is not None:
+            routine = DummyRoutineWithQueue(q, name=name)
+            comp.register_routine(getattr(routine, "as_" + mode)())
+    assert comp._choose_queue_kind(q) == queue_kind
+
+
+class CountingRoutine(DummyRoutineWithQueue):
+
+    def setup(self, *args, **kwargs):
+        self.count = 0
+
+    def main_logic(self, *args, **kwargs):
+        if self.count < 5:
+            self.queue.put(self.count)
+            self.count += 1
+        return True
+
+
+def test_queue_of_process_routine():
+    comp = DummyComponent()
+    comp.create_queue("queue", queue_size=5)
+    q = comp.get_queue("queue")
+    comp.register_routine(CountingRoutine(q, name="producer").as_process())
+    comp.stop_event.clear()
+    comp._start()
+    assert q.kind == "process"
+    assert [q.get(timeout=5) for _ in range(5)] == list(range(5))
+    comp.stop_event.set()
+    assert comp._stop_run() == 0
+    assert q.kind == "thread"
+
+
+def test_overflow_queue_of_process_routine():
+    comp = DummyComponent()
+    comp.create_queue("queue", queue_size=5, overflow="drop_oldest")
+    q = comp.get_queue("queue")
+    comp.register_routine(CountingRoutine(q, name="producer").as_process())
+    comp.stop_event.clear()
+    comp._start()
+    # only thread queues support overflow policies
+    assert q.kind == "thread"
+    comp.stop_event.set()
+    assert comp._stop_run() == 0
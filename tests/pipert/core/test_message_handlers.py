@@ -1,5 +1,8 @@
+import asyncio
+import threading
+import time
 import pytest
-from pipert.core.message_handlers import RedisHandler
+from pipert.core.message_handlers import RedisHandler, AsyncRedisHandler
 from urllib.parse import urlparse
 
 key = "Test"
@@ -53,3 +56,128 @@ def test_redis_read_most_recent_message_cannot_read_the_same_message(redis_handl
     redis_handler.send(key, "AAA")
     assert redis_handler.read_most_recent_msg(key).decode() == "AAA"
     assert redis_handler.read_most_recent_msg(key) is None
+
+
+def test_redis_send_many(redis_handler):
+    redis_handler.send_many(key, ["AAA", "BBB", "CCC"])
+    assert redis_handler.conn.xlen(key) == 3
+    assert redis_handler.receive(key).decode() == "CCC"
+
+
+def test_redis_send_to_keys(redis_handler):
+    other_key = key + ":other"
+    try:
+        redis_handler.send_to_keys([(key, "AAA"), (other_key, "BBB"), (key, "CCC")])
+        assert redis_handler.conn.xlen(key) == 2
+        assert redis_handler.receive(key).decode() == "CCC"
+        assert redis_handler.receive(other_key).decode() == "BBB"
+    finally:
+        redis_handler.conn.delete(other_key)
+
+
+def test_redis_read_batch(redis_handler):
+    redis_handler.send(key, "AAA")
+    assert [msg.decode() for msg in redis_handler.read_batch(key, 10)] == ["AAA"]
+    redis_handler.send_many(key, ["BBB", "CCC", "DDD"])
+    assert [msg.decode() for msg in redis_handler.read_batch(key, 2)] == ["BBB", "CCC"]
+    assert [msg.decode() for msg in redis_handler.read_batch(key, 2)] == ["DDD"]
+    assert redis_handler.read_batch(key, 2) == []
+
+
+def test_redis_read_batch_doesnt_block_on_zero(redis_handler):
+    redis_handler.send(key, "AAA")
+    redis_handler.read_batch(key, 10)
+    redis_handler.join_group(key, "detectors", "a")
+    start = time.time()
+    # BLOCK 0 would wait forever
+    assert redis_handler.read_batch(key, 2, block_ms=0) == []
+    assert redis_handler.read_group(key, "detectors", "a", block_ms=0) == []
+    assert time.time() - start < 0.1
+
+
+def test_redis_read_next_msg_blocking(redis_handler):
+    redis_handler.send(key, "AAA")
+    assert redis_handler.read_next_msg(key).decode() == "AAA"
+    start = time.time()
+    assert redis_handler.read_next_msg(key, block_ms=100) is None
+    assert time.time() - start >= 0.1
+
+    timer = threading.Timer(0.05, redis_handler.send, args=(key, "BBB"))
+    timer.start()
+    assert redis_handler.read_most_recent_msg(key, block_ms=1000).decode() == "BBB"
+    timer.join()
+
+
+def test_redis_read_keeps_position_per_stream(redis_handler):
+    other_key = key + ":other"
+    redis_handler.send(key, "AAA")
+    redis_handler.send(other_key, "BBB")
+    assert redis_handler.read_next_msg(key).decode() == "AAA"
+    assert redis_handler.read_next_msg(other_key).decode() == "BBB"
+    redis_handler.send(key, "CCC")
+    assert redis_handler.read_next_msg(key).decode() == "CCC"
+    assert redis_handler.read_next_msg(other_key) is None
+    redis_handler.conn.delete(other_key)
+
+
+def test_redis_consumer_group_splits_messages(redis_handler):
+    redis_handler.join_group(key, "detectors", "a")
+    redis_handler.join_group(key, "detectors", "b")
+    for msg in ("AAA", "BBB", "CCC"):
+        redis_handler.send(key, msg)
+
+    first = redis_handler.read_group(key, "detectors", "a", max_count=2)
+    second = redis_handler.read_group(key, "detectors", "b", max_count=2)
+    assert [msg.decode() for _, msg in first] == ["AAA", "BBB"]
+    assert [msg.decode() for _, msg in second] == ["CCC"]
+    assert redis_handler.read_group(key, "detectors", "a") == []
+
+
+def test_redis_consumer_group_claims_unacknowledged_messages(redis_handler):
+    redis_handler.join_group(key, "detectors", "a")
+    redis_handler.send(key, "AAA")
+    redis_handler.send(key, "BBB")
+    entries = redis_handler.read_group(key, "detectors", "a", max_count=2)
+    redis_handler.ack(key, "detectors", entries[0][0])
+
+    time.sleep(0.05)
+    claimed = redis_handler.claim_stale(key, "detectors", "b", min_idle_ms=10, max_count=10)
+    assert [msg.decode() for _, msg in claimed] == ["BBB"]
+    redis_handler.ack(key, "detectors", claimed[0][0])
+    assert redis_handler.claim_stale(key, "detectors", "b", min_idle_ms=0) == []
+
+
+def test_async_redis_handler(redis_handler):
+    async def send_and_read():
+        async_handler = AsyncRedisHandler(redis_handler.url)
+        await async_handler.connect()
+        try:
+            await async_handler.send(key, "A")
+            await async_handler.send_many(key, ["B", "C"])
+            assert await async_handler.read_most_recent_msg(key) == b"C"
+            assert await async_handler.read_next_msg(key) is None
+            await async_handler.send(key, "D")
+            assert await async_handler.read_next_msg(key, block_ms=10) == b"D"
+        finally:
+            await async_handler.close()
+
+    asyncio.run(send_and_read())
+
+
+def test_async_redis_read_next_msg_blocks_on_empty_stream(redis_handler):
+    async def read_empty_stream():
+        async_handler = AsyncRedisHandler(redis_handler.url)
+        await async_handler.connect()
+        try:
+            start = time.time()
+            assert await async_handler.read_next_msg(key, block_ms=200) is None
+            assert time.time() - start >= 0.2
+
+            timer = threading.Timer(0.05, redis_handler.send, args=(key, "A"))
+            timer.start()
+            assert await async_handler.read_next_msg(key, block_ms=1000) == b"A"
+            timer.join()
+        finally:
+            await async_handler.close()
+
+    asyncio.run(read_empty_stream())
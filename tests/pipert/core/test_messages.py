@@ -2,17 +2,22 @@ import logging
 
 import pytest
 
+import os
+import pickle
 import time
 import numpy as np
+import torch
 # import signal
 # import os
 from threading import Thread
 from torch.multiprocessing import Process
 from pipert.core.component import BaseComponent
 # from pipert.core.routine import Routine
-from pipert.core.multiprocessing_shared_memory import MpSharedMemoryGenerator
-from pipert.core.message import Message, FramePayload, message_encode, \
+from pipert.core.multiprocessing_shared_memory import MpSharedMemoryGenerator, \
+    MpSharedMemoryRing
+from pipert.core.message import Message, MessageHistory, MessageIdAllocator, FramePayload, message_encode, \
     message_decode
+from pipert.utils.structures import Instances, Boxes
 
 
 class DummyMessage(Message):
@@ -90,3 +95,189 @@ def test_message_encode_shared_memory():
     assert msg.source_address == decoded_msg.source_address
     assert msg.history == decoded_msg.history
     generator.cleanup()
+
+
+def test_message_encode_raw_frames():
+    ring = MpSharedMemoryRing("Dummy_ring")
+    img = np.random.randint(0, 255, (576, 720, 3), dtype=np.uint8)
+    msg = DummyMessage(img, "localhost")
+    encoded_msg = message_encode(msg, ring)
+    decoded_msg = message_decode(encoded_msg)
+    assert msg.id == decoded_msg.id
+    assert (decoded_msg.get_payload() == img).all()
+    ring.cleanup()
+
+
+def test_message_encode_binary_wire_format():
+    msg = create_msg()
+    logger = logging.getLogger('test')
+    logger.addHandler(logging.NullHandler())
+    msg.record_entry("test", logger)
+    encoded_msg = message_encode(msg, wire_format="binary")
+    decoded_msg = message_decode(encoded_msg)
+    assert msg.id == decoded_msg.id
+    assert msg.source_address == decoded_msg.source_address
+    assert msg.history == decoded_msg.history
+    assert decoded_msg.get_payload().shape == (576, 720, 3)
+
+
+def test_prediction_binary_wire_format():
+    instances = Instances((576, 720))
+    instances.set("pred_boxes", Boxes(torch.tensor([[1., 2., 3., 4.]])))
+    instances.set("scores", torch.tensor([0.5]))
+    msg = DummyMessage(instances, "localhost")
+    msg.skipped_frames = 2
+    encoded_msg = message_encode(msg, wire_format="binary")
+    decoded_msg = message_decode(encoded_msg, lazy=True)
+    assert decoded_msg.skipped_frames == 2
+    assert not decoded_msg.is_empty()
+    decoded_instances = decoded_msg.get_payload()
+    assert decoded_instances.image_size == (576, 720)
+    assert (decoded_instances.pred_boxes.tensor == instances.pred_boxes.tensor).all()
+    assert (decoded_instances.scores == instances.scores).all()
+
+
+def test_frame_payload_decoded_once():
+    msg = create_msg()
+    decoded_msg = message_decode(message_encode(msg), lazy=True)
+    assert decoded_msg.payload.frame is None
+    frame = decoded_msg.get_payload()
+    assert decoded_msg.get_payload() is frame
+
+
+def test_frame_payload_pass_through_is_not_encoded_again():
+    msg = create_msg()
+    decoded_msg = message_decode(message_encode(msg), lazy=True)
+    encoded_frame = decoded_msg.payload.encoded_data
+    decoded_msg.get_payload()
+    message_encode(decoded_msg)
+    assert decoded_msg.payload.encoded_data is encoded_frame
+
+    decoded_msg.update_payload(np.zeros((4, 4, 3), dtype=np.uint8))
+    assert decoded_msg.payload.dirty
+    redecoded_msg = message_decode(message_encode(decoded_msg))
+    assert redecoded_msg.get_payload().shape == (4, 4, 3)
+
+
+def test_frame_payload_pass_through_binary_wire_format():
+    msg = create_msg()
+    encoded_msg = message_encode(msg, wire_format="binary")
+    decoded_msg = message_decode(encoded_msg, lazy=True)
+    forwarded_msg = message_decode(message_encode(decoded_msg), lazy=True)
+    assert bytes(forwarded_msg.payload.encoded_data) == \
+        bytes(decoded_msg.payload.encoded_data)
+
+
+@pytest.mark.parametrize("codec", ["raw", "png", "jpeg:50", "webp:90", "turbojpeg"])
+def test_message_encode_frame_codecs(codec):
+    img = np.random.randint(0, 255, (48, 64, 3), dtype=np.uint8)
+    msg = DummyMessage(img, "localhost")
+    decoded_msg = message_decode(message_encode(msg, codec=codec))
+    assert decoded_msg.payload.codec == codec
+    decoded_img = decoded_msg.get_payload()
+    assert decoded_img.shape == img.shape
+    if codec in ("raw", "png"):
+        assert (decoded_img == img).all()
+
+
+def test_message_encode_changes_codec():
+    img = np.random.randint(0, 255, (48, 64, 3), dtype=np.uint8)
+    msg = DummyMessage(img, "localhost")
+    decoded_msg = message_decode(message_encode(msg, codec="raw"), lazy=True)
+    raw_size = len(decoded_msg.payload.encoded_data)
+    # the frame is kept in the codec it was received in unless asked otherwise
+    message_encode(decoded_msg)
+    assert len(decoded_msg.payload.encoded_data) == raw_size
+    message_encode(decoded_msg, codec="jpeg:50")
+    assert len(decoded_msg.payload.encoded_data) < raw_size
+    assert decoded_msg.payload.codec == "jpeg:50"
+
+
+def test_unknown_frame_codec():
+    with pytest.raises(ValueError):
+        message_encode(create_msg(), codec="gif")
+
+
+def test_message_history():
+    msg = create_msg()
+    logger = logging.getLogger('test')
+    logger.addHandler(logging.NullHandler())
+    msg.record_entry("first", logger)
+    msg.record_custom("first", "detection")
+    msg.record_exit("first", logger)
+    msg.record_entry("second", logger)
+    assert "first" in msg.history and "third" not in msg.history
+    assert list(msg.history) == ["first", "second"]
+    assert set(msg.history["first"]) == {"entry", "detection", "exit"}
+    assert msg.history["third"] == {}
+    assert msg.history["first"]["entry"] <= msg.history["first"]["detection"] \
+        <= msg.history["first"]["exit"]
+    assert msg.get_latency("second") is None
+
+    first_exit = msg.history["first"]["exit"]
+    msg.record_exit("first", logger)
+    assert msg.history["first"]["exit"] == first_exit
+
+
+def test_message_history_round_trip():
+    msg = create_msg()
+    msg.record_custom("first", "detection")
+    history_dict = msg.history.to_dict()
+    assert MessageHistory.from_dict(history_dict) == msg.history
+    assert pickle.loads(pickle.dumps(msg.history)) == history_dict
+
+
+def test_message_ids_are_unique_across_threads():
+    ids = []
+
+    def create_messages():
+        ids.extend(Message(None, "localhost").id for _ in range(1000))
+
+    threads = [Thread(target=create_messages) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == len(ids)
+    _, pid, _ = MessageIdAllocator.split(ids[0])
+    assert pid == os.getpid()
+
+
+def test_message_ids_of_configured_node(monkeypatch):
+    assert MessageIdAllocator.split(MessageIdAllocator(node_id=511).next_id()) == (511, os.getpid(), 0)
+    monkeypatch.setenv("PIPERT_NODE_ID", "7")
+    allocator = MessageIdAllocator()
+    allocator.next_id()
+    assert MessageIdAllocator.split(allocator.next_id()) == (7, os.getpid(), 1)
+    # the node id is kept in forked processes
+    allocator.reset()
+    assert MessageIdAllocator.split(allocator.next_id())[0] == 7
+    with pytest.raises(ValueError):
+        MessageIdAllocator(node_id=512)
+
+
+def test_latency_ignores_wall_clock_changes(monkeypatch):
+    msg = create_msg()
+    logger = logging.getLogger('test')
+    logger.addHandler(logging.NullHandler())
+    msg.record_entry("test", logger)
+    monkeypatch.setattr(time, "time", lambda: 0)
+    monkeypatch.setattr(time, "time_ns", lambda: 0)
+    msg.record_exit("test", logger)
+    assert 0 <= msg.get_latency("test") < 1
+
+
+def test_end_to_end_latency_across_hosts():
+    history = MessageHistory()
+    history.hosts = ["capture-host", "display-host"]
+    history.anchors.extend([1000 * 10 ** 9, 2000 * 10 ** 9])
+    history.stages = ["VideoCapture", "FlaskVideoDisplay"]
+    # entry to VideoCapture at wall clock 1005s, exit from the display
+    # at wall clock 1007s
+    history.record_keys.extend([0, 0, 0, 1, 1, 1])
+    history.times.extend([5 * 10 ** 9, -993 * 10 ** 9])
+    msg = create_msg()
+    msg.history = history
+    msg.reached_exit = True
+    assert msg.get_end_to_end_latency("FlaskVideoDisplay") == 2
+    assert history["VideoCapture"]["entry"] == 1005
@@ -0,0 +1,133 @@
+import time
+import numpy as np
+import pytest
+from torch.multiprocessing import Event
+from pipert.core.message import Message, PredictionPayload
+from pipert.core.motion_gate import MotionDetector, MotionGate, MotionFilter
+from pipert.core.processing_routine import ProcessingRoutine
+from pipert.core.utlis import NotifyingQueue
+from pipert.utils.structures import Instances
+
+
+class CountingDetection(ProcessingRoutine):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_event = Event()
+        self.processed = 0
+
+    def process(self, msg):
+        self.processed += 1
+        instances = Instances(msg.get_payload().shape[:2])
+        instances.set("frame_number", [self.processed])
+        return Message(instances, msg.source_address)
+
+
+def create_frame(square_x=None, seed=0):
+    # a static scene with sensor noise, optionally with a bright square
+    rng = np.random.default_rng(seed)
+    frame = np.full((240, 320, 3), 100, dtype=np.uint8)
+    frame += rng.integers(0, 4, frame.shape, dtype=np.uint8)
+    if square_x is not None:
+        frame[100:140, square_x:square_x + 40] = 250
+    return frame
+
+
+def run_routine(routine, msgs):
+    for msg in msgs:
+        routine.in_queue.put(msg)
+    routine.start()
+    time.sleep(0.5)
+    routine.stop_event.set()
+    routine.runner.join()
+    outputs = []
+    while not routine.out_queue.empty():
+        outputs.append(routine.out_queue.get())
+    return outputs
+
+
+@pytest.mark.parametrize("method", ["blocks", "mog2"])
+def test_motion_detector(method):
+    detector = MotionDetector(method)
+    # the first frame has nothing to be compared with
+    assert detector.has_motion(create_frame())
+    assert not any(detector.has_motion(create_frame(seed=seed)) for seed in range(1, 10))
+    assert detector.has_motion(create_frame(square_x=100))
+
+
+def test_motion_gate_reuses_results():
+    gate = MotionGate()
+    routine = CountingDetection(NotifyingQueue(), NotifyingQueue()).gate(gate).as_thread()
+    frames = [create_frame(seed=seed) for seed in range(5)] + \
+        [create_frame(square_x=100, seed=5), create_frame(square_x=100, seed=6)]
+    msgs = [Message(frame, "camera:0") for frame in frames]
+    outputs = run_routine(routine, msgs)
+    assert len(outputs) == 7
+    # only the first frame and the frames with the square are detected, the
+    # square isn't part of the background yet
+    assert routine.processed == 3
+    assert [output.get_payload().frame_number[0] for output in outputs] == [1, 1, 1, 1, 1, 2, 3]
+    assert [output.id for output in outputs[1:5]] == [msg.id for msg in msgs[1:5]]
+    assert gate.reused == 4
+
+
+def test_motion_gate_refresh():
+    gate = MotionGate(refresh_every=2)
+    routine = CountingDetection(NotifyingQueue(), NotifyingQueue()).gate(gate).as_thread()
+    msgs = [Message(create_frame(seed=seed), "camera:0") for seed in range(7)]
+    outputs = run_routine(routine, msgs)
+    assert len(outputs) == 7
+    assert routine.processed == 3
+
+
+def test_motion_filter():
+    routine = MotionFilter(NotifyingQueue(), NotifyingQueue()).as_thread()
+    routine.stop_event = Event()
+    frames = [create_frame(seed=seed) for seed in range(3)] + [create_frame(square_x=100, seed=3)]
+    msgs = [Message(frame, "camera:0") for frame in frames] + [Message(create_frame(), "camera:1")]
+    # a frame that already stands for a frame a sampling policy skipped
+    msgs[2].skipped_frames = 1
+    outputs = run_routine(routine, msgs)
+    assert outputs == [msgs[0], msgs[3], msgs[4]]
+    # the dropped frames are counted in the next frame of their source
+    assert [msg.skipped_frames for msg in outputs] == [0, 3, 0]
+
+
+class SlowDetection(ProcessingRoutine):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_event = Event()
+
+    def process(self, msg):
+        # slower than answering a frame with a previous result
+        time.sleep(0.05)
+        msg.payload = PredictionPayload(Instances(msg.get_payload().shape[:2]))
+        return msg
+
+
+def test_motion_gate_of_worker_pool_keeps_order():
+    gate = MotionGate()
+    routine = SlowDetection(NotifyingQueue(), NotifyingQueue()).gate(gate).as_worker_pool(2)
+    frames = [create_frame(seed=seed) for seed in range(3)] + [create_frame(square_x=100, seed=3)] + \
+        [create_frame(seed=seed) for seed in range(4, 7)]
+    msgs = [Message(frame, "camera:0") for frame in frames]
+    routine.start()
+    try:
+        # the first result has to be remembered before frames can reuse it
+        routine.in_queue.put(msgs[0])
+        outputs = [routine.out_queue.get(timeout=5)]
+        for msg in msgs[1:]:
+            routine.in_queue.put(msg)
+        outputs += [routine.out_queue.get(timeout=5) for _ in msgs[1:]]
+    finally:
+        routine.stop_event.set()
+        routine.runner.join()
+    assert [output.id for output in outputs] == [msg.id for msg in msgs]
+    assert gate.reused > 0
+    assert routine.state.count == len(msgs) - gate.reused
+
+
+def test_motion_filter_cant_run_as_worker_pool():
+    with pytest.raises(ValueError):
+        MotionFilter(NotifyingQueue(), NotifyingQueue()).as_worker_pool(2)
@@ -1,9 +1,11 @@
+from threading import Thread
 from unittest.mock import MagicMock
 import pytest
 from tests.pipert.core.utils.dummy_routine_with_queue import DummyRoutineWithQueue
 from tests.pipert.core.utils.dummy_routine import DummyRoutine
 from tests.pipert.core.utils.dummy_component import DummyComponent
 from pipert.core.pipeline_manager import PipelineManager
+from pipert.core.utlis import CoroutineRunner
 
 
 def return_routine_class_object_by_name(name):
@@ -267,6 +269,34 @@ def test_change_component_execution_mode_method_with_wrong_mode(pipeline_manager
     assert not response["Succeeded"], response["Message"]
 
 
+@pytest.mark.parametrize("execution_mode,runner_creator",
+                         [("thread", Thread), ("coroutine", CoroutineRunner)])
+def test_create_routine_with_execution_mode(pipeline_manager_with_component_and_queue,
+                                            execution_mode, runner_creator):
+    response = \
+        pipeline_manager_with_component_and_queue.add_routine_to_component(
+            component_name="comp",
+            routine_type_name="DummyRoutineWithQueue",
+            queue="queue1",
+            name="routine1",
+            execution_mode=execution_mode)
+    assert response["Succeeded"], response["Message"]
+    routine = pipeline_manager_with_component_and_queue.components["comp"]._routines["routine1"]
+    assert routine.runner_creator is runner_creator
+
+
+@pytest.mark.parametrize("execution_mode", ["nothing", "worker_pool"])
+def test_create_routine_with_wrong_execution_mode(pipeline_manager_with_component_and_queue, execution_mode):
+    response = \
+        pipeline_manager_with_component_and_queue.add_routine_to_component(
+            component_name="comp",
+            routine_type_name="DummyRoutineWithQueue",
+            queue="queue1",
+            name="routine1",
+            execution_mode=execution_mode)
+    assert not response["Succeeded"], response["Message"]
+
+
 def test_create_component_with_shared_memory(pipeline_manager):
     response = pipeline_manager.create_component(component_name="comp",
                                                  use_shared_memory=True)
@@ -287,4 +317,28 @@ def test_create_component_with_metrics_collector_prometheus(pipeline_manager):
                                                  metrics_collector="prometheus")
     assert response["Succeeded"], response["Message"]
     from pipert.contrib.metrics_collectors.prometheus_collector import PrometheusCollector
-    assert isinstance(pipeline_manager.components["comp"].metrics_collector, PrometheusCollector)
\ No newline at end of file
+    assert isinstance(pipeline_manager.components["comp"].metrics_collector, PrometheusCollector)
+
+
+def test_create_component_with_codec(pipeline_manager):
+    response = pipeline_manager.create_component(component_name="comp",
+                                                 codec="jpeg:80")
+    assert response["Succeeded"], response["Message"]
+    assert pipeline_manager.components["comp"].codec == "jpeg:80"
+
+
+def test_create_components_with_queue_kinds(pipeline_manager):
+    response = pipeline_manager.setup_components({
+        "components": {
+            "comp": {
+                "queues": ["queue1", {"name": "queue2", "size": 3, "kind": "process"}],
+                "routines": {}
+            }
+        }
+    })
+    assert response["Succeeded"], response["Message"]
+    assert pipeline_manager.components["comp"].get_queue("queue2")._maxsize == 3
+    response = pipeline_manager.create_queue_to_component(component_name="comp",
+                                                          queue_name="queue3",
+                                                          queue_kind="nothing")
+    assert not response["Succeeded"], response["Message"]
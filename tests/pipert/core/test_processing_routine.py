@@ -0,0 +1,61 @@
+import os
+import random
+import time
+from torch.multiprocessing import Event
+from pipert.core.processing_routine import ProcessingRoutine
+from pipert.core.utlis import NotifyingQueue
+
+
+class DummyProcessingRoutine(ProcessingRoutine):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_event = Event()
+
+    def process(self, item):
+        # items take different times, so they are done out of order
+        time.sleep(random.random() * 0.02)
+        return item, os.getpid()
+
+
+def run_routine(routine, items):
+    routine.start()
+    for item in items:
+        routine.in_queue.put(item)
+    outputs = [routine.out_queue.get(timeout=5) for _ in items]
+    routine.stop_event.set()
+    routine.runner.join()
+    assert not routine.runner.is_alive()
+    return outputs
+
+
+def test_processing_routine_as_thread():
+    routine = DummyProcessingRoutine(NotifyingQueue(), NotifyingQueue()).as_thread()
+    outputs = run_routine(routine, range(10))
+    assert [item for item, _ in outputs] == list(range(10))
+    assert {pid for _, pid in outputs} == {os.getpid()}
+
+
+def test_processing_routine_as_worker_pool():
+    routine = DummyProcessingRoutine(NotifyingQueue(), NotifyingQueue()).as_worker_pool(3)
+    outputs = run_routine(routine, range(50))
+    # the outputs are emitted in the order of the inputs
+    assert [item for item, _ in outputs] == list(range(50))
+    pids = {pid for _, pid in outputs}
+    assert os.getpid() not in pids
+    assert 1 < len(pids) <= 3
+    assert routine.state.count == 50
+
+
+def test_worker_pool_stops_when_a_worker_dies():
+    routine = DummyProcessingRoutine(NotifyingQueue(), NotifyingQueue()).as_worker_pool(2)
+    routine.start()
+    try:
+        # kill, as workers may have inherited a SIGTERM handler of an
+        # earlier test
+        routine.runner._processes[0].kill()
+        time.sleep(0.5)
+        assert not routine.runner.is_alive()
+    finally:
+        routine.stop_event.set()
+        routine.runner.join()
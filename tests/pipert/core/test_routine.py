@@ -1,8 +1,12 @@
+import asyncio
+import threading
 import pytest
 import time
+from queue import Queue, Empty
 from torch.multiprocessing import Event
 from pipert.core.routine import Routine, Events, State
 from pipert.core.errors import NoRunnerException
+from pipert.core.utlis import NotifyingQueue
 from tests.pipert.core.utils.dummy_routine import DummyRoutine
 
 
@@ -150,3 +154,99 @@ def test_pacer_slower_pace():
     slow_routine.runner.join()
     elapsed_time = time.time()
     assert round(elapsed_time - start_time, 1) == round(1 / 1, 1)
+
+
+class DummyConsumerRoutine(Routine):
+    @staticmethod
+    def get_constructor_parameters():
+        pass
+
+    def does_routine_use_queue(self, queue):
+        return queue in self.input_queues
+
+    def __init__(self, *queues, idle_timeout=None):
+        super().__init__()
+        self.stop_event = Event()
+        self.input_queues = list(queues)
+        self.idle_timeout = idle_timeout
+        self.items = []
+        self.calls = 0
+
+    def main_logic(self, *args, **kwargs):
+        self.calls += 1
+        for q in self.input_queues:
+            try:
+                self.items.append(q.get(block=False))
+            except Empty:
+                pass
+        return True
+
+    def setup(self, *args, **kwargs):
+        pass
+
+    def cleanup(self, *args, **kwargs):
+        pass
+
+
+@pytest.mark.parametrize("queue_class", [NotifyingQueue, Queue])
+def test_routine_waits_for_input(queue_class):
+    queues = [queue_class(), NotifyingQueue()] if queue_class is NotifyingQueue \
+        else [queue_class()]
+    r = DummyConsumerRoutine(*queues)
+    r.as_thread()
+    r.start()
+    time.sleep(0.3)
+    assert r.calls == 0
+    queues[-1].put(1)
+    time.sleep(0.1)
+    assert r.items == [1]
+    start_time = time.time()
+    r.stop_event.set()
+    r.wake()
+    r.runner.join()
+    assert time.time() - start_time < 0.5
+
+
+def test_routine_idle_timeout():
+    r = DummyConsumerRoutine(NotifyingQueue(), idle_timeout=0.05)
+    r.as_thread()
+    r.start()
+    time.sleep(0.3)
+    r.stop_event.set()
+    r.runner.join()
+    assert 2 <= r.calls <= 7
+
+
+class DummyAsyncConsumerRoutine(DummyConsumerRoutine):
+
+    async def main_logic(self, *args, **kwargs):
+        await asyncio.sleep(0)
+        return super().main_logic()
+
+    async def setup(self, *args, **kwargs):
+        self.state.setup = True
+
+
+def test_routine_as_coroutine():
+    routines = [DummyAsyncConsumerRoutine(NotifyingQueue()).as_coroutine()
+                for _ in range(10)]
+    threads_count = threading.active_count()
+    for r in routines:
+        r.start()
+    time.sleep(0.2)
+    # all the routines share a single event loop thread
+    assert threading.active_count() <= threads_count + 1
+    for i, r in enumerate(routines):
+        assert r.runner.is_alive()
+        assert r.state.setup
+        assert r.calls == 0
+        r.input_queues[0].put(i)
+    time.sleep(0.1)
+    for i, r in enumerate(routines):
+        assert r.items == [i]
+        start_time = time.time()
+        r.stop_event.set()
+        r.wake()
+        r.runner.join()
+        assert time.time() - start_time < 0.5
+        assert not r.runner.is_alive()
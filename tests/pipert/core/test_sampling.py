@@ -0,0 +1,86 @@
+import time
+import numpy as np
+import pytest
+from torch.multiprocessing import Event
+from pipert.core.message import Message
+from pipert.core.processing_routine import ProcessingRoutine
+from pipert.core.sampling import EveryNth, TargetFps, AdaptiveSampling, get_sampling_policy
+from pipert.core.utlis import NotifyingQueue
+
+
+class SlowProcessingRoutine(ProcessingRoutine):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_event = Event()
+
+    def process(self, item):
+        time.sleep(0.01)
+        return item
+
+
+def create_msgs(count, source_address="camera:0"):
+    return [Message(np.zeros((4, 4, 3), dtype=np.uint8), source_address) for _ in range(count)]
+
+
+def test_every_nth():
+    policy = EveryNth(3)
+    msgs = create_msgs(7) + create_msgs(4, "camera:1")
+    accepted = [msg for msg in msgs if policy.accept(msg)]
+    assert accepted == [msgs[0], msgs[3], msgs[6], msgs[7], msgs[10]]
+    assert [msg.skipped_frames for msg in accepted] == [0, 2, 2, 0, 2]
+    assert policy.accepted == 5 and policy.skipped == 6
+
+
+def test_target_fps():
+    policy = TargetFps(10)
+    msgs = create_msgs(30)
+    # 30 frames a second with some jitter
+    times = np.arange(30) / 30 + np.random.default_rng(0).uniform(-0.005, 0.005, 30)
+    accepted = [i for i, (msg, now) in enumerate(zip(msgs, times)) if policy.accept(msg, now)]
+    assert accepted == list(range(0, 30, 3))
+    assert all(msgs[i].skipped_frames == 2 for i in accepted[1:])
+
+
+def test_adaptive_sampling():
+    policy = AdaptiveSampling(max_load=0.5)
+    msgs = create_msgs(40)
+    times = np.arange(40) / 40
+    # nothing is skipped until the processing time is known
+    assert policy.accept(msgs[0], times[0])
+    policy.record_processing_time(0.05)
+    accepted = [i for i in range(1, 40) if policy.accept(msgs[i], times[i])]
+    # a frame every 0.1 seconds keeps the routine busy half of the time
+    assert len(accepted) == 10
+    assert set(np.diff(accepted[1:])) == {4}
+
+
+def test_get_sampling_policy():
+    assert get_sampling_policy("every:4").n == 4
+    assert get_sampling_policy("fps:2.5").fps == 2.5
+    assert get_sampling_policy("adaptive").max_load == 0.9
+    assert get_sampling_policy("adaptive:0.5").max_load == 0.5
+    with pytest.raises(ValueError):
+        get_sampling_policy("random")
+
+
+@pytest.mark.parametrize("policy", [EveryNth(2), AdaptiveSampling()])
+def test_sampled_processing_routine(policy):
+    routine = SlowProcessingRoutine(NotifyingQueue(), NotifyingQueue()).sample(policy).as_thread()
+    msgs = create_msgs(10)
+    for msg in msgs:
+        routine.in_queue.put(msg)
+    routine.start()
+    time.sleep(0.5)
+    routine.stop_event.set()
+    routine.runner.join()
+    outputs = []
+    while not routine.out_queue.empty():
+        outputs.append(routine.out_queue.get())
+    if isinstance(policy, EveryNth):
+        assert outputs == msgs[::2]
+    else:
+        # the frames arrived at once, so only the first one is processed
+        # before the processing time is known
+        assert outputs[:1] == msgs[:1]
+        assert 0.01 <= policy.processing_time < 0.1
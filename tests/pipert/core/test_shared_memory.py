@@ -1,4 +1,7 @@
+import numpy as np
+import pytest
 import pipert.core.multiprocessing_shared_memory as sm
+from pipert.core.message import Message
 
 
 class DummySharedMemoryGenerator(sm.MpSharedMemoryGenerator):
@@ -41,3 +44,119 @@ def test_write_and_read_from_memory():
     memory.buf[:] = b"AAA"
     assert bytes(memory.buf) == b"AAA"
     generator.cleanup()
+
+
+def test_ring_write_and_read_frame():
+    ring = sm.MpSharedMemoryRing("dummy_component", slot_count=2)
+    frame = np.arange(12, dtype=np.uint8).reshape(2, 2, 3)
+    reference = ring.write_frame(frame)
+    view = sm.get_ring_frame(reference)
+    assert (view == frame).all()
+    view[0, 0, 0] = 100
+    assert sm.get_ring_frame(reference)[0, 0, 0] == 100
+    del view
+    ring.cleanup()
+
+
+def test_ring_slot_reuse():
+    ring = sm.MpSharedMemoryRing("dummy_component", slot_count=2)
+    frame = np.zeros((4, 4), dtype=np.uint8)
+    first_reference = ring.write_frame(frame)
+    ring.write_frame(frame)
+    assert sm.is_ring_frame_current(first_reference)
+    ring.write_frame(frame)
+    assert not sm.is_ring_frame_current(first_reference)
+    assert sm.get_ring_frame(first_reference) is None
+    ring.cleanup()
+
+
+def test_ring_frame_too_big():
+    ring = sm.MpSharedMemoryRing("dummy_component", slot_count=2)
+    ring.write_frame(np.zeros((4, 4), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        ring.write_frame(np.zeros((8, 8), dtype=np.uint8))
+    ring.cleanup()
+
+
+def create_slab():
+    slab = sm.MpSharedMemorySlab("dummy_component", max_count=2,
+                                 size_classes={16: 2, 64: 1})
+    slab.setup()
+    return slab
+
+
+def test_slab_write_and_read_block():
+    slab = create_slab()
+    block = slab.get_next_shared_memory(size=3)
+    block.buf[:] = b"AAA"
+    memory = sm.get_shared_memory_object(block.name)
+    assert bytes(memory.buf) == b"AAA"
+    memory.close()
+    slab.cleanup()
+
+
+def test_slab_uses_smallest_fitting_class():
+    slab = create_slab()
+    small_block = slab.get_next_shared_memory(size=10)
+    big_block = slab.get_next_shared_memory(size=20)
+    assert len(small_block.buf) == 10 and len(big_block.buf) == 20
+    assert small_block.offset < big_block.offset
+    slab.cleanup()
+
+
+def test_slab_oversized_block():
+    slab = create_slab()
+    # bigger than the biggest size class, so it gets a memory of its own
+    memory = slab.get_next_shared_memory(size=100)
+    memory.buf[:] = b"A" * 100
+    reader = sm.get_shared_memory_object(memory.name)
+    assert bytes(reader.buf) == b"A" * 100
+    reader.close()
+    slab.cleanup()
+    assert sm.get_shared_memory_object(memory.name) is None
+
+
+def test_slab_falls_back_when_full():
+    slab = create_slab()
+    readers = [sm.get_shared_memory_object(slab.get_next_shared_memory(size=4).name) for _ in range(3)]
+    # every block is held by a reader
+    memory = slab.get_next_shared_memory(size=4)
+    assert not memory.name.startswith(sm.SLAB_PREFIX)
+    for reader in readers:
+        reader.close()
+    slab.cleanup()
+
+
+def test_default_slab_fits_big_frames():
+    slab = sm.MpSharedMemorySlab("dummy_component")
+    slab.setup()
+    # a raw 1080p frame, bigger than the default size classes
+    frame = np.random.default_rng(0).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    message = Message(frame, "camera:0")
+    message.payload.encode(slab, "raw")
+    message.payload.decode()
+    assert (message.get_payload() == frame).all()
+    slab.cleanup()
+
+
+def test_slab_block_reuse():
+    slab = create_slab()
+    first_name = slab.get_next_shared_memory(size=4).name
+    slab.get_next_shared_memory(size=4)
+    # releases the first block, which is free again
+    slab.get_next_shared_memory(size=4)
+    assert sm.get_shared_memory_object(first_name) is None
+    slab.cleanup()
+
+
+def test_slab_block_not_reused_while_read():
+    slab = create_slab()
+    first_block = slab.get_next_shared_memory(size=4)
+    first_block.buf[:] = b"AAAA"
+    reader = sm.get_shared_memory_object(first_block.name)
+    for _ in range(3):
+        block = slab.get_next_shared_memory(size=4)
+        block.buf[:] = b"BBBB"
+    assert bytes(reader.buf) == b"AAAA"
+    reader.close()
+    slab.cleanup()
@@ -0,0 +1,41 @@
+import time
+from pipert.core.utlis import NotifyingQueue
+
+
+def test_listeners_are_called_on_put():
+    calls = []
+    q = NotifyingQueue(maxsize=2)
+    # listeners run while the queue is locked, so qsize can not be used
+    q.add_listener(lambda: calls.append(len(q.queue)))
+    q.put(1)
+    q.put_nowait(2)
+    assert calls == [1, 2]
+    q.get()
+    assert calls == [1, 2]
+
+
+def test_remove_listener():
+    calls = []
+
+    def listener():
+        calls.append(1)
+
+    q = NotifyingQueue()
+    q.add_listener(listener)
+    q.remove_listener(listener)
+    q.remove_listener(listener)
+    q.put(1)
+    assert calls == []
+
+
+def test_get_many():
+    q = NotifyingQueue(maxsize=3)
+    for item in range(3):
+        q.put(item)
+    # a full queue can't grow to max_items, so its items are taken at once
+    assert q.get_many(5) == [0, 1, 2]
+    q.put(3)
+    start = time.time()
+    assert q.get_many(2, timeout=0.1) == [3]
+    assert time.time() - start >= 0.1
+    assert q.get_many(2, timeout=0) == []
@@ -1,4 +1,6 @@
-from pipert.core.utlis import QueueHandler
+import threading
+import torch.multiprocessing as mp
+from pipert.core.utlis import QueueHandler, RingQueue
 from queue import Queue
 import pytest
 import time
@@ -64,3 +66,48 @@ def test_deque_non_blocking_put(q_handler):
     assert q_handler.deque_non_blocking_put(1)
     assert not q_handler.deque_non_blocking_put(2)
     assert q_handler.get() == 2
+
+
+@pytest.mark.parametrize("queue_class", [Queue, mp.Queue])
+def test_get_batch(queue_class):
+    q_handler = QueueHandler(queue_class(maxsize=5))
+    assert q_handler.put_many(range(3)) == 3
+    time.sleep(0.05)
+    start = time.time()
+    assert q_handler.get_batch(5, 0.1) == [0, 1, 2]
+    assert time.time() - start >= 0.1
+    q_handler.put_many(range(5))
+    time.sleep(0.05)
+    start = time.time()
+    assert q_handler.get_batch(2, 1) == [0, 1]
+    assert q_handler.get_batch(5, 0) == [2, 3, 4]
+    assert time.time() - start < 0.1
+    assert q_handler.get_batch(5, 0) == []
+
+
+def test_get_batch_waits_for_items(q_handler):
+    q_handler.q = Queue(maxsize=5)
+    putter = threading.Timer(0.05, q_handler.put_many, args=([1, 2],))
+    putter.start()
+    assert q_handler.get_batch(2) == [1, 2]
+    putter.join()
+
+
+def test_put_many(q_handler):
+    start = time.time()
+    assert q_handler.put_many([1, 2], timeout=0.1) == 1
+    assert time.time() - start >= 0.1
+    assert q_handler.put_many([3], block=False) == 0
+
+
+@pytest.mark.parametrize("overflow,expected", [("latest_only", [2]), ("drop_oldest", [1, 2])])
+def test_get_batch_of_full_ring_queue(overflow, expected):
+    # the queue can't hold max_items items, so the batch is taken once it's
+    # full instead of waiting for items that can never be in it
+    q_handler = QueueHandler(RingQueue(maxsize=2, overflow=overflow))
+    q_handler.put_many(range(3))
+    batches = []
+    getter = threading.Thread(target=lambda: batches.append(q_handler.get_batch(4)), daemon=True)
+    getter.start()
+    getter.join(1)
+    assert batches == [expected]
@@ -0,0 +1,56 @@
+import threading
+import pytest
+from queue import Full
+from pipert.core.utlis import RingQueue, put_dropping_oldest
+
+
+@pytest.mark.parametrize("overflow,items", [
+    ("drop_oldest", [2, 3]),
+    ("drop_newest", [0, 1]),
+    ("latest_only", [3]),
+])
+def test_overflow_policies(overflow, items):
+    q = RingQueue(maxsize=2, overflow=overflow)
+    for i in range(4):
+        q.put(i, block=False)
+    assert [q.get(block=False) for _ in range(q.qsize())] == items
+    assert q.dropped == 4 - len(items)
+
+
+def test_block_overflow_policy():
+    q = RingQueue(maxsize=1, overflow="block")
+    q.put(0)
+    with pytest.raises(Full):
+        q.put(1, timeout=0.01)
+    assert q.dropped == 0
+
+
+def test_wrong_overflow_policy():
+    with pytest.raises(ValueError):
+        RingQueue(overflow="nothing")
+    with pytest.raises(ValueError):
+        RingQueue(maxsize=0, overflow="drop_oldest")
+
+
+def test_put_overwrite_with_a_concurrent_consumer():
+    q = RingQueue(maxsize=1, overflow="block")
+    consumed = []
+    stop = threading.Event()
+
+    def consume():
+        while not stop.is_set() or q.qsize():
+            try:
+                consumed.append(q.get(timeout=0.01))
+            except Exception:
+                pass
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    for i in range(10000):
+        # never raises, even if the consumer empties the queue meanwhile
+        put_dropping_oldest(q, i)
+    stop.set()
+    consumer.join()
+    assert len(consumed) + q.dropped == 10000
+    assert consumed == sorted(consumed)
+    assert q.unfinished_tasks == len(consumed)
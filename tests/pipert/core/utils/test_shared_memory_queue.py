@@ -0,0 +1,44 @@
+import pytest
+from queue import Empty, Full
+from torch.multiprocessing import Process
+from pipert.core.utlis import SharedMemoryQueue
+
+
+@pytest.fixture(scope="function")
+def shared_memory_queue():
+    q = SharedMemoryQueue(maxsize=3, slot_size=1024)
+    yield q
+    q.close()
+
+
+def test_put_and_get(shared_memory_queue):
+    for item in [1, "two", {"three": [3]}]:
+        shared_memory_queue.put(item)
+    assert shared_memory_queue.full()
+    with pytest.raises(Full):
+        shared_memory_queue.put(4, block=False)
+    assert shared_memory_queue.get() == 1
+    assert shared_memory_queue.get() == "two"
+    shared_memory_queue.put(4)
+    assert shared_memory_queue.get() == {"three": [3]}
+    assert shared_memory_queue.get() == 4
+    assert shared_memory_queue.empty()
+    with pytest.raises(Empty):
+        shared_memory_queue.get(timeout=0.01)
+
+
+def test_item_larger_than_slot(shared_memory_queue):
+    with pytest.raises(ValueError):
+        shared_memory_queue.put(b"0" * 2048)
+
+
+def produce(q, count):
+    for i in range(count):
+        q.put(i)
+
+
+def test_items_pass_between_processes(shared_memory_queue):
+    producer = Process(target=produce, args=(shared_memory_queue, 100))
+    producer.start()
+    assert [shared_memory_queue.get(timeout=5) for _ in range(100)] == list(range(100))
+    producer.join()
@@ -0,0 +1,95 @@
+import time
+import cv2
+import numpy as np
+import pytest
+from pipert.utils.frame_grabber import FrameGrabber
+
+FRAMES = 10
+FPS = 30
+
+
+@pytest.fixture
+def video_file(tmp_path):
+    # every frame is brighter than the one before it, so the order of the
+    # frames can be told from their pixels
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (64, 48))
+    for i in range(FRAMES):
+        writer.write(np.full((48, 64, 3), 20 * (i + 1), dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def read_all(grabber, delay=0.):
+    frames = []
+    while True:
+        grabbed = grabber.read(timeout=1)
+        if grabbed is None:
+            return frames
+        frame, pts = grabbed
+        frames.append((int(round(frame.mean() / 20)) - 1, pts, id(frame)))
+        time.sleep(delay)
+        assert grabber.release(frame)
+
+
+def test_frames_are_read_in_order(video_file):
+    grabber = FrameGrabber(video_file, pace=True).start()
+    try:
+        frames = read_all(grabber)
+    finally:
+        grabber.stop()
+    indices = [index for index, _, _ in frames]
+    assert indices == sorted(set(indices))
+    assert [pts for _, pts, _ in frames] == sorted(pts for _, pts, _ in frames)
+    assert len(frames) + grabber.skipped == FRAMES
+
+
+def test_end_of_stream(video_file):
+    grabber = FrameGrabber(video_file).start()
+    try:
+        frames = read_all(grabber)
+        assert grabber.ended
+        # the last frame is never skipped
+        assert frames[-1][0] == FRAMES - 1
+        assert grabber.read(timeout=0.1) is None
+    finally:
+        grabber.stop()
+
+
+def test_buffers_are_reused(video_file):
+    grabber = FrameGrabber(video_file, pool_size=2, pace=True).start()
+    try:
+        # a slow consumer makes the grabber skip frames
+        frames = read_all(grabber, delay=1 / FPS * 2)
+    finally:
+        grabber.stop()
+    assert len({buffer_id for _, _, buffer_id in frames}) <= 2
+    assert grabber.skipped > 0
+
+
+def test_release_ignores_foreign_and_released_frames(video_file):
+    grabber = FrameGrabber(video_file).start()
+    try:
+        frame, _ = grabber.read(timeout=1)
+        assert not grabber.release(frame.copy())
+        assert grabber.release(frame)
+        assert not grabber.release(frame)
+    finally:
+        grabber.stop()
+
+
+def test_stop(video_file):
+    grabber = FrameGrabber(video_file, pace=True).start()
+    frame, _ = grabber.read(timeout=1)
+    tick = time.monotonic()
+    grabber.stop()
+    # a paced grabber doesn't wait for the next frame's time to stop
+    assert time.monotonic() - tick < 1 / FPS * FRAMES / 2
+    assert grabber.stream is None
+    # the grabber can be started again, with a new pool of buffers
+    grabber.start()
+    try:
+        assert not grabber.release(frame)
+        assert grabber.read(timeout=1) is not None
+    finally:
+        grabber.stop()
@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+import pytest
+from pipert.utils.preprocessing import FramePreprocessor
+
+COLOR = (128, 128, 128)
+
+
+def create_frame(height, width, channels=3, seed=0):
+    shape = (height, width, channels) if channels else (height, width)
+    return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+
+
+def reference_letterbox(frame, size, stride=None):
+    # the letterbox of yolov3, one step at a time
+    width, height = size
+    ratio = min(width / frame.shape[1], height / frame.shape[0])
+    new_unpad = (int(round(frame.shape[1] * ratio)), int(round(frame.shape[0] * ratio)))
+    if stride:
+        dw, dh = np.mod(width - new_unpad[0], stride) / 2, np.mod(height - new_unpad[1], stride) / 2
+    else:
+        dw, dh = (width - new_unpad[0]) / 2, (height - new_unpad[1]) / 2
+    if frame.shape[1::-1] != new_unpad:
+        frame = cv2.resize(frame, new_unpad, interpolation=cv2.INTER_AREA)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=COLOR)
+
+
+@pytest.mark.parametrize("shape", [(480, 640), (37, 301), (300, 17), (416, 416), (3, 1000)])
+@pytest.mark.parametrize("stride", [None, 32])
+def test_letterbox(shape, stride):
+    frame = create_frame(*shape)
+    output = FramePreprocessor(416, stride=stride)(frame)
+    expected = reference_letterbox(frame, (416, 416), stride)[..., ::-1].transpose(2, 0, 1) / np.float32(255.)
+    assert output.dtype == np.float32
+    assert output.shape == expected.shape
+    np.testing.assert_allclose(output, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize("shape", [(480, 640), (37, 301), (300, 17), (1, 1000), (1000, 1)])
+def test_output_shape(shape):
+    preprocessor = FramePreprocessor((320, 192), stride=32)
+    assert preprocessor(create_frame(*shape)).shape == preprocessor.get_output_shape(shape + (3,))
+
+
+@pytest.mark.parametrize("chw", [True, False])
+def test_gray_output(chw):
+    frame = create_frame(90, 200)
+    output = FramePreprocessor((100, 60), gray=True, chw=chw)(frame)
+    gray = reference_letterbox(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (100, 60)) / np.float32(255.)
+    assert output.shape == ((1, 60, 100) if chw else (60, 100, 1))
+    np.testing.assert_allclose(output.reshape(gray.shape), gray, rtol=1e-6)
+
+
+def test_gray_input():
+    frame = create_frame(90, 200, channels=None)
+    output = FramePreprocessor((100, 60), gray=True)(frame)
+    np.testing.assert_allclose(output[0], reference_letterbox(frame, (100, 60)) / np.float32(255.), rtol=1e-6)
+
+
+@pytest.mark.parametrize("swap_rb", [True, False])
+def test_hwc_output(swap_rb):
+    frame = create_frame(37, 301)
+    output = FramePreprocessor(128, swap_rb=swap_rb, chw=False)(frame)
+    expected = reference_letterbox(frame, (128, 128)) / np.float32(255.)
+    if swap_rb:
+        expected = expected[..., ::-1]
+    assert output.shape == (128, 128, 3)
+    np.testing.assert_allclose(output, expected, rtol=1e-6)
+
+
+def test_unscaled_output():
+    frame = create_frame(300, 17)
+    output = FramePreprocessor((64, 48), letterbox=False, swap_rb=False, chw=False, pixel_scale=None,
+                               dtype=np.uint8)(frame)
+    # stretched to the size, without padding
+    np.testing.assert_array_equal(output, cv2.resize(frame, (64, 48), interpolation=cv2.INTER_AREA))
+
+
+def test_original_size():
+    frame = create_frame(37, 301)
+    output = FramePreprocessor(None, pixel_scale=None)(frame)
+    np.testing.assert_array_equal(output, frame[..., ::-1].transpose(2, 0, 1))
+
+
+def test_buffers_are_reused():
+    preprocessor = FramePreprocessor(64, stride=32)
+    first = preprocessor(create_frame(37, 301, seed=1))
+    second = preprocessor(create_frame(37, 301, seed=2))
+    # an output is only valid until the next frame of the same shape
+    assert second is first
+    expected = reference_letterbox(create_frame(37, 301, seed=2), (64, 64), 32)
+    np.testing.assert_allclose(second, expected[..., ::-1].transpose(2, 0, 1) / np.float32(255.), rtol=1e-6)
+    out = np.empty_like(first)
+    assert preprocessor(create_frame(37, 301, seed=3), out=out) is out
+    assert preprocessor(create_frame(300, 17)) is not first